@@ -0,0 +1,21 @@
+# Production ASGI server: gunicorn manages the worker processes, each running an
+# event loop with uvicorn. Run with `gunicorn -c gunicorn.conf.py jobapi.asgi:application`.
+import multiprocessing
+
+from decouple import config
+
+bind = config('WEB_BIND', default='0.0.0.0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+# One process per core: a process serves thousands of waiting connections on its event loop
+workers = config('WEB_CONCURRENCY', default=multiprocessing.cpu_count(), cast=int)
+# Pending connections the kernel queues while every worker is busy accepting
+backlog = config('WEB_BACKLOG', default=2048, cast=int)
+keepalive = config('WEB_KEEPALIVE', default=5, cast=int)
+# Long-polls and event streams are open for up to JOB_LONG_POLL_MAX_WAIT and
+# JOB_EVENTS_STREAM_TIMEOUT seconds, so the worker timeout is only the heartbeat
+timeout = 30
+graceful_timeout = config('WEB_GRACEFUL_TIMEOUT', default=30, cast=int)
+# Restart workers now and then so memory growth from a leak stays bounded
+max_requests = config('WEB_MAX_REQUESTS', default=10000, cast=int)
+max_requests_jitter = max_requests // 10
+accesslog = '-'
@@ -0,0 +1,9 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jobapi.settings')
+# Serve the async create, status and event views, see JOB_API_ASYNC_VIEWS
+os.environ.setdefault('JOB_API_ASYNC_VIEWS', 'True')
+
+application = get_asgi_application()
@@ -1,13 +1,20 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init, worker_init
+from decouple import config
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jobapi.settings')
 
 app = Celery('jobapi')
 
+# Same source as settings.REDIS_URL, read without loading Django settings at import time
+REDIS_URL = config('REDIS_URL', default='redis://redis:6379/0')
+
 app.conf.update(
-    broker_url='redis://redis:6379/0',
-    result_backend='redis://redis:6379/0',
+    broker_url=REDIS_URL,
+    result_backend=REDIS_URL,
+    broker_pool_limit=config('CELERY_BROKER_POOL_LIMIT', default=10, cast=int),
+    redis_max_connections=config('REDIS_MAX_CONNECTIONS', default=50, cast=int),
     accept_content=['json'],
     task_serializer='json',
     result_serializer='json',
@@ -17,8 +24,71 @@ app.conf.update(
     }
 )
 
+# With PIPELINE_EXECUTOR=chain every stage is its own task on its own queue, so the slowest
+# stage can be scaled on its own. Start one worker per queue, e.g.
+# `celery -A jobapi worker -Q pipeline.diagram`, and it runs with that stage's concurrency.
+PIPELINE_STAGE_QUEUES = {
+    'summary': {
+        'queue': 'pipeline.summary',
+        'concurrency': config('PIPELINE_SUMMARY_CONCURRENCY', default=4, cast=int),
+    },
+    'checklist': {
+        'queue': 'pipeline.checklist',
+        'concurrency': config('PIPELINE_CHECKLIST_CONCURRENCY', default=4, cast=int),
+    },
+    'diagram': {
+        'queue': 'pipeline.diagram',
+        'concurrency': config('PIPELINE_DIAGRAM_CONCURRENCY', default=8, cast=int),
+    },
+}
+
+app.conf.task_routes = {
+    f'jobs.tasks.run_{stage}_stage': {'queue': spec['queue']}
+    for stage, spec in PIPELINE_STAGE_QUEUES.items()
+}
+
+# Run with `celery -A jobapi beat`, see JOB_RETENTION_DAYS
+app.conf.beat_schedule = {
+    'archive-old-jobs': {
+        'task': 'jobs.tasks.archive_old_jobs',
+        'schedule': config('JOB_ARCHIVE_INTERVAL', default=3600, cast=float),
+    },
+    'recover-stale-jobs': {
+        'task': 'jobs.tasks.recover_stale_jobs',
+        'schedule': config('JOB_RECOVERY_INTERVAL', default=300, cast=float),
+    },
+}
+
 app.autodiscover_tasks()
 
+
+@celeryd_init.connect
+def configure_stage_worker(sender=None, conf=None, options=None, **kwargs):
+    """Give a worker consuming a single stage queue that stage's concurrency unless -c was passed"""
+    queues = options.get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    if len(queues) != 1 or options.get('concurrency'):
+        return
+    for spec in PIPELINE_STAGE_QUEUES.values():
+        if spec['queue'] == queues[0]:
+            conf.worker_concurrency = spec['concurrency']
+
+
+@worker_init.connect
+def configure_worker_connections(**kwargs):
+    """Reuse each worker process's database connection across tasks for DB_WORKER_CONN_MAX_AGE seconds.
+
+    Celery's Django fixup closes connections that are unusable or older than
+    CONN_MAX_AGE before and after every task, so with a non-zero age
+    consecutive tasks share one connection instead of reconnecting. Prefork
+    children inherit this setting and drop the parent's connection on start.
+    """
+    from django.conf import settings
+    from django.db import connections
+    for alias in connections:
+        connections.settings[alias]['CONN_MAX_AGE'] = settings.DB_WORKER_CONN_MAX_AGE
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'jobs.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,9 +66,21 @@ DATABASES = {
         'PASSWORD': config('POSTGRES_PASSWORD', default='postgres'),
         'HOST': config('POSTGRES_HOST', default='db'),
         'PORT': config('POSTGRES_PORT', default='5432'),
+        # Seconds a connection is reused across requests, 0 closes it after each request
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        # Check a reused connection before the first query of a request or task
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        # Server-side cursors do not survive PgBouncer transaction pooling
+        'DISABLE_SERVER_SIDE_CURSORS': config('DB_PGBOUNCER', default=False, cast=bool),
+        'OPTIONS': {
+            'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+        },
     }
 }
 
+# CONN_MAX_AGE of Celery worker processes, see jobapi/celery.py
+DB_WORKER_CONN_MAX_AGE = config('DB_WORKER_CONN_MAX_AGE', default=600, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -113,10 +126,139 @@ SPECTACULAR_SETTINGS = {
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = config('CORS_ALLOW_ALL_ORIGINS', default=False, cast=bool)
 
+# Redis: one connection pool per process (jobs/redis_client.py), shared by views, caches and
+# events. Celery reads the same REDIS_URL for its broker and result backend (jobapi/celery.py).
+REDIS_URL = config('REDIS_URL', default='redis://redis:6379/0')
+REDIS_MAX_CONNECTIONS = config('REDIS_MAX_CONNECTIONS', default=50, cast=int)
+REDIS_POOL_TIMEOUT = config('REDIS_POOL_TIMEOUT', default=5, cast=float)
+REDIS_CONNECT_TIMEOUT = config('REDIS_CONNECT_TIMEOUT', default=5, cast=float)
+# Seconds the dashboard reuses the broker ping and queue depths
+REDIS_HEALTH_CACHE_TTL = config('REDIS_HEALTH_CACHE_TTL', default=2, cast=float)
+
+# GPT stage result cache: 'redis', 'memory' or 'none'
+LLM_CACHE_BACKEND = config('LLM_CACHE_BACKEND', default='redis')
+LLM_CACHE_TTL = config('LLM_CACHE_TTL', default=60 * 60 * 24, cast=int)
+LLM_CACHE_MAX_ENTRIES = config('LLM_CACHE_MAX_ENTRIES', default=10000, cast=int)
+
+# LLM provider: 'openai', or 'stub' for an in-process fake used in load tests.
+# The stub waits a lognormal latency around LLM_STUB_LATENCY seconds, fails with a
+# rate-limit error at LLM_STUB_ERROR_RATE and returns about LLM_STUB_OUTPUT_CHARS characters.
+LLM_PROVIDER = config('LLM_PROVIDER', default='openai')
+LLM_STUB_LATENCY = config('LLM_STUB_LATENCY', default=1.0, cast=float)
+LLM_STUB_LATENCY_JITTER = config('LLM_STUB_LATENCY_JITTER', default=0.5, cast=float)
+LLM_STUB_ERROR_RATE = config('LLM_STUB_ERROR_RATE', default=0.0, cast=float)
+LLM_STUB_OUTPUT_CHARS = config('LLM_STUB_OUTPUT_CHARS', default=2000, cast=int)
+
+# Upstream limits shared by all workers through Redis, per model: token buckets for requests and
+# tokens per minute, and a concurrency limit that adapts between LLM_CONCURRENCY_MIN and _MAX,
+# halving on 429s or calls slower than LLM_CONCURRENCY_TARGET_LATENCY seconds.
+LLM_RATE_LIMIT_ENABLED = config('LLM_RATE_LIMIT_ENABLED', default=True, cast=bool)
+LLM_RATE_LIMIT_RPM = config('LLM_RATE_LIMIT_RPM', default=500, cast=int)
+LLM_RATE_LIMIT_TPM = config('LLM_RATE_LIMIT_TPM', default=150000, cast=int)
+LLM_RATE_LIMIT_MAX_WAIT = config('LLM_RATE_LIMIT_MAX_WAIT', default=120, cast=int)
+LLM_RATE_LIMIT_MAX_RETRIES = config('LLM_RATE_LIMIT_MAX_RETRIES', default=5, cast=int)
+LLM_CONCURRENCY_MIN = config('LLM_CONCURRENCY_MIN', default=1, cast=int)
+LLM_CONCURRENCY_MAX = config('LLM_CONCURRENCY_MAX', default=64, cast=int)
+LLM_CONCURRENCY_INITIAL = config('LLM_CONCURRENCY_INITIAL', default=8, cast=int)
+LLM_CONCURRENCY_TARGET_LATENCY = config('LLM_CONCURRENCY_TARGET_LATENCY', default=60, cast=float)
+LLM_CONCURRENCY_COOLDOWN = config('LLM_CONCURRENCY_COOLDOWN', default=5, cast=float)
+LLM_CONCURRENCY_LEASE_TTL = config('LLM_CONCURRENCY_LEASE_TTL', default=600, cast=int)
+
+# Stream GPT stage output and flush partial text to Redis for GET /jobs/{event_id}/output/.
+# Deltas are appended at most every LLM_STREAM_FLUSH_INTERVAL seconds and kept for LLM_STREAM_TTL seconds.
+LLM_STREAM_OUTPUT = config('LLM_STREAM_OUTPUT', default=False, cast=bool)
+LLM_STREAM_FLUSH_INTERVAL = config('LLM_STREAM_FLUSH_INTERVAL', default=0.2, cast=float)
+LLM_STREAM_TTL = config('LLM_STREAM_TTL', default=60 * 60, cast=int)
+
+# Pipeline executor: 'sync' runs one job per worker process, 'async' runs
+# many jobs per process on an asyncio event loop (start the worker with --pool=solo),
+# 'chain' runs each stage as its own task on a per-stage queue (see jobapi/celery.py)
+PIPELINE_EXECUTOR = config('PIPELINE_EXECUTOR', default='sync')
+ASYNC_PIPELINE_CONCURRENCY = config('ASYNC_PIPELINE_CONCURRENCY', default=100, cast=int)
+ASYNC_PIPELINE_MAX_JOBS = config('ASYNC_PIPELINE_MAX_JOBS', default=500, cast=int)
+ASYNC_PIPELINE_JOB_TIMEOUT = config('ASYNC_PIPELINE_JOB_TIMEOUT', default=600, cast=int)
+
+# Celery retries of a failed pipeline stage: exponential backoff from PIPELINE_RETRY_BACKOFF
+# seconds with full jitter, capped at PIPELINE_RETRY_BACKOFF_MAX. Retries resume at the failed stage.
+PIPELINE_MAX_RETRIES = config('PIPELINE_MAX_RETRIES', default=3, cast=int)
+PIPELINE_RETRY_BACKOFF = config('PIPELINE_RETRY_BACKOFF', default=5, cast=int)
+PIPELINE_RETRY_BACKOFF_MAX = config('PIPELINE_RETRY_BACKOFF_MAX', default=300, cast=int)
+
+# A processing job not written to for JOB_CLAIM_LEASE seconds is presumed abandoned by a dead
+# worker: another task may claim it, and the recover_stale_jobs beat task republishes it every
+# JOB_RECOVERY_INTERVAL seconds. Keep the lease above the longest stage, ASYNC_PIPELINE_JOB_TIMEOUT
+# and PIPELINE_RETRY_BACKOFF_MAX, or live jobs are run twice.
+JOB_CLAIM_LEASE = config('JOB_CLAIM_LEASE', default=900, cast=int)
+JOB_RECOVERY_BATCH_SIZE = config('JOB_RECOVERY_BATCH_SIZE', default=500, cast=int)
+
+# Job dispatch: 'fifo' publishes one pipeline task per job in arrival order, 'fair' keeps
+# waiting jobs in Redis priority lanes and hands them to workers by weighted fair scheduling,
+# round robin across tenants within a lane (see jobs/lanes.py)
+JOB_SCHEDULER = config('JOB_SCHEDULER', default='fifo')
+JOB_LANE_WEIGHTS = config('JOB_LANE_WEIGHTS', default='interactive=8,normal=3,bulk=1')
+
+# Deduplication of POST /jobs/: an Idempotency-Key is remembered in Redis for JOB_IDEMPOTENCY_TTL
+# seconds (the unique column stays authoritative). With JOB_DEDUP_INPUTS, a submission whose
+# inputs match an unfinished job within JOB_DEDUP_WINDOW seconds returns that job.
+JOB_IDEMPOTENCY_TTL = config('JOB_IDEMPOTENCY_TTL', default=24 * 60 * 60, cast=int)
+JOB_DEDUP_INPUTS = config('JOB_DEDUP_INPUTS', default=False, cast=bool)
+JOB_DEDUP_WINDOW = config('JOB_DEDUP_WINDOW', default=600, cast=int)
+JOB_DEDUP_FAST_PATH = config('JOB_DEDUP_FAST_PATH', default=True, cast=bool)
+
+# Prometheus metrics served at /metrics, summed across processes in Redis. Each process
+# buffers its observations and writes them at most every METRICS_FLUSH_INTERVAL seconds.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=float)
+
+# Archiving (jobs/archive.py): finished jobs older than JOB_RETENTION_DAYS (0 disables it) are moved
+# to the monthly-partitioned jobs_archive table, JOB_ARCHIVE_BATCH_SIZE rows per transaction and
+# at most JOB_ARCHIVE_MAX_BATCHES batches per run. Archive months older than
+# JOB_ARCHIVE_RETENTION_MONTHS are dropped (0 keeps them).
+JOB_RETENTION_DAYS = config('JOB_RETENTION_DAYS', default=30, cast=int)
+JOB_ARCHIVE_BATCH_SIZE = config('JOB_ARCHIVE_BATCH_SIZE', default=1000, cast=int)
+JOB_ARCHIVE_MAX_BATCHES = config('JOB_ARCHIVE_MAX_BATCHES', default=100, cast=int)
+JOB_ARCHIVE_RETENTION_MONTHS = config('JOB_ARCHIVE_RETENTION_MONTHS', default=0, cast=int)
+
+# Storage of the summary, checklist and diagram columns (jobs/compression.py): 'zlib' or 'none'.
+# LLM_OUTPUT_DICTIONARY is the id of a preset dictionary trained with `manage.py
+# train_output_dictionary`; rows of jobs_output_dictionaries must never be deleted.
+LLM_OUTPUT_COMPRESSION = config('LLM_OUTPUT_COMPRESSION', default='zlib')
+LLM_OUTPUT_COMPRESSION_LEVEL = config('LLM_OUTPUT_COMPRESSION_LEVEL', default=6, cast=int)
+LLM_OUTPUT_DICTIONARY = config('LLM_OUTPUT_DICTIONARY', default=0, cast=int)
+
+# Maximum number of jobs accepted by POST /jobs/batch/
+JOB_BATCH_MAX_SIZE = config('JOB_BATCH_MAX_SIZE', default=1000, cast=int)
+
+# Seconds the /queue/ dashboard reuses a Celery worker inspection before refreshing it
+QUEUE_STATUS_WORKER_TTL = config('QUEUE_STATUS_WORKER_TTL', default=10, cast=int)
+
+# Job status notifications: longest ?wait= long-poll, SSE stream lifetime and keepalive interval (seconds)
+JOB_LONG_POLL_MAX_WAIT = config('JOB_LONG_POLL_MAX_WAIT', default=30, cast=int)
+# Most event_ids accepted by one POST /jobs/status/ lookup
+JOB_STATUS_LOOKUP_MAX_IDS = config('JOB_STATUS_LOOKUP_MAX_IDS', default=1000, cast=int)
+# GET /jobs/ page size, callers may ask for up to the maximum with ?limit=
+JOB_LIST_PAGE_SIZE = config('JOB_LIST_PAGE_SIZE', default=100, cast=int)
+JOB_LIST_MAX_PAGE_SIZE = config('JOB_LIST_MAX_PAGE_SIZE', default=1000, cast=int)
+# Serve create, status and event requests from async views, set by jobapi/asgi.py
+JOB_API_ASYNC_VIEWS = config('JOB_API_ASYNC_VIEWS', default=False, cast=bool)
+JOB_EVENTS_STREAM_TIMEOUT = config('JOB_EVENTS_STREAM_TIMEOUT', default=300, cast=int)
+JOB_EVENTS_KEEPALIVE = config('JOB_EVENTS_KEEPALIVE', default=15, cast=int)
+
+# Read-through cache of GET /jobs/{event_id}/ responses: 'redis', 'memory' or 'none'.
+# Finished jobs stay cached until evicted, unfinished ones for JOB_STATUS_CACHE_TTL seconds.
+JOB_STATUS_CACHE_BACKEND = config('JOB_STATUS_CACHE_BACKEND', default='redis')
+JOB_STATUS_CACHE_TTL = config('JOB_STATUS_CACHE_TTL', default=2, cast=int)
+JOB_STATUS_CACHE_MAX_ENTRIES = config('JOB_STATUS_CACHE_MAX_ENTRIES', default=100000, cast=int)
+
 # Test-specific settings
 if 'test' in sys.argv:
     CELERY_ALWAYS_EAGER = True
     CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
     TESTING = True
+    LLM_CACHE_BACKEND = 'none'
+    JOB_STATUS_CACHE_BACKEND = 'none'
+    LLM_RATE_LIMIT_ENABLED = False
+    JOB_DEDUP_FAST_PATH = False
+    METRICS_ENABLED = False
 
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
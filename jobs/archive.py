@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Job, JobArchive, JobStatus
+
+PARTITION_PREFIX = 'jobs_archive_'
+FINISHED_STATUSES = [JobStatus.COMPLETED.value, JobStatus.FAILED.value]
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month.year:04d}_{month.month:02d}'
+
+
+def ensure_partitions(months):
+    """Create the monthly archive partitions for the given month starts if they are missing"""
+    with connection.cursor() as cursor:
+        for month in sorted(months):
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF jobs_archive '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [month, next_month(month)],
+            )
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to batch_size finished jobs created before cutoff to the archive.
+
+    Rows are locked with SKIP LOCKED and inserted and deleted in one
+    transaction, so each batch holds its locks briefly and a job is never in
+    both tables or in neither. Returns the number of jobs moved.
+    """
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status__in=FINISHED_STATUSES, created_at__lt=cutoff)
+            .order_by('created_at')[:batch_size]
+        )
+        if not jobs:
+            return 0
+        ensure_partitions({month_start(job.created_at) for job in jobs})
+        JobArchive.objects.bulk_create([JobArchive.from_job(job) for job in jobs])
+        Job.objects.filter(event_id__in=[job.event_id for job in jobs]).delete()
+    return len(jobs)
+
+
+def archive_jobs(older_than_days=None, batch_size=None, max_batches=None):
+    """Archive finished jobs older than the retention period, batch by batch.
+
+    Stops after max_batches so one run has a bounded cost, the next run
+    continues where it stopped. Returns the number of jobs moved.
+    """
+    older_than_days = settings.JOB_RETENTION_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.JOB_ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.JOB_ARCHIVE_MAX_BATCHES
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+
+    archived = 0
+    for _ in range(max_batches):
+        moved = archive_batch(cutoff, batch_size)
+        archived += moved
+        if moved < batch_size:
+            break
+    return archived
+
+
+def archive_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'jobs_archive' ORDER BY child.relname"
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def drop_expired_partitions(retention_months=None):
+    """Drop archive partitions of months older than retention_months, 0 keeps them all.
+
+    Dropping a whole month is a metadata change, with no row deletes or vacuum.
+    Returns the names of the dropped partitions.
+    """
+    retention_months = settings.JOB_ARCHIVE_RETENTION_MONTHS if retention_months is None else retention_months
+    if not retention_months:
+        return []
+    oldest_kept = month_start(timezone.now())
+    for _ in range(retention_months):
+        oldest_kept = (oldest_kept - timedelta(days=1)).replace(day=1)
+
+    dropped = []
+    for name in archive_partitions():
+        if name < partition_name(oldest_kept):
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {name}')
+            dropped.append(name)
+    return dropped
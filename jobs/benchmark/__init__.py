@@ -0,0 +1,4 @@
+from .runner import OPERATIONS, PipelineBenchmark, parse_mix
+from .stats import LatencyRecorder, percentile
+
+__all__ = ['OPERATIONS', 'LatencyRecorder', 'PipelineBenchmark', 'parse_mix', 'percentile']
@@ -0,0 +1,321 @@
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from ..models import Job, JobStatus
+from ..tasks import process_guideline_ingest
+from .stats import LatencyRecorder
+
+OPERATIONS = ('create', 'batch', 'status')
+
+
+def parse_mix(value):
+    """Parse a request mix such as 'create=1,status=4' into operation weights"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation in request mix: {name}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("Request mix needs at least one positive weight")
+    return mix
+
+
+def mean(values):
+    return round(sum(values) / len(values), 3) if values else 0.0
+
+
+def reconnect():
+    """Apply the connection cleanup Django runs between requests, return the ms spent connecting.
+
+    A connection inside a transaction, as under the test runner, is left alone.
+    """
+    if not connection.in_atomic_block:
+        connection.close_if_unusable_or_obsolete()
+    start = time.perf_counter()
+    connection.ensure_connection()
+    return (time.perf_counter() - start) * 1000
+
+
+@contextmanager
+def timed_queries():
+    """Collect the duration in ms of every query run on this thread's connection in the block"""
+    durations = []
+
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            durations.append((time.perf_counter() - start) * 1000)
+
+    with connection.execute_wrapper(wrapper):
+        yield durations
+
+
+class PipelineBenchmark:
+    """Drive a request mix through the API, then measure how fast the created jobs are processed.
+
+    Requests go through Django's test client, so they exercise routing,
+    middleware, views and the database without an HTTP server, and each one
+    counts its own queries. In 'eager' mode the benchmark runs
+    process_guideline_ingest itself on ``workers`` threads and job latency is
+    the processing time. In 'broker' mode the API enqueues tasks as usual, the
+    benchmark waits for running Celery workers to finish them, and job latency
+    is updated_at - created_at, queue wait included.
+
+    Each request and each eager job first applies Django's end-of-request
+    connection cleanup, so DB time (connecting plus queries) reflects
+    CONN_MAX_AGE: 0 reconnects every time, a positive age reuses the thread's
+    connection. ``conn_max_age`` overrides the configured age for the run.
+
+    Jobs are written to the configured database, so point it at a scratch one.
+    """
+
+    def __init__(self, requests=200, concurrency=8, mix=None, mode='eager', workers=4,
+                 batch_size=10, seed_jobs=None, timeout=300, keep_jobs=False, conn_max_age=None):
+        if mode not in ('eager', 'broker'):
+            raise ValueError(f"Unknown benchmark mode: {mode}")
+        if seed_jobs == 0 and 'status' in (mix or {'status': 1}):
+            raise ValueError("Status requests need at least one seed job")
+        self.requests = requests
+        self.concurrency = concurrency
+        self.mix = mix or {'create': 1, 'status': 4}
+        self.mode = mode
+        self.workers = workers
+        self.batch_size = batch_size
+        self.seed_jobs = concurrency if seed_jobs is None else seed_jobs
+        self.timeout = timeout
+        self.keep_jobs = keep_jobs
+        self.conn_max_age = conn_max_age
+        self.latency = {name: LatencyRecorder() for name in self.mix}
+        self.queries = {name: [] for name in self.mix}
+        self.db_ms = {name: [] for name in self.mix}
+        self.connect_ms = {name: [] for name in self.mix}
+        self.errors = {name: 0 for name in self.mix}
+        self._created = []
+        self._readable = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._rng = random.Random()
+
+    def run(self):
+        """Run both phases and return the report as a dict"""
+        # In eager mode the views must not publish tasks, the benchmark processes the jobs itself
+        with override_settings(TESTING=False, CELERY_ALWAYS_EAGER=self.mode == 'eager'), self._connection_age():
+            # Captured while the run's settings, CONN_MAX_AGE included, are in effect
+            config = self.config()
+            self._seed()
+            try:
+                started = time.monotonic()
+                self._map(self._request, self._plan(), self.concurrency)
+                api_elapsed = time.monotonic() - started
+                if self.mode == 'eager':
+                    pipeline = self._run_eager()
+                else:
+                    pipeline = self._wait_for_workers(started)
+            finally:
+                if not self.keep_jobs:
+                    Job.objects.filter(event_id__in=self._created + self._readable).delete()
+
+        return {
+            'config': config,
+            'api': {
+                'elapsed_s': round(api_elapsed, 3),
+                'requests_per_sec': round(self.requests / api_elapsed, 2) if api_elapsed else 0.0,
+                'operations': {name: self._operation_report(name) for name in self.mix},
+            },
+            'pipeline': pipeline,
+        }
+
+    def config(self):
+        return {
+            'requests': self.requests,
+            'concurrency': self.concurrency,
+            'mix': self.mix,
+            'mode': self.mode,
+            'workers': self.workers if self.mode == 'eager' else None,
+            'batch_size': self.batch_size,
+            'llm_provider': settings.LLM_PROVIDER,
+            'llm_stub_latency': settings.LLM_STUB_LATENCY,
+            'llm_stub_error_rate': settings.LLM_STUB_ERROR_RATE,
+            'llm_stub_output_chars': settings.LLM_STUB_OUTPUT_CHARS,
+            'llm_cache_backend': settings.LLM_CACHE_BACKEND,
+            'job_status_cache_backend': settings.JOB_STATUS_CACHE_BACKEND,
+            'db_conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'db_conn_health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+        }
+
+    @contextmanager
+    def _connection_age(self):
+        if self.conn_max_age is None:
+            yield
+            return
+        # Every thread's connection wrapper shares this settings dict
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        connection.settings_dict['CONN_MAX_AGE'] = self.conn_max_age
+        if not connection.in_atomic_block:
+            connection.close()
+        try:
+            yield
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+
+    def _seed(self):
+        # Finished jobs so status reads have something to hit before the first create returns
+        jobs = Job.objects.bulk_create([
+            Job(status=JobStatus.COMPLETED.value, summary='Seed summary', checklist='Seed checklist', diagram='Seed diagram')
+            for _ in range(self.seed_jobs)
+        ])
+        self._readable.extend(job.event_id for job in jobs)
+
+    def _plan(self):
+        names = list(self.mix)
+        return self._rng.choices(names, weights=[self.mix[name] for name in names], k=self.requests)
+
+    def _map(self, func, items, threads):
+        """Call func for every item on ``threads`` threads, each keeping its own DB connection"""
+        if threads <= 1:
+            for item in items:
+                func(item)
+            return
+
+        pending = queue.SimpleQueue()
+        for item in items:
+            pending.put(item)
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        item = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    func(item)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(threads) as pool:
+            for future in [pool.submit(worker) for _ in range(threads)]:
+                future.result()
+
+    @property
+    def client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = Client(HTTP_HOST='localhost')
+        return self._local.client
+
+    def _request(self, name):
+        with CaptureQueriesContext(connection) as queries, timed_queries() as query_ms:
+            start = time.perf_counter()
+            connect_ms = reconnect()
+            response = getattr(self, f'_{name}')()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.latency[name].add(elapsed_ms)
+            self.queries[name].append(len(queries))
+            self.connect_ms[name].append(connect_ms)
+            self.db_ms[name].append(connect_ms + sum(query_ms))
+            if response.status_code >= 400:
+                self.errors[name] += 1
+
+    def _create(self):
+        response = self.client.post(reverse('create_job'))
+        if response.status_code == 201:
+            self._record(response.json()['event_id'])
+        return response
+
+    def _batch(self):
+        response = self.client.post(
+            reverse('create_jobs_batch'), {'jobs': [{}] * self.batch_size}, content_type='application/json',
+        )
+        if response.status_code == 201:
+            for event_id in response.json()['event_ids']:
+                self._record(event_id)
+        return response
+
+    def _status(self):
+        with self._lock:
+            event_id = self._rng.choice(self._readable)
+        return self.client.get(reverse('get_job_status', kwargs={'event_id': event_id}))
+
+    def _record(self, event_id):
+        with self._lock:
+            self._created.append(event_id)
+            self._readable.append(event_id)
+
+    def _operation_report(self, name):
+        queries = self.queries[name]
+        return {
+            'errors': self.errors[name],
+            'latency_ms': self.latency[name].summary(),
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+                'max': max(queries, default=0),
+            },
+            'db_ms': {
+                'mean': mean(self.db_ms[name]),
+                'connect_mean': mean(self.connect_ms[name]),
+            },
+        }
+
+    def _run_eager(self):
+        latency = LatencyRecorder()
+        db_ms = []
+        connect_ms = []
+
+        def process(event_id):
+            with timed_queries() as query_ms:
+                start = time.perf_counter()
+                connected_ms = reconnect()
+                process_guideline_ingest(str(event_id))
+                latency.add((time.perf_counter() - start) * 1000)
+            with self._lock:
+                connect_ms.append(connected_ms)
+                db_ms.append(connected_ms + sum(query_ms))
+
+        started = time.monotonic()
+        self._map(process, list(self._created), self.workers)
+        report = self._pipeline_report(time.monotonic() - started, latency)
+        report['db_ms_per_job'] = {'mean': mean(db_ms), 'connect_mean': mean(connect_ms)}
+        return report
+
+    def _wait_for_workers(self, started):
+        jobs = Job.objects.filter(event_id__in=self._created)
+        deadline = started + self.timeout
+        while time.monotonic() < deadline:
+            counts = jobs.status_counts()
+            if counts[JobStatus.COMPLETED.value] + counts[JobStatus.FAILED.value] == len(self._created):
+                break
+            time.sleep(0.5)
+        elapsed = time.monotonic() - started
+
+        latency = LatencyRecorder()
+        finished = jobs.filter(status__in=[JobStatus.COMPLETED.value, JobStatus.FAILED.value])
+        for created_at, updated_at in finished.values_list('created_at', 'updated_at'):
+            latency.add((updated_at - created_at).total_seconds() * 1000)
+        return self._pipeline_report(elapsed, latency)
+
+    def _pipeline_report(self, elapsed, latency):
+        counts = Job.objects.filter(event_id__in=self._created).status_counts()
+        finished = counts[JobStatus.COMPLETED.value] + counts[JobStatus.FAILED.value]
+        return {
+            'jobs': len(self._created),
+            'completed': counts[JobStatus.COMPLETED.value],
+            'failed': counts[JobStatus.FAILED.value],
+            'unfinished': len(self._created) - finished,
+            'elapsed_s': round(elapsed, 3),
+            'jobs_per_sec': round(finished / elapsed, 2) if elapsed else 0.0,
+            'job_latency_ms': latency.summary(),
+        }
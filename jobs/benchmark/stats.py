@@ -0,0 +1,43 @@
+import math
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last one catches everything slower
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, math.inf)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class LatencyRecorder:
+    """Collect latencies in milliseconds and summarize them as percentiles and a histogram"""
+
+    def __init__(self):
+        self.values = []
+
+    def add(self, milliseconds):
+        self.values.append(milliseconds)
+
+    def __len__(self):
+        return len(self.values)
+
+    def summary(self):
+        values = sorted(self.values)
+        counts = [0] * len(BUCKETS_MS)
+        for value in values:
+            counts[next(i for i, bound in enumerate(BUCKETS_MS) if value <= bound)] += 1
+        return {
+            'count': len(values),
+            'mean': round(sum(values) / len(values), 3) if values else 0.0,
+            'p50': round(percentile(values, 0.50), 3),
+            'p90': round(percentile(values, 0.90), 3),
+            'p99': round(percentile(values, 0.99), 3),
+            'max': round(values[-1], 3) if values else 0.0,
+            'histogram': [
+                {'le_ms': 'inf' if bound == math.inf else bound, 'count': count}
+                for bound, count in zip(BUCKETS_MS, counts) if count
+            ],
+        }
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .redis_client import get_redis
+
+
+def make_cache_key(*parts):
+    """Build a content-addressed key from the given parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class BaseCache:
+    """Minimal cache interface shared by all backends"""
+
+    backend = 'base'
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        """Values of the given keys in order, None for misses"""
+        return [self.get(key) for key in keys]
+
+    def set_many(self, values, ttl=None):
+        for key, value in values.items():
+            self.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def _ttl(self, ttl):
+        return self.ttl if ttl is None else ttl
+
+    @staticmethod
+    def _stats(hits, misses, size):
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'size': size,
+        }
+
+
+class NullCache(BaseCache):
+    """Cache that never stores anything"""
+
+    backend = 'none'
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return dict(self._stats(0, 0, 0), backend=self.backend)
+
+
+class LocalLRUCache(BaseCache):
+    """In-process LRU cache with per-entry TTL and a size bound"""
+
+    backend = 'memory'
+
+    def __init__(self, ttl=None, max_entries=1000):
+        super().__init__(ttl=ttl, max_entries=max_entries)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        ttl = self._ttl(ttl)
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            if self.max_entries:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats(self.hits, self.misses, len(self._data)), backend=self.backend)
+
+
+class RedisCache(BaseCache):
+    """Redis-backed cache shared by every process.
+
+    Entries are JSON encoded and expire with SET EX. A sorted set indexes keys
+    by last access so the cache can be trimmed back to max_entries, and hit and
+    miss counters live in a hash so they aggregate across workers. Redis errors
+    are treated as misses so the cache can never fail a job.
+    """
+
+    backend = 'redis'
+
+    # Read, count and touch the LRU index in a single round trip
+    GET_SCRIPT = """
+        local value = redis.call('GET', KEYS[1])
+        if value then
+            redis.call('HINCRBY', KEYS[3], 'hits', 1)
+            redis.call('ZADD', KEYS[2], 'XX', ARGV[1], ARGV[2])
+        else
+            redis.call('HINCRBY', KEYS[3], 'misses', 1)
+        end
+        return value
+    """
+
+    # GET_SCRIPT for many keys: KEYS are the index, the stats and then the entries
+    GET_MANY_SCRIPT = """
+        local values = redis.call('MGET', unpack(KEYS, 3))
+        local hits = 0
+        for i = 1, #values do
+            if values[i] then
+                hits = hits + 1
+                redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[i + 1])
+            end
+        end
+        redis.call('HINCRBY', KEYS[2], 'hits', hits)
+        redis.call('HINCRBY', KEYS[2], 'misses', #values - hits)
+        return values
+    """
+
+    def __init__(self, prefix, ttl=None, max_entries=None, client=None):
+        super().__init__(ttl=ttl, max_entries=max_entries)
+        self.prefix = prefix
+        self._client = client
+        self._get_script = None
+        self._get_many_script = None
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def _key(self, key):
+        return f'{self.prefix}:{key}'
+
+    @property
+    def _index_key(self):
+        return f'{self.prefix}:index'
+
+    @property
+    def _stats_key(self):
+        return f'{self.prefix}:stats'
+
+    def get(self, key):
+        try:
+            if self._get_script is None:
+                self._get_script = self.client.register_script(self.GET_SCRIPT)
+            raw = self._get_script(
+                keys=[self._key(key), self._index_key, self._stats_key],
+                args=[time.time(), key],
+                client=self.client,
+            )
+        except redis.RedisError:
+            return None
+        return None if raw is None else json.loads(raw)
+
+    def get_many(self, keys):
+        try:
+            if self._get_many_script is None:
+                self._get_many_script = self.client.register_script(self.GET_MANY_SCRIPT)
+            raw = self._get_many_script(
+                keys=[self._index_key, self._stats_key, *(self._key(key) for key in keys)],
+                args=[time.time(), *keys],
+                client=self.client,
+            )
+        except redis.RedisError:
+            return [None] * len(keys)
+        return [None if value is None else json.loads(value) for value in raw]
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl=ttl)
+
+    def set_many(self, values, ttl=None):
+        if not values:
+            return
+        ttl = self._ttl(ttl)
+        now = time.time()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.set(self._key(key), json.dumps(value), ex=ttl or None)
+            pipe.zadd(self._index_key, {key: now for key in values})
+            pipe.zcard(self._index_key)
+            size = pipe.execute()[-1]
+            if self.max_entries and size > self.max_entries:
+                self._evict(size - self.max_entries)
+        except redis.RedisError:
+            pass
+
+    def _evict(self, count):
+        evicted = [member for member, _ in self.client.zpopmin(self._index_key, count)]
+        if evicted:
+            self.client.delete(*[self._key(member.decode()) for member in evicted])
+
+    def delete(self, key):
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(self._key(key))
+            pipe.zrem(self._index_key, key)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def clear(self):
+        try:
+            members = self.client.zrange(self._index_key, 0, -1)
+            keys = [self._key(member.decode()) for member in members]
+            self.client.delete(self._index_key, self._stats_key, *keys)
+        except redis.RedisError:
+            pass
+
+    def stats(self):
+        try:
+            counters = self.client.hgetall(self._stats_key)
+            size = self.client.zcard(self._index_key)
+        except redis.RedisError:
+            counters, size = {}, 0
+        hits = int(counters.get(b'hits', 0))
+        misses = int(counters.get(b'misses', 0))
+        return dict(self._stats(hits, misses, size), backend=self.backend)
+
+
+def build_cache(backend, prefix, ttl=None, max_entries=None):
+    """Build a cache for the configured backend name"""
+    if backend == 'redis':
+        return RedisCache(prefix, ttl=ttl, max_entries=max_entries)
+    if backend == 'memory':
+        return LocalLRUCache(ttl=ttl, max_entries=max_entries)
+    if backend == 'none':
+        return NullCache(ttl=ttl, max_entries=max_entries)
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+_stage_cache = None
+
+
+def get_stage_cache():
+    """Return the cache for GPT stage outputs"""
+    global _stage_cache
+    if _stage_cache is None:
+        _stage_cache = build_cache(
+            settings.LLM_CACHE_BACKEND,
+            prefix='llm:stage',
+            ttl=settings.LLM_CACHE_TTL,
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        )
+    return _stage_cache
+
+
+_status_cache = None
+
+
+def get_status_cache():
+    """Return the cache of serialized job status responses, keyed by event_id"""
+    global _status_cache
+    if _status_cache is None:
+        _status_cache = build_cache(
+            settings.JOB_STATUS_CACHE_BACKEND,
+            prefix='jobs:status',
+            ttl=settings.JOB_STATUS_CACHE_TTL,
+            max_entries=settings.JOB_STATUS_CACHE_MAX_ENTRIES,
+        )
+    return _status_cache
+
+
+@receiver(setting_changed)
+def reset_caches(setting, **kwargs):
+    global _stage_cache, _status_cache
+    if setting.startswith('LLM_CACHE_'):
+        _stage_cache = None
+    if setting.startswith('JOB_STATUS_CACHE_'):
+        _status_cache = None
@@ -0,0 +1,155 @@
+import functools
+import zlib
+from collections import Counter
+
+from django.conf import settings
+from django.core import checks
+from django.db import DatabaseError, models
+
+# Stored values start with MARKER and a codec byte. A value whose first byte is
+# anything else is UTF-8 text written before the columns were compressed:
+# Postgres text cannot contain NUL, so no legacy value starts with MARKER.
+MARKER = b'\x00'
+RAW = b'\x00'
+ZLIB = b'\x01'
+ZLIB_DICT = b'\x02'
+
+# Shorter texts are stored raw, deflate cannot win back its overhead on them
+MIN_COMPRESS_SIZE = 64
+# A zlib preset dictionary is only useful up to the 32 KiB deflate window
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+
+class MissingDictionary(LookupError):
+    """Raised when a value or LLM_OUTPUT_DICTIONARY references a dictionary that does not exist"""
+
+
+@functools.lru_cache(maxsize=None)
+def load_dictionary(dictionary_id):
+    """Bytes of a trained dictionary. Dictionaries are immutable once rows reference them."""
+    from .models import OutputDictionary
+
+    try:
+        return bytes(OutputDictionary.objects.values_list('data', flat=True).get(id=dictionary_id))
+    except OutputDictionary.DoesNotExist:
+        raise MissingDictionary(f"Output compression dictionary {dictionary_id} does not exist") from None
+
+
+@checks.register(checks.Tags.database)
+def check_output_dictionary(app_configs, databases=None, **kwargs):
+    """Fail `migrate` and `check --database` when LLM_OUTPUT_DICTIONARY names a missing dictionary"""
+    if not settings.LLM_OUTPUT_DICTIONARY or not databases:
+        return []
+    try:
+        load_dictionary(settings.LLM_OUTPUT_DICTIONARY)
+    except MissingDictionary as e:
+        return [checks.Error(str(e), hint="Train one with `manage.py train_output_dictionary`.", id='jobs.E001')]
+    except DatabaseError:
+        # The dictionaries table is not migrated yet
+        pass
+    return []
+
+
+def compress_text(text, dictionary_id=None):
+    """Encode text for a CompressedTextField, with the configured dictionary unless one is given"""
+    data = text.encode('utf-8')
+    if settings.LLM_OUTPUT_COMPRESSION == 'none' or len(data) < MIN_COMPRESS_SIZE:
+        return MARKER + RAW + data
+    dictionary_id = settings.LLM_OUTPUT_DICTIONARY if dictionary_id is None else dictionary_id
+    level = settings.LLM_OUTPUT_COMPRESSION_LEVEL
+    if dictionary_id:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=load_dictionary(dictionary_id))
+        header = MARKER + ZLIB_DICT + dictionary_id.to_bytes(2, 'big')
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        header = MARKER + ZLIB
+    return header + compressor.compress(data) + compressor.flush()
+
+
+def decompress_text(value):
+    """Decode a stored value, whichever codec and dictionary it was written with"""
+    value = bytes(value)
+    if value[:1] != MARKER:
+        return value.decode('utf-8')
+    codec = value[1:2]
+    if codec == RAW:
+        return value[2:].decode('utf-8')
+    if codec == ZLIB:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return (decompressor.decompress(value[2:]) + decompressor.flush()).decode('utf-8')
+    if codec == ZLIB_DICT:
+        dictionary = load_dictionary(int.from_bytes(value[2:4], 'big'))
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=dictionary)
+        return (decompressor.decompress(value[4:]) + decompressor.flush()).decode('utf-8')
+    raise ValueError(f"Unknown compression codec {codec!r}")
+
+
+def dictionary_candidates(text):
+    """Whole lines and four-word phrases of an output"""
+    words = text.split()
+    phrases = {' '.join(words[start:start + 4]) + ' ' for start in range(len(words) - 3)}
+    return phrases | {line + '\n' for line in text.splitlines() if line.strip()}
+
+
+def train_dictionary(samples, size=MAX_DICTIONARY_SIZE):
+    """Build a zlib preset dictionary from sample outputs.
+
+    Lines and phrases are scored by how many samples contain them times
+    their length, and the best ones that recur are packed until the
+    dictionary is full, skipping any already contained in it. Deflate
+    reaches the end of the dictionary with the shortest distances, so the
+    highest scoring ones go last.
+    """
+    counts = Counter()
+    for text in samples:
+        counts.update(dictionary_candidates(text))
+
+    chosen = []
+    packed = b''
+    for segment, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        encoded = segment.encode('utf-8')
+        if count < 2 or len(packed) + len(encoded) > size or encoded in packed:
+            continue
+        chosen.append(encoded)
+        packed += encoded
+    return b''.join(reversed(chosen))
+
+
+class CompressedTextField(models.BinaryField):
+    """Text column stored as deflate-compressed bytes and read back as str.
+
+    Values are compressed with a preset dictionary trained on past outputs
+    when LLM_OUTPUT_DICTIONARY is set. The codec and dictionary are recorded
+    in each value, so changing either never breaks reading older rows.
+    """
+
+    description = "Compressed text"
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if kwargs.get('editable') is True:
+            del kwargs['editable']
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return decompress_text(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return decompress_text(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if isinstance(value, str):
+            return compress_text(value)
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
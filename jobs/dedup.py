@@ -0,0 +1,187 @@
+import uuid
+
+import redis
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .cache import make_cache_key
+from .models import Job, JobStatus
+from .redis_client import get_redis
+
+IDEMPOTENCY_PREFIX = 'jobs:idempotency:'
+INFLIGHT_PREFIX = 'jobs:inflight:'
+
+# Replace an in-flight claim only while it still names ARGV[1], an empty ARGV[2] deletes it
+SWAP_CLAIM_SCRIPT = """
+    if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    if ARGV[2] == '' then
+        redis.call('DEL', KEYS[1])
+    else
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    end
+    return 1
+"""
+
+
+def idempotency_key(tenant, key):
+    """Stored form of an Idempotency-Key header, scoped to the tenant that sent it"""
+    return make_cache_key('idempotency', tenant, key)
+
+
+def input_hash(data):
+    """Digest of a job's inputs, equal for submissions with identical inputs"""
+    return make_cache_key('inputs', *(f'{name}={data[name]}' for name in sorted(data)))
+
+
+def job_inputs(serializer):
+    """The serializer's writable fields with model defaults filled in, so omitted and default values match"""
+    job = Job(**serializer.validated_data)
+    return {name: getattr(job, name) for name, field in serializer.fields.items() if not field.read_only}
+
+
+def fast_path():
+    """Redis client for the dedup fast path, or None when it is disabled"""
+    return get_redis() if settings.JOB_DEDUP_FAST_PATH else None
+
+
+def find_by_idempotency_key(key):
+    """Event_id of the job created with an idempotency key, from Redis before the database"""
+    client = fast_path()
+    if client is not None:
+        try:
+            event_id = client.get(IDEMPOTENCY_PREFIX + key)
+        except redis.RedisError:
+            event_id = None
+        if event_id is not None:
+            return event_id.decode()
+
+    event_id = Job.objects.filter(idempotency_key=key).values_list('event_id', flat=True).first()
+    if event_id is not None:
+        remember_idempotency_key(key, event_id)
+        return str(event_id)
+    return None
+
+
+def remember_idempotency_key(key, event_id):
+    client = fast_path()
+    if client is None:
+        return
+    try:
+        client.set(IDEMPOTENCY_PREFIX + key, str(event_id), ex=settings.JOB_IDEMPOTENCY_TTL)
+    except redis.RedisError:
+        pass
+
+
+def claim_inputs(digest, event_id):
+    """Register event_id as the in-flight job for these inputs.
+
+    Returns the event_id of an unfinished job that already has the same
+    inputs, or None once the claim is made. In Redis the claim is a SET NX,
+    so of two concurrent submissions only one goes on to create a job; a
+    claim held by a job that has since finished is taken over with a
+    compare-and-set, so only one of them takes it over. Without Redis the
+    database is asked for an active job with the same input_hash.
+    """
+    client = fast_path()
+    if client is not None:
+        key = INFLIGHT_PREFIX + digest
+        try:
+            for _ in range(3):
+                if client.set(key, str(event_id), nx=True, ex=settings.JOB_DEDUP_WINDOW):
+                    return None
+                existing = client.get(key)
+                if existing is None:
+                    # Expired between the two calls, try to claim it again
+                    continue
+                existing = existing.decode()
+                # A claimed job that is not in the database yet is still being created, so it counts as in flight
+                if not is_finished(existing):
+                    return existing
+                if swap_claim(client, digest, existing, event_id):
+                    return None
+                # Another submission took the claim over first, look at its job
+        except redis.RedisError:
+            pass
+
+    active = Job.objects.filter(
+        input_hash=digest,
+        status__in=[JobStatus.PENDING.value, JobStatus.PROCESSING.value],
+    ).values_list('event_id', flat=True).first()
+    return None if active is None else str(active)
+
+
+def swap_claim(client, digest, expected, event_id=None):
+    """Point the claim at event_id, or drop it without one, if it still names expected"""
+    script = client.register_script(SWAP_CLAIM_SCRIPT)
+    return bool(script(
+        keys=[INFLIGHT_PREFIX + digest],
+        args=[str(expected), '' if event_id is None else str(event_id), settings.JOB_DEDUP_WINDOW],
+    ))
+
+
+def release_claim(digest, event_id, replacement=None):
+    """Hand a claim for a job that was never created over to replacement, or drop it"""
+    client = fast_path()
+    if client is None:
+        return
+    try:
+        swap_claim(client, digest, event_id, replacement)
+    except redis.RedisError:
+        pass
+
+
+def is_finished(event_id):
+    return Job.objects.filter(
+        event_id=event_id,
+        status__in=[JobStatus.COMPLETED.value, JobStatus.FAILED.value],
+    ).exists()
+
+
+def save_unless_duplicate(serializer, key=None):
+    """Create the serializer's job unless the submission repeats an earlier one.
+
+    A submission is a repeat when its Idempotency-Key was used before by the
+    same tenant or, with JOB_DEDUP_INPUTS, when a job with identical inputs
+    has not finished yet. Returns ``(event_id, job)``, where job is None for
+    a repeat so the caller knows not to enqueue anything.
+    """
+    data = serializer.validated_data
+    fields = {}
+    if key:
+        fields['idempotency_key'] = idempotency_key(data.get('tenant', ''), key)
+        existing = find_by_idempotency_key(fields['idempotency_key'])
+        if existing is not None:
+            return existing, None
+    if settings.JOB_DEDUP_INPUTS:
+        fields['event_id'] = uuid.uuid4()
+        fields['input_hash'] = input_hash(job_inputs(serializer))
+        existing = claim_inputs(fields['input_hash'], fields['event_id'])
+        if existing is not None:
+            return existing, None
+
+    try:
+        with transaction.atomic():
+            job = serializer.save(**fields)
+    except IntegrityError:
+        # A concurrent request with the same Idempotency-Key created the job first
+        if 'idempotency_key' not in fields:
+            release_input_claim(fields)
+            raise
+        winner = find_by_idempotency_key(fields['idempotency_key'])
+        release_input_claim(fields, winner)
+        return winner, None
+    except Exception:
+        release_input_claim(fields)
+        raise
+
+    if key:
+        remember_idempotency_key(fields['idempotency_key'], job.event_id)
+    return job.event_id, job
+
+
+def release_input_claim(fields, replacement=None):
+    """Stop identical submissions from being answered with a job that was never created"""
+    if 'input_hash' in fields:
+        release_claim(fields['input_hash'], fields['event_id'], replacement)
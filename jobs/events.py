@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
+import redis
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'jobs:events:'
+
+
+def job_channel(event_id):
+    return f'{CHANNEL_PREFIX}{event_id}'
+
+
+def publish_job_event(event_id, status):
+    """Notify subscribers that a job changed status, never failing the caller"""
+    message = json.dumps({'event_id': str(event_id), 'status': status})
+    try:
+        get_redis().publish(job_channel(event_id), message)
+    except redis.RedisError:
+        pass
+
+
+class JobEventListener:
+    """Fan out job status notifications to waiting requests in this process.
+
+    One background thread holds a single pattern subscription for every job
+    channel, so thousands of waiting clients share one Redis connection.
+    """
+
+    def __init__(self):
+        self._waiters = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def subscribe(self, event_id, timeout=1.0, waiter=None):
+        """Register a waiter for a job and return the queue its messages arrive on"""
+        if waiter is None:
+            waiter = queue.Queue()
+        with self._lock:
+            self._waiters[str(event_id)].add(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='job-event-listener', daemon=True)
+                self._thread.start()
+        self._ready.wait(timeout)
+        return waiter
+
+    def unsubscribe(self, event_id, waiter):
+        with self._lock:
+            waiters = self._waiters.get(str(event_id))
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[str(event_id)]
+
+    def dispatch(self, message):
+        event_id = message['event_id']
+        with self._lock:
+            waiters = list(self._waiters.get(event_id, ()))
+        for waiter in waiters:
+            waiter.put(message)
+
+    def handle(self, message):
+        """Dispatch one pub/sub message, a malformed one is logged and dropped"""
+        if message['type'] != 'pmessage':
+            return
+        try:
+            self.dispatch(json.loads(message['data']))
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Dropped malformed job event on %s", message.get('channel'), exc_info=True)
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                    pubsub.psubscribe(f'{CHANNEL_PREFIX}*')
+                    self._ready.set()
+                    for message in pubsub.listen():
+                        self.handle(message)
+                except redis.RedisError:
+                    self._ready.clear()
+                    time.sleep(1)
+        except Exception:
+            logger.exception("Job event listener stopped")
+            raise
+        finally:
+            # Let the next subscribe() start a fresh thread instead of waiting on a dead one
+            with self._lock:
+                self._ready.clear()
+                self._thread = None
+
+
+class AsyncWaiter:
+    """Waiter for a coroutine: messages put by the listener thread are handed to its event loop.
+
+    A waiting ASGI request costs a queue and a suspended coroutine instead of
+    a blocked thread.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def put(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+        except RuntimeError:
+            # The loop closed before the waiter unsubscribed, nobody is left to read it
+            pass
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+listener = JobEventListener()
+
+
+@contextmanager
+def job_event_subscription(event_id):
+    """Subscribe to a job's status changes for the duration of the block"""
+    waiter = listener.subscribe(event_id)
+    try:
+        yield waiter
+    finally:
+        listener.unsubscribe(event_id, waiter)
+
+
+def wait_for_job_event(waiter, timeout):
+    """Block until the next status message arrives, returns None on timeout"""
+    try:
+        return waiter.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+@asynccontextmanager
+async def ajob_event_subscription(event_id):
+    """Async counterpart of job_event_subscription"""
+    waiter = AsyncWaiter()
+    # subscribe() may wait for the listener to connect, keep that off the event loop
+    await asyncio.to_thread(listener.subscribe, event_id, waiter=waiter)
+    try:
+        yield waiter
+    finally:
+        listener.unsubscribe(event_id, waiter)
+
+
+async def await_job_event(waiter, timeout):
+    """Async counterpart of wait_for_job_event"""
+    try:
+        return await waiter.get(timeout)
+    except asyncio.TimeoutError:
+        return None
@@ -0,0 +1,301 @@
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from celery.worker.control import control_command
+from django.conf import settings
+from django.db import close_old_connections
+
+from .cache import get_stage_cache, make_cache_key
+from .llm import build_llm_client
+from .metrics import instrument_stage, record_usage
+from .models import Job, JobStatus
+from .ratelimit import alimited_call, estimate_tokens
+from .prompts import (
+    CHECKLIST_INSTRUCTIONS,
+    DIAGRAM_INSTRUCTIONS,
+    GPT_MODEL,
+    SUMMARY_INPUT,
+    SUMMARY_INSTRUCTIONS,
+    checklist_input,
+    clean_mermaid_diagram,
+    diagram_input,
+)
+from .streaming import STAGES, stage_output
+
+
+async def acreate_response_text(client, model, instructions, input, output=None):
+    """Async counterpart of tasks.create_response_text sharing the same stage cache"""
+    cache = get_stage_cache()
+    key = make_cache_key(model, instructions, input)
+    output_text = await asyncio.to_thread(cache.get, key)
+    if output_text is None:
+        output_text = await alimited_call(
+            model, estimate_tokens(instructions, input),
+            lambda: afetch_response_text(client, output, model=model, instructions=instructions, input=input),
+        )
+        await asyncio.to_thread(cache.set, key, output_text)
+    elif output is not None:
+        await asyncio.to_thread(output.replace, output_text)
+    return output_text
+
+
+async def afetch_response_text(client, output, **params):
+    """Async counterpart of tasks.fetch_response_text"""
+    if output is None:
+        response = await client.responses.create(**params)
+        record_usage(params['model'], getattr(response, 'usage', None))
+        return response.output_text
+    return await astream_response_text(client, output, **params)
+
+
+async def astream_response_text(client, output, **params):
+    """Async counterpart of tasks.stream_response_text, flushing off the event loop"""
+    output.reset()
+    async for event in await client.responses.create(stream=True, **params):
+        if event.type == 'response.output_text.delta':
+            if output.write(event.delta):
+                await asyncio.to_thread(output.flush)
+        elif event.type == 'response.completed':
+            record_usage(params['model'], getattr(event.response, 'usage', None))
+        elif event.type == 'response.failed':
+            raise RuntimeError(event.response.error.message)
+        elif event.type == 'error':
+            raise RuntimeError(event.message)
+    await asyncio.to_thread(output.flush)
+    return output.text
+
+
+@instrument_stage('summary')
+async def agenerate_guideline_summary(client, output=None):
+    """Generate a summary of guidelines using GPT-4o"""
+    try:
+        return await acreate_response_text(
+            client,
+            model=GPT_MODEL,
+            instructions=SUMMARY_INSTRUCTIONS,
+            input=SUMMARY_INPUT,
+            output=output,
+        )
+    except Exception as e:
+        return f"Error generating summary: {str(e)}"
+
+
+@instrument_stage('checklist')
+async def agenerate_checklist_from_summary(client, summary, output=None):
+    """Generate a checklist based on the summary using GPT-4o"""
+    try:
+        return await acreate_response_text(
+            client,
+            model=GPT_MODEL,
+            instructions=CHECKLIST_INSTRUCTIONS,
+            input=checklist_input(summary),
+            output=output,
+        )
+    except Exception as e:
+        return f"Error generating checklist: {str(e)}"
+
+
+@instrument_stage('diagram')
+async def agenerate_mermaid_diagram(client, summary, checklist, output=None):
+    """Generate a Mermaid diagram based on the summary and checklist"""
+    try:
+        diagram_code = await acreate_response_text(
+            client,
+            model=GPT_MODEL,
+            instructions=DIAGRAM_INSTRUCTIONS,
+            input=diagram_input(summary, checklist),
+            output=output,
+        )
+        return clean_mermaid_diagram(diagram_code)
+    except Exception as e:
+        return f"Error generating diagram: {str(e)}"
+
+
+class AsyncPipelineExecutor:
+    """Run many summary → checklist → diagram chains concurrently on one event loop.
+
+    Upstream calls are bounded by a semaphore of ``max_concurrency`` so a single
+    process can hold hundreds of jobs while only waiting on network I/O. Each
+    job runs as its own asyncio task and can be cancelled by event_id.
+    """
+
+    def __init__(self, client=None, max_concurrency=None, job_timeout=None):
+        self.client = client or build_llm_client(asynchronous=True)
+        self.max_concurrency = max_concurrency or settings.ASYNC_PIPELINE_CONCURRENCY
+        self.job_timeout = settings.ASYNC_PIPELINE_JOB_TIMEOUT if job_timeout is None else job_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._jobs = {}
+
+    @property
+    def active_jobs(self):
+        return len(self._jobs)
+
+    def submit(self, event_id, claimed=False):
+        """Schedule a job on the running loop and return its asyncio task.
+
+        With claimed the caller has already moved the job to processing.
+        """
+        event_id = str(event_id)
+        task = asyncio.ensure_future(self.run_job(event_id, claimed=claimed))
+        self._jobs[event_id] = task
+        task.add_done_callback(lambda _: self._jobs.pop(event_id, None))
+        return task
+
+    def cancel(self, event_id):
+        """Cancel a running job, returns False if it is not running here"""
+        task = self._jobs.get(str(event_id))
+        if task is None or task.done():
+            return False
+        return task.cancel()
+
+    async def run(self, event_ids):
+        """Process a batch of jobs concurrently and return their results"""
+        return await asyncio.gather(*[self.submit(event_id) for event_id in event_ids])
+
+    async def run_job(self, event_id, claimed=False):
+        try:
+            return await asyncio.wait_for(self._process(event_id, claimed), self.job_timeout or None)
+        except asyncio.CancelledError:
+            await self._fail(event_id, "Job cancelled")
+            return f"Job {event_id} cancelled"
+        except asyncio.TimeoutError:
+            error = f"Job timed out after {self.job_timeout}s"
+            await self._fail(event_id, error)
+            return f"Job {event_id} failed: {error}"
+        except Exception as e:
+            await self._fail(event_id, str(e))
+            return f"Job {event_id} failed: {str(e)}"
+
+    async def _call(self, stage, *args, **kwargs):
+        async with self._semaphore:
+            return await stage(self.client, *args, **kwargs)
+
+    async def _process(self, event_id, claimed=False):
+        """Run the stages the job has no checkpoint for, like tasks.run_pipeline_stages.
+
+        Each stage's output is checkpointed as soon as it finishes. A failed
+        stage is retried here, after the same jittered backoff as the Celery
+        task, up to PIPELINE_MAX_RETRIES times per job, and the job is only
+        marked failed once they run out. The job timeout covers the retries.
+        """
+        # tasks imports this module to reach the executor
+        from .tasks import CHECKPOINTED_STAGES, retry_countdown
+
+        try:
+            job = await Job.objects.only('event_id', 'status', 'created_at', 'summary', 'checklist').aget(
+                event_id=event_id,
+            )
+        except Job.DoesNotExist:
+            return f"Job {event_id} not found"
+        if claimed:
+            if not job.is_processing():
+                return f"Job {event_id} skipped: no longer processing"
+        elif not await sync_to_async(job.set_status)(JobStatus.PROCESSING.value):
+            return f"Job {event_id} skipped: not pending"
+
+        retries = 0
+        for stage in STAGES:
+            if stage in CHECKPOINTED_STAGES and getattr(job, stage):
+                continue
+            while (text := await self._run_stage(job, stage)).startswith("Error"):
+                if retries >= settings.PIPELINE_MAX_RETRIES:
+                    return await self._fail_job(job, text)
+                await asyncio.sleep(retry_countdown(retries))
+                retries += 1
+
+            if stage in CHECKPOINTED_STAGES:
+                if not await sync_to_async(job.save_checkpoint)(**{stage: text}):
+                    return f"Job {event_id} skipped: no longer processing"
+            else:
+                await sync_to_async(job.set_status)(JobStatus.COMPLETED.value, **{stage: text})
+
+        return f"Job {event_id} completed successfully"
+
+    async def _run_stage(self, job, stage):
+        output = stage_output(job.event_id, stage)
+        if stage == 'summary':
+            return await self._call(agenerate_guideline_summary, output=output)
+        if stage == 'checklist':
+            return await self._call(agenerate_checklist_from_summary, job.summary, output=output)
+        return await self._call(agenerate_mermaid_diagram, job.summary, job.checklist, output=output)
+
+    async def _fail_job(self, job, error):
+        await sync_to_async(job.set_status)(JobStatus.FAILED.value, error_message=error)
+        return f"Job {job.event_id} failed: {error}"
+
+    async def _fail(self, event_id, error):
+        try:
+            job = await Job.objects.only('event_id', 'status').aget(event_id=event_id)
+        except Job.DoesNotExist:
+            return
+        await self._fail_job(job, error)
+
+
+class ExecutorThread:
+    """Own an AsyncPipelineExecutor on an event loop running in a background thread.
+
+    Celery tasks hand jobs over with submit(), which blocks once ``max_jobs``
+    jobs are in flight so the worker stops prefetching work it cannot start.
+    """
+
+    def __init__(self, max_jobs=None, **executor_kwargs):
+        self.max_jobs = max_jobs or settings.ASYNC_PIPELINE_MAX_JOBS
+        self._slots = threading.BoundedSemaphore(self.max_jobs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='async-pipeline', daemon=True)
+        self._thread.start()
+        self.executor = self._run(self._create_executor(executor_kwargs))
+
+    async def _create_executor(self, executor_kwargs):
+        return AsyncPipelineExecutor(**executor_kwargs)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def submit(self, event_id, claimed=False):
+        """Hand a job to the loop and return a concurrent.futures.Future for its result"""
+        self._slots.acquire()
+        future = asyncio.run_coroutine_threadsafe(self._start(event_id, claimed), self._loop)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def _start(self, event_id, claimed=False):
+        # The ORM calls of every job on this loop share one thread and its connection, which
+        # Celery's per-task cleanup does not see, so recycle it here when it is obsolete or broken
+        await sync_to_async(close_old_connections)()
+        return await self.executor.submit(event_id, claimed=claimed)
+
+    def cancel(self, event_id):
+        return self._run(self._cancel(event_id))
+
+    async def _cancel(self, event_id):
+        return self.executor.cancel(event_id)
+
+
+_executor_thread = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the per-process executor thread, starting it on first use"""
+    global _executor_thread
+    with _executor_lock:
+        if _executor_thread is None:
+            _executor_thread = ExecutorThread()
+    return _executor_thread
+
+
+def request_cancellation(event_id):
+    """Ask every worker to cancel the job, returns True if one of them did"""
+    from jobapi.celery import app
+
+    replies = app.control.broadcast('cancel_job', arguments={'event_id': str(event_id)}, reply=True)
+    return any(reply.get('ok') for worker_reply in replies for reply in worker_reply.values())
+
+
+@control_command(args=[('event_id', str)], signature='<event_id>')
+def cancel_job(state, event_id):
+    """Worker remote control command: cancel a job running on this worker's event loop"""
+    cancelled = _executor_thread.cancel(event_id) if _executor_thread else False
+    return {'ok': cancelled}
@@ -0,0 +1,196 @@
+import json
+import time
+
+import redis
+from django.conf import settings
+
+from .models import JobPriority
+from .redis_client import get_redis
+
+LANE_PREFIX = 'jobs:lanes'
+DEFAULT_TENANT = 'default'
+
+
+def parse_lane_weights(value):
+    """Parse 'interactive=8,normal=3,bulk=1' into weights for every priority lane"""
+    weights = {}
+    for part in value.split(','):
+        lane, _, weight = part.partition('=')
+        weights[lane.strip()] = int(weight)
+    missing = set(JobPriority.values()) - set(weights)
+    if missing:
+        raise ValueError(f"JOB_LANE_WEIGHTS is missing lanes: {', '.join(sorted(missing))}")
+    return weights
+
+
+class FairScheduler:
+    """Waiting jobs in Redis, handed out by weighted fair scheduling across lanes and tenants.
+
+    Every priority lane keeps one list per tenant plus a ring of the tenants
+    that have jobs waiting. A pop first picks a lane by smooth weighted round
+    robin over the lanes that have work, so interactive jobs get most turns
+    while bulk jobs still run whenever the other lanes are empty. Inside the
+    lane tenants take turns, so one tenant's burst cannot hold back another
+    tenant's jobs. Both steps run in one script so concurrent workers never
+    hand out the same job.
+
+    The pop script derives the name of the chosen tenant's list itself, it
+    cannot be declared in KEYS up front, so the lanes need a standalone Redis
+    (or a primary with replicas) and do not support Redis Cluster.
+    """
+
+    PUSH_SCRIPT = """
+        if redis.call('RPUSH', KEYS[2], ARGV[1]) == 1 then
+            redis.call('RPUSH', KEYS[1], ARGV[2])
+        end
+        redis.call('INCR', KEYS[3])
+    """
+
+    REMOVE_SCRIPT = """
+        if redis.call('LREM', KEYS[2], 1, ARGV[1]) == 1 then
+            redis.call('DECR', KEYS[3])
+            if redis.call('LLEN', KEYS[2]) == 0 then
+                redis.call('LREM', KEYS[1], 0, ARGV[2])
+            end
+        end
+    """
+
+    # KEYS holds the credits hash followed by every lane's tenant ring, ARGV the key prefix
+    # followed by lane, weight pairs in the same order. Tenant lists are named in the script.
+    POP_SCRIPT = """
+        local prefix = ARGV[1]
+        local credits = KEYS[1]
+        local best, best_credit, total = nil, nil, 0
+        for i = 2, #ARGV, 2 do
+            local lane, weight = ARGV[i], tonumber(ARGV[i + 1])
+            if redis.call('LLEN', KEYS[i / 2 + 1]) > 0 then
+                total = total + weight
+                local credit = tonumber(redis.call('HGET', credits, lane) or 0) + weight
+                redis.call('HSET', credits, lane, credit)
+                if best == nil or credit > best_credit then
+                    best, best_credit = lane, credit
+                end
+            end
+        end
+        if best == nil then
+            return nil
+        end
+        redis.call('HSET', credits, best, best_credit - total)
+
+        local ring = prefix .. ':' .. best .. ':tenants'
+        local tenant = redis.call('LPOP', ring)
+        local queue = prefix .. ':' .. best .. ':tenant:' .. tenant
+        local item = redis.call('LPOP', queue)
+        if redis.call('LLEN', queue) > 0 then
+            redis.call('RPUSH', ring, tenant)
+        end
+        redis.call('DECR', prefix .. ':' .. best .. ':depth')
+        return item
+    """
+
+    def __init__(self, weights=None, client=None):
+        self.weights = weights or parse_lane_weights(settings.JOB_LANE_WEIGHTS)
+        self._client = client
+        self._scripts = {}
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def _script(self, name):
+        if name not in self._scripts:
+            self._scripts[name] = self.client.register_script(getattr(self, f'{name}_SCRIPT'))
+        return self._scripts[name]
+
+    def _lane_key(self, lane, suffix):
+        return f'{LANE_PREFIX}:{lane}:{suffix}'
+
+    def push(self, job):
+        """Queue a job in its lane behind the other jobs of its tenant"""
+        self.push_many([job])
+
+    def push_many(self, jobs):
+        """Queue many jobs in one pipelined round trip, returns the queued entries for remove_many"""
+        now = time.time()
+        entries = [
+            (job.priority, job.tenant or DEFAULT_TENANT, json.dumps({'event_id': str(job.event_id), 'enqueued_at': now}))
+            for job in jobs
+        ]
+        self._run_entries('PUSH', entries)
+        return entries
+
+    def remove_many(self, entries):
+        """Take entries returned by push_many back out of their lanes, skipping any already popped"""
+        self._run_entries('REMOVE', entries)
+
+    def _run_entries(self, name, entries):
+        script = self._script(name)
+        pipe = self.client.pipeline(transaction=False)
+        for lane, tenant, item in entries:
+            script(
+                keys=[
+                    self._lane_key(lane, 'tenants'),
+                    self._lane_key(lane, f'tenant:{tenant}'),
+                    self._lane_key(lane, 'depth'),
+                ],
+                args=[item, tenant],
+                client=pipe,
+            )
+        pipe.execute()
+
+    def pop(self):
+        """Take the next job by weighted fair scheduling, returns its event_id or None if none wait"""
+        keys = [f'{LANE_PREFIX}:credits']
+        args = [LANE_PREFIX]
+        for lane, weight in self.weights.items():
+            keys.append(self._lane_key(lane, 'tenants'))
+            args.extend([lane, weight])
+        item = self._script('POP')(keys=keys, args=args, client=self.client)
+        if item is None:
+            return None
+        return json.loads(item)['event_id']
+
+    def lane_stats(self):
+        """Depth of every lane and how long its oldest waiting job has waited, in seconds"""
+        lanes = list(self.weights)
+        pipe = self.client.pipeline(transaction=False)
+        for lane in lanes:
+            pipe.get(self._lane_key(lane, 'depth'))
+            pipe.lrange(self._lane_key(lane, 'tenants'), 0, -1)
+        replies = pipe.execute()
+
+        pipe = self.client.pipeline(transaction=False)
+        tenants = {}
+        for index, lane in enumerate(lanes):
+            tenants[lane] = [tenant.decode() for tenant in replies[index * 2 + 1]]
+            for tenant in tenants[lane]:
+                pipe.lindex(self._lane_key(lane, f'tenant:{tenant}'), 0)
+        heads = iter(pipe.execute())
+
+        now = time.time()
+        stats = {}
+        for index, lane in enumerate(lanes):
+            # A tenant queue may have been drained by a pop between the two round trips
+            oldest = [json.loads(head)['enqueued_at'] for head in (next(heads) for _ in tenants[lane]) if head]
+            stats[lane] = {
+                'depth': max(int(replies[index * 2] or 0), 0),
+                'tenants': len(tenants[lane]),
+                'oldest_wait': round(now - min(oldest), 1) if oldest else 0.0,
+            }
+        return stats
+
+
+def get_scheduler():
+    return FairScheduler()
+
+
+def empty_lane_stats():
+    return {lane: {'depth': 0, 'tenants': 0, 'oldest_wait': 0.0} for lane in JobPriority.values()}
+
+
+def next_job():
+    """Event_id of the next job to run under fair scheduling, None if no job is waiting"""
+    try:
+        return get_scheduler().pop()
+    except redis.RedisError:
+        return None
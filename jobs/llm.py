@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .prompts import DIAGRAM_INSTRUCTIONS
+from .ratelimit import estimate_tokens
+
+STUB_WORDS = (
+    'review', 'deploy', 'secure', 'cache', 'validate', 'document', 'monitor', 'test',
+    'accessibility', 'performance', 'release', 'audit', 'backup', 'index', 'rollback',
+)
+
+
+class StubLLM:
+    """Deterministic stand-in for the Responses API, for load testing without the network.
+
+    Output text is derived from a hash of model, instructions and input, so
+    repeated prompts return the same text and the stage cache behaves as it
+    would in production. Each call waits for a latency drawn from a lognormal
+    distribution around ``latency`` seconds and fails with a rate-limit error
+    with probability ``error_rate``.
+    """
+
+    chunk_chars = 20
+
+    def __init__(self, latency=None, jitter=None, error_rate=None, output_chars=None, rng=None):
+        self.latency = settings.LLM_STUB_LATENCY if latency is None else latency
+        self.jitter = settings.LLM_STUB_LATENCY_JITTER if jitter is None else jitter
+        self.error_rate = settings.LLM_STUB_ERROR_RATE if error_rate is None else error_rate
+        self.output_chars = output_chars or settings.LLM_STUB_OUTPUT_CHARS
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        if not self.latency:
+            return 0.0
+        with self._lock:
+            return self.latency * self._rng.lognormvariate(0, self.jitter)
+
+    def check_rate_limit(self):
+        with self._lock:
+            limited = self._rng.random() < self.error_rate
+        if limited:
+            request = httpx.Request('POST', 'https://stub.invalid/v1/responses')
+            raise openai.RateLimitError(
+                'Rate limit reached (stub)', response=httpx.Response(429, request=request), body=None,
+            )
+
+    def output_text(self, model, instructions, input):
+        seed = hashlib.sha256(f'{model}\x00{instructions}\x00{input}'.encode('utf-8')).digest()
+        rng = random.Random(seed)
+        if instructions == DIAGRAM_INSTRUCTIONS:
+            return self._diagram(rng)
+        lines = []
+        size = 0
+        while size <= self.output_chars:
+            line = f"{len(lines) + 1}. " + ' '.join(rng.choice(STUB_WORDS) for _ in range(8))
+            lines.append(line)
+            size += len(line) + 1
+        return '\n'.join(lines)[:self.output_chars]
+
+    def _diagram(self, rng):
+        steps = max(2, self.output_chars // 40)
+        lines = ['flowchart TD']
+        for step in range(steps - 1):
+            lines.append(f'    S{step}[{rng.choice(STUB_WORDS).title()}] --> S{step + 1}[{rng.choice(STUB_WORDS).title()}]')
+        return '\n'.join(lines)
+
+    def chunks(self, text):
+        return [text[start:start + self.chunk_chars] for start in range(0, len(text), self.chunk_chars)]
+
+    @staticmethod
+    def usage(instructions, input, text):
+        return SimpleNamespace(input_tokens=estimate_tokens(instructions, input), output_tokens=estimate_tokens(text))
+
+    @staticmethod
+    def delta_event(delta):
+        return SimpleNamespace(type='response.output_text.delta', delta=delta)
+
+    @staticmethod
+    def completed_event(text, usage=None):
+        return SimpleNamespace(type='response.completed', response=SimpleNamespace(output_text=text, usage=usage))
+
+
+class StubResponses:
+
+    def __init__(self, stub):
+        self.stub = stub
+
+    def create(self, model, instructions, input, stream=False, **kwargs):
+        self.stub.check_rate_limit()
+        text = self.stub.output_text(model, instructions, input)
+        usage = self.stub.usage(instructions, input, text)
+        if stream:
+            return self._stream(text, usage)
+        time.sleep(self.stub.sample_latency())
+        return SimpleNamespace(output_text=text, usage=usage)
+
+    def _stream(self, text, usage):
+        # Spread the sampled latency over the chunks so time-to-first-token is realistic
+        chunks = self.stub.chunks(text)
+        delay = self.stub.sample_latency() / max(len(chunks), 1)
+        for chunk in chunks:
+            time.sleep(delay)
+            yield self.stub.delta_event(chunk)
+        yield self.stub.completed_event(text, usage)
+
+
+class AsyncStubResponses(StubResponses):
+
+    async def create(self, model, instructions, input, stream=False, **kwargs):
+        self.stub.check_rate_limit()
+        text = self.stub.output_text(model, instructions, input)
+        usage = self.stub.usage(instructions, input, text)
+        if stream:
+            return self._astream(text, usage)
+        await asyncio.sleep(self.stub.sample_latency())
+        return SimpleNamespace(output_text=text, usage=usage)
+
+    async def _astream(self, text, usage):
+        chunks = self.stub.chunks(text)
+        delay = self.stub.sample_latency() / max(len(chunks), 1)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield self.stub.delta_event(chunk)
+        yield self.stub.completed_event(text, usage)
+
+
+class StubClient:
+    """Client exposing ``responses.create`` backed by a StubLLM"""
+
+    responses_class = StubResponses
+
+    def __init__(self, stub=None):
+        self.responses = self.responses_class(stub or StubLLM())
+
+
+class AsyncStubClient(StubClient):
+    responses_class = AsyncStubResponses
+
+
+def build_llm_client(provider=None, asynchronous=False):
+    """Build a client for the configured provider name"""
+    provider = provider or settings.LLM_PROVIDER
+    if provider == 'openai':
+        client_class = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+        # With the upstream limiter on, 429s are retried there so every worker sees them
+        max_retries = 0 if settings.LLM_RATE_LIMIT_ENABLED else openai.DEFAULT_MAX_RETRIES
+        return client_class(api_key=settings.OPENAI_API_KEY, max_retries=max_retries)
+    if provider == 'stub':
+        return AsyncStubClient() if asynchronous else StubClient()
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Return the per-process client, so every task reuses one HTTP connection pool"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = build_llm_client()
+    return _client
+
+
+@receiver(setting_changed)
+def reset_llm_client(setting, **kwargs):
+    global _client
+    if setting in ('LLM_PROVIDER', 'OPENAI_API_KEY', 'LLM_RATE_LIMIT_ENABLED') or setting.startswith('LLM_STUB_'):
+        _client = None
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs.archive import FINISHED_STATUSES, archive_jobs, drop_expired_partitions
+from jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished jobs older than the retention period from the jobs table to the "
+        "partitioned jobs_archive table in batches, and drop archive partitions past "
+        "JOB_ARCHIVE_RETENTION_MONTHS. The same work runs periodically as the "
+        "archive_old_jobs Celery beat task."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            help="Archive finished jobs created more than this many days ago, "
+                                 "defaults to JOB_RETENTION_DAYS")
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_ARCHIVE_BATCH_SIZE,
+                            help="Jobs moved per transaction")
+        parser.add_argument('--max-batches', type=int, default=settings.JOB_ARCHIVE_MAX_BATCHES,
+                            help="Stop after this many batches")
+        parser.add_argument('--retention-months', type=int, default=settings.JOB_ARCHIVE_RETENTION_MONTHS,
+                            help="Drop archive months older than this, 0 keeps them")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the jobs that would be archived")
+
+    def handle(self, *args, **options):
+        older_than_days = options['older_than_days']
+        if older_than_days is None:
+            # JOB_RETENTION_DAYS=0 disables archiving, it must not mean "archive everything".
+            # An explicit --older-than-days 0 still archives every finished job.
+            if not settings.JOB_RETENTION_DAYS:
+                self.stdout.write("Archiving disabled, JOB_RETENTION_DAYS is 0")
+                return
+            older_than_days = settings.JOB_RETENTION_DAYS
+
+        if options['dry_run']:
+            cutoff = timezone.now() - timedelta(days=older_than_days)
+            count = Job.objects.filter(status__in=FINISHED_STATUSES, created_at__lt=cutoff).count()
+            self.stdout.write(f"{count} jobs would be archived")
+            return
+
+        archived = archive_jobs(
+            older_than_days=older_than_days,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(f"Archived {archived} jobs")
+        for name in drop_expired_partitions(options['retention_months']):
+            self.stdout.write(f"Dropped archive partition {name}")
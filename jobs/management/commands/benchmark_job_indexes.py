@@ -0,0 +1,116 @@
+import json
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from jobs.models import Job, JobStatus
+from jobs.pagination import JobCursorPagination, after_position
+from jobs.serializers import JobListSerializer
+
+
+SEED_SQL = """
+    INSERT INTO jobs (event_id, status, created_at, updated_at, priority, tenant, summary, checklist, diagram, error_message)
+    SELECT
+        md5(random()::text || g::text)::uuid,
+        CASE
+            WHEN r < 0.005 THEN 'pending'
+            WHEN r < 0.010 THEN 'processing'
+            WHEN r < 0.030 THEN 'failed'
+            ELSE 'completed'
+        END,
+        now() - g * interval '1 second',
+        now() - g * interval '1 second',
+        'normal',
+        '',
+        CASE WHEN r >= 0.030 THEN convert_to(repeat('s', %(payload)s), 'UTF8') END,
+        CASE WHEN r >= 0.030 THEN convert_to(repeat('c', %(payload)s), 'UTF8') END,
+        CASE WHEN r >= 0.030 THEN convert_to(repeat('d', %(payload)s), 'UTF8') END,
+        CASE WHEN r >= 0.010 AND r < 0.030 THEN 'Error generating summary' END
+    FROM (SELECT g, random() AS r FROM generate_series(1, %(rows)s) AS g) AS seed
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed the jobs table and compare query plans for the dashboard and status "
+        "access paths with and without the jobs indexes. Everything runs in one "
+        "transaction that is rolled back, but run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000, help="Rows to seed before explaining (0 to use existing data)")
+        parser.add_argument('--payload-bytes', type=int, default=256, help="Size of each seeded result column")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("benchmark_job_indexes requires PostgreSQL")
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                if options['rows']:
+                    self.stderr.write(f"Seeding {options['rows']} jobs...")
+                    cursor.execute(SEED_SQL, {'rows': options['rows'], 'payload': options['payload_bytes']})
+                cursor.execute('ANALYZE jobs')
+
+                results = []
+                for name, queryset in self.queries():
+                    sql, params = queryset.query.sql_with_params()
+                    results.append({
+                        'query': name,
+                        'without_indexes': self.explain(cursor, sql, params, use_indexes=False),
+                        'with_indexes': self.explain(cursor, sql, params, use_indexes=True),
+                    })
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(result['query'])
+            for label in ('without_indexes', 'with_indexes'):
+                plan = result[label]
+                self.stdout.write(f"  {label:<16} {plan['execution_ms']:>10.2f} ms  {', '.join(plan['scans'])}")
+
+    def queries(self):
+        active = [JobStatus.PENDING.value, JobStatus.PROCESSING.value]
+        yield 'recent_jobs', Job.objects.order_by('-created_at')[:20]
+        for value in JobStatus.values():
+            yield f'count {value}', Job.objects.filter(status=value).order_by().values('status').annotate(count=Count('event_id'))
+        yield 'recent pending', Job.objects.filter(status=JobStatus.PENDING.value).order_by('-created_at')[:20]
+        yield 'oldest active', Job.objects.filter(status__in=active).order_by('created_at')[:100]
+        # A page of GET /jobs/?fields=event_id,status a week deep into the table
+        listing = Job.objects.only(*JobListSerializer.columns(['event_id', 'status']))
+        position = (timezone.now() - timedelta(days=7), uuid.UUID(int=0))
+        yield 'list page', after_position(listing, *position).order_by(*JobCursorPagination.ordering)[:101]
+        yield 'list page failed', after_position(
+            listing.filter(status=JobStatus.FAILED.value), *position,
+        ).order_by(*JobCursorPagination.ordering)[:101]
+
+    def explain(self, cursor, sql, params, use_indexes):
+        setting = 'on' if use_indexes else 'off'
+        for option in ('enable_indexscan', 'enable_indexonlyscan', 'enable_bitmapscan'):
+            cursor.execute(f'SET LOCAL {option} = {setting}')
+        cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return {
+            'execution_ms': plan[0]['Execution Time'],
+            'scans': scan_nodes(plan[0]['Plan']),
+        }
+
+
+def scan_nodes(node):
+    """List the scan nodes of an EXPLAIN plan with the relation or index they use"""
+    scans = []
+    if node['Node Type'].endswith('Scan'):
+        target = node.get('Index Name') or node.get('Relation Name', '')
+        scans.append(f"{node['Node Type']} ({target})")
+    for child in node.get('Plans', []):
+        scans.extend(scan_nodes(child))
+    return scans
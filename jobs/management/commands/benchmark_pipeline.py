@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from jobs.benchmark import PipelineBenchmark, parse_mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a mix of API requests in-process, then process the created jobs eagerly or "
+        "wait for Celery workers, and report latency percentiles and histograms, DB queries "
+        "per request, DB time per request and job and jobs/sec as JSON. Jobs are written to the configured database, "
+        "so run it against a scratch one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Number of API requests to send")
+        parser.add_argument('--concurrency', type=int, default=8, help="Threads sending API requests")
+        parser.add_argument('--mix', default='create=1,status=4', help="Weighted request mix of create, batch and status")
+        parser.add_argument('--batch-size', type=int, default=10, help="Jobs per batch request")
+        parser.add_argument('--mode', choices=['eager', 'broker'], default='eager',
+                            help="Process jobs on local threads, or wait for running Celery workers")
+        parser.add_argument('--workers', type=int, default=4, help="Threads processing jobs in eager mode")
+        parser.add_argument('--timeout', type=int, default=300, help="Seconds to wait for workers in broker mode")
+        parser.add_argument('--provider', choices=['stub', 'openai'], default='stub',
+                            help="LLM provider for eager mode (broker mode uses the workers' settings)")
+        parser.add_argument('--stub-latency', type=float, help="Mean stub latency per call in seconds")
+        parser.add_argument('--stub-error-rate', type=float, help="Fraction of stub calls failing with a rate-limit error")
+        parser.add_argument('--stub-output-chars', type=int, help="Characters returned by each stub call")
+        parser.add_argument('--no-stage-cache', action='store_true', help="Disable the GPT stage cache in eager mode")
+        parser.add_argument('--conn-max-age', type=int,
+                            help="CONN_MAX_AGE for this run, 0 reconnects for every request and job")
+        parser.add_argument('--keep-jobs', action='store_true', help="Keep the jobs created by the benchmark")
+        parser.add_argument('--output', help="Also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = PipelineBenchmark(
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                mix=parse_mix(options['mix']),
+                mode=options['mode'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                timeout=options['timeout'],
+                keep_jobs=options['keep_jobs'],
+                conn_max_age=options['conn_max_age'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        with override_settings(**self.llm_overrides(options)):
+            self.stderr.write(f"Sending {options['requests']} requests ({options['mix']}) in {options['mode']} mode...")
+            report = benchmark.run()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def llm_overrides(self, options):
+        """Settings for the LLM calls made in this process, Celery workers in broker mode use their own"""
+        if options['mode'] != 'eager':
+            return {}
+        overrides = {'LLM_PROVIDER': options['provider']}
+        for option, setting in (
+            ('stub_latency', 'LLM_STUB_LATENCY'),
+            ('stub_error_rate', 'LLM_STUB_ERROR_RATE'),
+            ('stub_output_chars', 'LLM_STUB_OUTPUT_CHARS'),
+        ):
+            if options[option] is not None:
+                overrides[setting] = options[option]
+        if options['no_stage_cache']:
+            overrides['LLM_CACHE_BACKEND'] = 'none'
+        return overrides
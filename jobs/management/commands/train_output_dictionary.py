@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+from jobs.compression import MAX_DICTIONARY_SIZE, compress_text, train_dictionary
+from jobs.models import Job, JobStatus, OutputDictionary
+from jobs.streaming import STAGES
+
+
+class Command(BaseCommand):
+    help = (
+        "Train a zlib preset dictionary on the outputs of recent completed jobs and store it in "
+        "the jobs_output_dictionaries table. Set LLM_OUTPUT_DICTIONARY to the printed id to "
+        "compress new outputs with it. Dictionaries must be kept for as long as rows reference them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=2000, help="Completed jobs to sample")
+        parser.add_argument('--size', type=int, default=MAX_DICTIONARY_SIZE, help="Maximum dictionary size in bytes")
+
+    def handle(self, *args, **options):
+        if not 0 < options['size'] <= MAX_DICTIONARY_SIZE:
+            raise CommandError(f"--size must be between 1 and {MAX_DICTIONARY_SIZE}")
+
+        jobs = Job.objects.filter(status=JobStatus.COMPLETED.value).only(*STAGES).order_by('-created_at')
+        samples = [
+            getattr(job, stage)
+            for job in jobs[:options['samples']]
+            for stage in STAGES
+            if getattr(job, stage)
+        ]
+        if not samples:
+            raise CommandError("No completed jobs to train on")
+
+        dictionary = train_dictionary(samples, options['size'])
+        dictionary_id = (OutputDictionary.objects.aggregate(last=models.Max('id'))['last'] or 0) + 1
+        OutputDictionary.objects.create(id=dictionary_id, data=dictionary)
+
+        raw = sum(len(sample.encode('utf-8')) for sample in samples)
+        plain = sum(len(compress_text(sample, dictionary_id=0)) for sample in samples)
+        trained = sum(len(compress_text(sample, dictionary_id=dictionary_id)) for sample in samples)
+        self.stdout.write(
+            f"Wrote dictionary {dictionary_id} ({len(dictionary)} bytes) from {len(samples)} outputs. "
+            f"Compression ratio on the samples: {raw / plain:.1f}x without it, {raw / trained:.1f}x with it."
+        )
@@ -0,0 +1,295 @@
+import asyncio
+import functools
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery.signals import task_postrun, worker_process_shutdown
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'jobs:metrics'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+WAIT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class Metric:
+
+    def __init__(self, name, kind, help, labels=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+
+
+METRICS = {metric.name: metric for metric in [
+    Metric('jobs_stage_duration_seconds', 'histogram', 'Duration of one GPT stage, cache hits included',
+           labels=('stage', 'outcome'), buckets=LATENCY_BUCKETS),
+    Metric('jobs_queue_wait_seconds', 'histogram', 'Time from job creation until a worker claimed it',
+           buckets=WAIT_BUCKETS),
+    Metric('jobs_db_write_duration_seconds', 'histogram', 'Duration of job status and checkpoint writes',
+           labels=('operation',), buckets=LATENCY_BUCKETS),
+    Metric('jobs_status_transitions_total', 'counter', 'Job status transitions by target status',
+           labels=('status',)),
+    Metric('llm_tokens_total', 'counter', 'Tokens reported by the model provider',
+           labels=('model', 'kind')),
+    Metric('http_request_duration_seconds', 'histogram', 'Duration of API and dashboard requests',
+           labels=('view', 'method', 'status'), buckets=LATENCY_BUCKETS),
+]}
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsRegistry:
+    """Counters and histograms summed across every web and worker process in Redis.
+
+    Observations are added to an in-process buffer and written with one
+    pipelined HINCRBYFLOAT per series at most every ``flush_interval``
+    seconds, and after every Celery task. A flush due on an event loop, in an
+    async view or the async executor, runs in the loop's default thread pool
+    so the Redis round trip never blocks it. Each Redis field is one series of
+    the exposition format, histogram buckets are stored cumulatively, so
+    rendering is a single HGETALL. A failed flush drops its buffer rather than
+    failing the request or the job.
+    """
+
+    def __init__(self, flush_interval=None, client=None):
+        self.flush_interval = settings.METRICS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._client = client
+        self._pending = defaultdict(float)
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def series(self, name, labels, suffix=''):
+        return f'{name}{suffix}{format_labels(self._ordered(METRICS[name], labels))}'
+
+    def inc(self, name, value=1, **labels):
+        self._add({self.series(name, labels): value})
+
+    def observe(self, name, value, **labels):
+        metric = METRICS[name]
+        increments = {
+            self.series(name, labels, '_sum'): value,
+            self.series(name, labels, '_count'): 1,
+        }
+        for bound in metric.buckets + (float('inf'),):
+            if value <= bound:
+                le = '+Inf' if bound == float('inf') else format_value(bound)
+                increments[f'{name}_bucket{format_labels({**self._ordered(metric, labels), "le": le})}'] = 1
+        self._add(increments)
+
+    @staticmethod
+    def _ordered(metric, labels):
+        return {label: labels.get(label, '') for label in metric.labels}
+
+    def _add(self, increments):
+        if not settings.METRICS_ENABLED:
+            return
+        with self._lock:
+            for series, value in increments.items():
+                self._pending[series] += value
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if not due:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+        else:
+            loop.run_in_executor(None, self.flush).add_done_callback(log_flush_error)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for series, value in pending.items():
+                pipe.hincrbyfloat(METRICS_KEY, series, value)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        self.flush()
+        values = {series.decode(): float(value) for series, value in self.client.hgetall(METRICS_KEY).items()}
+        by_metric = defaultdict(list)
+        for series, value in values.items():
+            by_metric[re.sub(r'(_bucket|_sum|_count)$', '', series.split('{', 1)[0])].append((series, value))
+
+        lines = []
+        for name, metric in METRICS.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for series, value in sorted(by_metric.get(name, []), key=series_sort_key):
+                lines.append(f'{series} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def log_flush_error(future):
+    # flush() swallows Redis errors, anything else raised in the executor would go unseen
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Metrics flush failed", exc_info=future.exception())
+
+
+def series_sort_key(item):
+    # Keep a histogram's buckets in ascending order of their upper bound
+    series = item[0]
+    match = re.search(r',?le="([^"]+)"', series)
+    if match is None:
+        return series, 0.0
+    return series[:match.start()] + series[match.end():], float(match.group(1))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return this process's metrics registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+
+def inc(name, value=1, **labels):
+    get_metrics().inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    get_metrics().observe(name, value, **labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the duration of the block in histogram ``name``"""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - started, **labels)
+
+
+def instrument_stage(stage):
+    """Time a generate_* function, sync or async, labelled by stage and by whether it returned an error"""
+    def decorator(func):
+        def record(started, text):
+            outcome = 'error' if text.startswith('Error') else 'ok'
+            observe('jobs_stage_duration_seconds', time.monotonic() - started, stage=stage, outcome=outcome)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.monotonic()
+                text = await func(*args, **kwargs)
+                record(started, text)
+                return text
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.monotonic()
+            text = func(*args, **kwargs)
+            record(started, text)
+            return text
+        return wrapper
+    return decorator
+
+
+def record_usage(model, usage):
+    """Count the input and output tokens of a response"""
+    if usage is None:
+        return
+    inc('llm_tokens_total', usage.input_tokens, model=model, kind='input')
+    inc('llm_tokens_total', usage.output_tokens, model=model, kind='output')
+
+
+class MetricsMiddleware:
+    """Record the duration of every request, labelled by URL name, method and status code.
+
+    The middleware runs in the server's mode, so under ASGI async views are
+    not pushed into a thread by a sync-only middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.monotonic()
+        response = self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.monotonic()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    def record(self, request, response, started):
+        match = request.resolver_match
+        observe(
+            'http_request_duration_seconds', time.monotonic() - started,
+            view=match.url_name if match and match.url_name else 'unmatched',
+            method=request.method, status=response.status_code,
+        )
+
+
+@task_postrun.connect
+def flush_after_task(**kwargs):
+    get_metrics().flush()
+
+
+@worker_process_shutdown.connect
+def flush_on_shutdown(**kwargs):
+    get_metrics().flush()
+
+
+@receiver(setting_changed)
+def reset_metrics(setting, **kwargs):
+    global _registry
+    if setting.startswith('METRICS_'):
+        with _registry_lock:
+            _registry = None
@@ -0,0 +1,32 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, and avoids
+    # blocking writes to a large jobs table while the indexes are built.
+    atomic = False
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['created_at'], name='jobs_created_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['status', 'created_at'], name='jobs_status_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(
+                condition=models.Q(('status__in', ['pending', 'processing'])),
+                fields=['created_at'],
+                name='jobs_active_created_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0002_job_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='priority',
+            field=models.CharField(choices=[('interactive', 'Interactive'), ('normal', 'Normal'), ('bulk', 'Bulk')], default='normal', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='tenant',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
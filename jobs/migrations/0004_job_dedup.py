@@ -0,0 +1,50 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Both indexes are built concurrently like 0002, so writes to jobs are not blocked
+    # while they scan the table. Adding the nullable columns only changes the catalog.
+    atomic = False
+
+    dependencies = [
+        ('jobs', '0003_job_priority_tenant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='input_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        # Postgres enforces the constraint with a unique index, which unlike ADD CONSTRAINT
+        # UNIQUE can be built concurrently. Remove it with DROP INDEX, not DROP CONSTRAINT.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE UNIQUE INDEX CONCURRENTLY jobs_idempotency_key_uniq ON jobs (idempotency_key)',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS jobs_idempotency_key_uniq',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='job',
+                    constraint=models.UniqueConstraint(fields=['idempotency_key'], name='jobs_idempotency_key_uniq'),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(
+                condition=models.Q(('status__in', ['pending', 'processing'])),
+                fields=['input_hash'],
+                name='jobs_active_input_hash_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0004_job_dedup'),
+    ]
+
+    operations = [
+        # Partitions are created per month by jobs.archive as rows are archived
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE jobs_archive (
+                    event_id uuid NOT NULL,
+                    status varchar(20) NOT NULL,
+                    priority varchar(20) NOT NULL,
+                    tenant varchar(100) NOT NULL,
+                    created_at timestamp with time zone NOT NULL,
+                    updated_at timestamp with time zone NOT NULL,
+                    archived_at timestamp with time zone NOT NULL,
+                    payload bytea NOT NULL,
+                    PRIMARY KEY (event_id, created_at)
+                ) PARTITION BY RANGE (created_at)
+            """,
+            reverse_sql='DROP TABLE jobs_archive',
+            state_operations=[
+                migrations.CreateModel(
+                    name='JobArchive',
+                    fields=[
+                        ('event_id', models.UUIDField(primary_key=True, serialize=False)),
+                        ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], max_length=20)),
+                        ('priority', models.CharField(choices=[('interactive', 'Interactive'), ('normal', 'Normal'), ('bulk', 'Bulk')], max_length=20)),
+                        ('tenant', models.CharField(blank=True, max_length=100)),
+                        ('created_at', models.DateTimeField()),
+                        ('updated_at', models.DateTimeField()),
+                        ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('payload', models.BinaryField()),
+                    ],
+                    options={
+                        'db_table': 'jobs_archive',
+                        'managed': False,
+                    },
+                ),
+            ],
+        ),
+        # Archiving deletes in batches, so vacuum the hot table after a smaller share of dead rows
+        migrations.RunSQL(
+            sql='ALTER TABLE jobs SET (autovacuum_vacuum_scale_factor = 0.05, autovacuum_analyze_scale_factor = 0.02)',
+            reverse_sql='ALTER TABLE jobs RESET (autovacuum_vacuum_scale_factor, autovacuum_analyze_scale_factor)',
+        ),
+    ]
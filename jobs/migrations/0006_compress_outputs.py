@@ -0,0 +1,96 @@
+from django.db import migrations, transaction
+import jobs.compression
+
+
+COLUMNS = ['summary', 'checklist', 'diagram']
+
+# Rows copied per autocommitted UPDATE while the table stays writable
+BATCH_SIZE = 5000
+
+
+def copy_sql(where):
+    assignments = ', '.join(f"{column}_bytes = convert_to({column}, 'UTF8')" for column in COLUMNS)
+    return f'UPDATE jobs SET {assignments} WHERE {where}'
+
+
+def compress_columns(apps, schema_editor):
+    """Move the result columns to bytea without rewriting the table under a lock.
+
+    ALTER COLUMN ... TYPE bytea would rewrite every row while holding an
+    ACCESS EXCLUSIVE lock. Instead new bytea columns are added and filled in
+    batches while the app keeps writing, then one short locked transaction
+    copies the rows written meanwhile (set_status and save_checkpoint both
+    bump updated_at) and swaps the columns, which only changes the catalog.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT data_type FROM information_schema.columns WHERE table_name = 'jobs' AND column_name = %s",
+            [COLUMNS[0]],
+        )
+        if cursor.fetchone()[0] == 'bytea':
+            return
+
+        cursor.execute('SELECT clock_timestamp()')
+        started = cursor.fetchone()[0]
+        for column in COLUMNS:
+            cursor.execute(f'ALTER TABLE jobs ADD COLUMN IF NOT EXISTS {column}_bytes bytea')
+        # Lets the locked catch-up find the rows written during the backfill without a scan
+        cursor.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS jobs_compress_updated_idx ON jobs (updated_at)')
+
+        last = '00000000-0000-0000-0000-000000000000'
+        while True:
+            cursor.execute(
+                copy_sql('event_id IN (SELECT event_id FROM jobs WHERE event_id > %s ORDER BY event_id LIMIT %s)')
+                + ' RETURNING event_id',
+                [last, BATCH_SIZE],
+            )
+            batch = [row[0] for row in cursor.fetchall()]
+            if not batch:
+                break
+            last = max(batch)
+
+        with transaction.atomic(using=schema_editor.connection.alias):
+            # Give up rather than queue every other query behind a lock wait
+            cursor.execute("SET LOCAL lock_timeout = '10s'")
+            cursor.execute('LOCK TABLE jobs IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(copy_sql('updated_at >= %s'), [started])
+            for column in COLUMNS:
+                cursor.execute(f'ALTER TABLE jobs DROP COLUMN {column}')
+                cursor.execute(f'ALTER TABLE jobs RENAME COLUMN {column}_bytes TO {column}')
+        cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS jobs_compress_updated_idx')
+
+
+def convert_sql(column, to_type, expression):
+    return f'ALTER TABLE jobs ALTER COLUMN {column} TYPE {to_type} USING {expression}'
+
+
+def uncompress_columns(apps, schema_editor):
+    # Rewrites the table, and only works before any row has been written compressed
+    for column in COLUMNS:
+        schema_editor.execute(convert_sql(column, 'text', f"convert_from({column}, 'UTF8')"))
+
+
+class Migration(migrations.Migration):
+
+    # The backfill commits batch by batch and builds its index concurrently
+    atomic = False
+
+    dependencies = [
+        ('jobs', '0005_job_archive'),
+    ]
+
+    # Existing rows keep their text as UTF-8 bytes, which CompressedTextField reads as
+    # uncompressed; they are compressed the next time they are written.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(compress_columns, uncompress_columns)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='job',
+                    name=column,
+                    field=jobs.compression.CompressedTextField(blank=True, null=True),
+                )
+                for column in COLUMNS
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Built concurrently like 0002. The new indexes extend the old ones with
+    # event_id, so the old ones are dropped once the new ones exist.
+    atomic = False
+
+    dependencies = [
+        ('jobs', '0006_compress_outputs'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['created_at', 'event_id'], name='jobs_created_event_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='job',
+            index=models.Index(fields=['status', 'created_at', 'event_id'], name='jobs_status_created_event_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='job',
+            name='jobs_created_at_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='job',
+            name='jobs_status_created_idx',
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0007_job_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutputDictionary',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'jobs_output_dictionaries',
+            },
+        ),
+    ]
@@ -1,7 +1,15 @@
+import gzip
+import json
 import uuid
+from datetime import timedelta
 from enum import Enum
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.utils import timezone
+from .cache import get_status_cache
+from .compression import CompressedTextField
+from .events import publish_job_event
+from .metrics import inc, observe, timed
 
 
 class JobStatus(Enum):
@@ -19,27 +27,95 @@ class JobStatus(Enum):
         return [status.value for status in cls]
 
 
+class JobPriority(Enum):
+    INTERACTIVE = 'interactive'
+    NORMAL = 'normal'
+    BULK = 'bulk'
+
+    @classmethod
+    def choices(cls):
+        return [(priority.value, priority.name.title()) for priority in cls]
+
+    @classmethod
+    def values(cls):
+        return [priority.value for priority in cls]
+
+
+# Wide text columns that are only needed once a job has finished
+RESULT_FIELDS = ('summary', 'checklist', 'diagram', 'error_message')
+
+
+class JobQuerySet(models.QuerySet):
+
+    def without_results(self):
+        """Defer the wide result columns so status reads touch a narrow row"""
+        return self.defer(*RESULT_FIELDS)
+
+    def stale(self):
+        """Processing jobs nobody has written to for JOB_CLAIM_LEASE seconds, their worker is presumed dead"""
+        cutoff = timezone.now() - timedelta(seconds=settings.JOB_CLAIM_LEASE)
+        return self.filter(status=JobStatus.PROCESSING.value, updated_at__lt=cutoff)
+
+    def status_counts(self):
+        """Count jobs per status with a single GROUP BY query"""
+        counts = {value: 0 for value in JobStatus.values()}
+        rows = self.order_by().values('status').annotate(count=models.Count('event_id'))
+        for row in rows:
+            counts[row['status']] = row['count']
+        counts['total'] = sum(counts.values())
+        return counts
+
+
 class Job(models.Model):
 
     event_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     status = models.CharField(max_length=20, choices=JobStatus.choices(), default=JobStatus.PENDING.value)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    priority = models.CharField(max_length=20, choices=JobPriority.choices(), default=JobPriority.NORMAL.value)
+    tenant = models.CharField(max_length=100, blank=True, default='')
+    # Digests used to recognise repeated submissions, see jobs/dedup.py
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    input_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
 
-    summary = models.TextField(blank=True, null=True)
-    checklist = models.TextField(blank=True, null=True)
-    diagram = models.TextField(blank=True, null=True)
+    summary = CompressedTextField(blank=True, null=True)
+    checklist = CompressedTextField(blank=True, null=True)
+    diagram = CompressedTextField(blank=True, null=True)
     error_message = models.TextField(blank=True, null=True)
 
+    objects = JobQuerySet.as_manager()
+
     class Meta:
         db_table = 'jobs'
         ordering = ['-created_at']
+        indexes = [
+            # event_id breaks created_at ties for keyset pagination of the job listing
+            models.Index(fields=['created_at', 'event_id'], name='jobs_created_event_idx'),
+            models.Index(fields=['status', 'created_at', 'event_id'], name='jobs_status_created_event_idx'),
+            # Small hot set of jobs that are still waiting or running
+            models.Index(
+                fields=['created_at'],
+                name='jobs_active_created_idx',
+                condition=models.Q(status__in=[JobStatus.PENDING.value, JobStatus.PROCESSING.value]),
+            ),
+            # Finds an in-flight job with the same inputs when Redis is unavailable
+            models.Index(
+                fields=['input_hash'],
+                name='jobs_active_input_hash_idx',
+                condition=models.Q(status__in=[JobStatus.PENDING.value, JobStatus.PROCESSING.value]),
+            ),
+        ]
+        constraints = [
+            # Built as a unique index, concurrently, by migration 0004
+            models.UniqueConstraint(fields=['idempotency_key'], name='jobs_idempotency_key_uniq'),
+        ]
 
     def __str__(self):
         return f"Job {self.event_id} - {self.status}"
 
     @property
     def result(self):
+        self.load_result()
         if self.status == JobStatus.COMPLETED.value:
             return {
                 'summary': self.summary,
@@ -52,6 +128,31 @@ class Job(models.Model):
             }
         return None
 
+    def result_field_names(self):
+        """Result columns that are part of the result for the current status"""
+        if self.status == JobStatus.COMPLETED.value:
+            return ['summary', 'checklist', 'diagram']
+        elif self.status == JobStatus.FAILED.value:
+            return ['error_message']
+        return []
+
+    def load_result(self):
+        """Fetch any deferred result columns for the current status in one query"""
+        deferred = self.get_deferred_fields()
+        fields = [field for field in self.result_field_names() if field in deferred]
+        if fields:
+            self.refresh_from_db(fields=fields)
+
+    async def aload_result(self):
+        """Async counterpart of load_result, so serializing the job afterwards runs no query"""
+        deferred = self.get_deferred_fields()
+        fields = [field for field in self.result_field_names() if field in deferred]
+        if fields:
+            await self.arefresh_from_db(fields=fields)
+
+    def is_finished(self):
+        return self.status in (JobStatus.COMPLETED.value, JobStatus.FAILED.value)
+
     def is_pending(self):
         return self.status == JobStatus.PENDING.value
 
@@ -64,20 +165,152 @@ class Job(models.Model):
     def is_failed(self):
         return self.status == JobStatus.FAILED.value
 
+    valid_transitions = {
+        JobStatus.PENDING.value: [JobStatus.PROCESSING.value, JobStatus.FAILED.value],
+        JobStatus.PROCESSING.value: [JobStatus.COMPLETED.value, JobStatus.FAILED.value],
+        JobStatus.COMPLETED.value: [],
+        JobStatus.FAILED.value: []
+    }
+
     def can_transition_to(self, new_status):
         """Check if status transition is valid"""
-        valid_transitions = {
-            JobStatus.PENDING.value: [JobStatus.PROCESSING.value, JobStatus.FAILED.value],
-            JobStatus.PROCESSING.value: [JobStatus.COMPLETED.value, JobStatus.FAILED.value],
-            JobStatus.COMPLETED.value: [],
-            JobStatus.FAILED.value: []
-        }
-        return new_status in valid_transitions.get(self.status, [])
-
-    def set_status(self, new_status):
-        """Safely set status with validation"""
-        if self.can_transition_to(new_status):
-            self.status = new_status
-            self.save()
-            return True
-        return False
+        return new_status in self.valid_transitions.get(self.status, [])
+
+    @classmethod
+    def statuses_leading_to(cls, new_status):
+        return [status for status, targets in cls.valid_transitions.items() if new_status in targets]
+
+    def save_checkpoint(self, **fields):
+        """Persist finished stage outputs while the job is still processing.
+
+        Writes only the given fields and updated_at, so a retried task can
+        resume after the last completed stage, and renews the job's claim
+        lease. Returns False if the job is no longer processing.
+        """
+        now = timezone.now()
+        with timed('jobs_db_write_duration_seconds', operation='save_checkpoint'):
+            updated = Job.objects.filter(
+                event_id=self.event_id,
+                status=JobStatus.PROCESSING.value,
+            ).update(updated_at=now, **fields)
+        if not updated:
+            return False
+
+        self.updated_at = now
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+    def status_changed(self, new_status):
+        get_status_cache().delete(str(self.event_id))
+        publish_job_event(self.event_id, new_status)
+
+    def set_status(self, new_status, **fields):
+        """Atomically move the job to new_status, writing only status, updated_at and fields.
+
+        The transition is a single conditional UPDATE guarded by the stored
+        status, so concurrent or duplicate task runs cannot both win it.
+        Moving to processing also claims a processing job whose lease ran
+        out, so a job whose worker died can be taken over by another task.
+        Returns True if this call made the transition.
+        """
+        now = timezone.now()
+        condition = models.Q(status__in=self.statuses_leading_to(new_status))
+        if new_status == JobStatus.PROCESSING.value:
+            # Stages write updated_at as they finish, so an old one means nobody is working on the job
+            condition |= models.Q(
+                status=JobStatus.PROCESSING.value,
+                updated_at__lt=now - timedelta(seconds=settings.JOB_CLAIM_LEASE),
+            )
+        claimed_pending = self.is_pending()
+        with timed('jobs_db_write_duration_seconds', operation='set_status'):
+            updated = Job.objects.filter(condition, event_id=self.event_id).update(
+                status=new_status, updated_at=now, **fields,
+            )
+        if not updated:
+            return False
+
+        inc('jobs_status_transitions_total', status=new_status)
+        if claimed_pending and new_status == JobStatus.PROCESSING.value and 'created_at' not in self.get_deferred_fields():
+            observe('jobs_queue_wait_seconds', (now - self.created_at).total_seconds())
+
+        self.status = new_status
+        self.updated_at = now
+        for name, value in fields.items():
+            setattr(self, name, value)
+        # Invalidate and notify once the write is visible, so nobody re-reads the old row
+        transaction.on_commit(lambda: self.status_changed(new_status))
+        return True
+
+
+class JobArchive(models.Model):
+    """A finished job moved out of the jobs table, see jobs/archive.py.
+
+    The result columns are kept as one gzip-compressed JSON document. The
+    table is partitioned by month of created_at, with a primary key of
+    (event_id, created_at), so it is created by raw SQL in its migration
+    rather than managed by Django.
+    """
+
+    event_id = models.UUIDField(primary_key=True)
+    status = models.CharField(max_length=20, choices=JobStatus.choices())
+    priority = models.CharField(max_length=20, choices=JobPriority.choices())
+    tenant = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    payload = models.BinaryField()
+
+    class Meta:
+        managed = False
+        db_table = 'jobs_archive'
+
+    def __str__(self):
+        return f"Archived job {self.event_id} - {self.status}"
+
+    @classmethod
+    def from_job(cls, job):
+        results = {field: getattr(job, field) for field in RESULT_FIELDS}
+        return cls(
+            event_id=job.event_id,
+            status=job.status,
+            priority=job.priority,
+            tenant=job.tenant,
+            created_at=job.created_at,
+            updated_at=job.updated_at,
+            payload=gzip.compress(json.dumps(results).encode('utf-8')),
+        )
+
+    def results(self):
+        return json.loads(gzip.decompress(bytes(self.payload)))
+
+    def to_job(self):
+        """Unsaved Job with the archived fields, for serving status reads"""
+        return Job(
+            event_id=self.event_id,
+            status=self.status,
+            priority=self.priority,
+            tenant=self.tenant,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            **self.results(),
+        )
+
+
+class OutputDictionary(models.Model):
+    """A zlib preset dictionary for the result columns, see jobs/compression.py.
+
+    Kept in the database rather than on disk so every web and worker host can
+    decode the rows that reference it. Compressed values store the id in two
+    bytes. Rows are never deleted while jobs use them.
+    """
+
+    id = models.PositiveSmallIntegerField(primary_key=True)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'jobs_output_dictionaries'
+
+    def __str__(self):
+        return f"Output dictionary {self.id}"
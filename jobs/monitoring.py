@@ -0,0 +1,116 @@
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+from .lanes import get_scheduler
+from .redis_client import get_redis
+
+
+class WorkerStatusCache:
+    """Cached result of the Celery worker inspection.
+
+    The inspect broadcast waits on every worker, so it is only made on the
+    first request. After that callers get the last snapshot immediately and a
+    stale snapshot is refreshed by a background thread.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._snapshot = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._snapshot is None:
+            self.refresh()
+        elif time.monotonic() - self._fetched_at > self.ttl:
+            with self._lock:
+                if self._refreshing:
+                    return self._snapshot
+                self._refreshing = True
+            threading.Thread(target=self.refresh, name='worker-status-refresh', daemon=True).start()
+        return self._snapshot
+
+    def refresh(self):
+        try:
+            snapshot = inspect_workers()
+            with self._lock:
+                self._snapshot = snapshot
+                self._fetched_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+
+def inspect_workers():
+    """Ask the Celery workers which of them are registered"""
+    try:
+        from jobapi.celery import app
+        registered_workers = app.control.inspect().registered()
+        worker_count = len(registered_workers) if registered_workers else 0
+    except Exception:
+        worker_count = 0
+    return {
+        'worker_count': worker_count,
+        'celery_connected': worker_count > 0,
+    }
+
+
+class BrokerHealthCache:
+    """Broker ping, queue depths and lane stats, fetched at most once per ``ttl`` seconds.
+
+    Dashboard requests within the window share one snapshot, so a busy
+    dashboard costs Redis one pipelined round trip per window rather than
+    several commands per request. A failure is cached for the same window
+    so an unreachable Redis is not retried by every request.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._snapshot = None
+        self._error = None
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._fetched_at is not None and time.monotonic() - self._fetched_at < self.ttl:
+                if self._error is not None:
+                    raise self._error
+                return self._snapshot
+        try:
+            snapshot = fetch_broker_health(get_redis())
+        except redis.RedisError as e:
+            self._store(None, e)
+            raise
+        self._store(snapshot, None)
+        return snapshot
+
+    def _store(self, snapshot, error):
+        with self._lock:
+            self._snapshot = snapshot
+            self._error = error
+            self._fetched_at = time.monotonic()
+
+
+def fetch_broker_health(client):
+    """Ping Redis and read the Celery queue and stage queue depths in one round trip"""
+    from jobapi.celery import PIPELINE_STAGE_QUEUES
+    pipe = client.pipeline(transaction=False)
+    pipe.ping()
+    pipe.llen('celery')
+    for spec in PIPELINE_STAGE_QUEUES.values():
+        pipe.llen(spec['queue'])
+    replies = pipe.execute()
+    return {
+        'redis_connected': replies[0],
+        'queue_length': replies[1],
+        'stage_queue_lengths': dict(zip(PIPELINE_STAGE_QUEUES, replies[2:])),
+        'lanes': get_scheduler().lane_stats(),
+    }
+
+
+worker_status = WorkerStatusCache(ttl=settings.QUEUE_STATUS_WORKER_TTL)
+broker_health = BrokerHealthCache(ttl=settings.REDIS_HEALTH_CACHE_TTL)
@@ -0,0 +1,57 @@
+GPT_MODEL = "gpt-4o"
+
+SUMMARY_INSTRUCTIONS = "You are an expert at summarizing guidelines and best practices. Create a concise summary of key guidelines for web development and project management."
+
+SUMMARY_INPUT = "Please provide a comprehensive summary of web development guidelines, include accessibility, security, performance, and deployment practices."
+
+CHECKLIST_INSTRUCTIONS = "You are an expert at creating actionable checklists. Convert guidelines and summaries into clear, actionable checklist items."
+
+DIAGRAM_INSTRUCTIONS = """You are an expert at creating Mermaid diagrams. Generate a flowchart that visualizes the workflow or process described in the summary and checklist.
+
+            IMPORTANT: Return ONLY the raw Mermaid syntax, no markdown formatting, no ```mermaid or ``` blocks.
+
+            Use Mermaid syntax and create a clear, professional diagram that shows:
+            - Main process steps
+            - Decision points
+            - Key activities from the checklist
+
+            Example format:
+            flowchart TD
+                A[Start] --> B[Process]
+                B --> C[End]
+
+            Return ONLY the Mermaid code, no explanations or markdown formatting."""
+
+
+def checklist_input(summary):
+    """Build the checklist prompt for a summary"""
+    return f"Based on this summary of guidelines:\n\n{summary}\n\nPlease create a comprehensive checklist of actionable items that teams should follow. Format as a numbered list with clear, specific tasks."
+
+
+def diagram_input(summary, checklist):
+    """Build the Mermaid diagram prompt for a summary and checklist"""
+    return f"""Based on this summary and checklist, create a Mermaid flowchart:
+
+                    SUMMARY:
+                    {summary}
+
+                    CHECKLIST:
+                    {checklist}
+
+                Generate a Mermaid flowchart that visualizes this workflow. Return ONLY the raw Mermaid syntax without any markdown formatting or code blocks.
+                IMPORTANT: Return ONLY the raw Mermaid syntax, no markdown formatting, no ```mermaid or ``` blocks."""
+
+
+def clean_mermaid_diagram(diagram_code):
+    """Strip markdown code fences the model adds despite instructions"""
+    diagram_code = diagram_code.strip()
+
+    if diagram_code.startswith('```mermaid'):
+        diagram_code = diagram_code[10:]
+    elif diagram_code.startswith('```'):
+        diagram_code = diagram_code[3:]
+
+    if diagram_code.endswith('```'):
+        diagram_code = diagram_code[:-3]
+
+    return diagram_code.strip()
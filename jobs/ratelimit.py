@@ -0,0 +1,297 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+
+import openai
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .redis_client import get_redis
+
+
+class RateLimitTimeout(Exception):
+    """Raised when an upstream call could not get capacity within LLM_RATE_LIMIT_MAX_WAIT"""
+
+
+# Failures that mean the upstream is overloaded or unreachable, they back off the concurrency
+# limit like a 429 does. APITimeoutError is a subclass of APIConnectionError.
+CONGESTION_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+
+def estimate_tokens(*texts):
+    """Rough token count of prompt or output text, about four characters per token"""
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+class UpstreamLimiter:
+    """Rate and concurrency limits for one model, shared by every worker through Redis.
+
+    Two token buckets, requests per minute and tokens per minute, refill
+    continuously and are checked and debited in one script. A call reserves
+    its estimated tokens up front and settles the difference once the output
+    is known. The concurrency limit adapts AIMD-style: each call that finishes
+    under ``target_latency`` raises it by ``increase / limit``, so it grows by
+    about ``increase`` per round of calls, while a 429 or a slow call cuts it
+    by ``decrease`` at most once per ``cooldown`` seconds. In-flight calls are
+    leases with an expiry so a crashed worker cannot hold a slot forever.
+    Redis errors let calls through, so the limiter can never fail a job.
+    """
+
+    # Refill both buckets, then debit them if the request and its tokens fit.
+    # Returns the seconds to wait before retrying, '0' when the reservation was made.
+    RESERVE_SCRIPT = """
+        local now, rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local cost = math.min(tonumber(ARGV[4]), tpm)
+        local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts')
+        local elapsed = math.max(now - (tonumber(state[3]) or now), 0)
+        local requests = math.min(rpm, (tonumber(state[1]) or rpm) + elapsed * rpm / 60)
+        local tokens = math.min(tpm, (tonumber(state[2]) or tpm) + elapsed * tpm / 60)
+        local wait = 0
+        if requests < 1 then
+            wait = (1 - requests) * 60 / rpm
+        end
+        if tokens < cost then
+            wait = math.max(wait, (cost - tokens) * 60 / tpm)
+        end
+        if wait == 0 then
+            requests = requests - 1
+            tokens = tokens - cost
+        end
+        redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', KEYS[1], 120)
+        return tostring(wait)
+    """
+
+    # Drop expired leases and take a slot if fewer than the current limit are in flight
+    ACQUIRE_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+        local limit = tonumber(redis.call('HGET', KEYS[2], 'limit') or ARGV[4])
+        if redis.call('ZCARD', KEYS[1]) < math.floor(limit) then
+            redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[2])
+            redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+            return 1
+        end
+        return 0
+    """
+
+    # Free a slot and apply the AIMD update for its outcome, returns the new limit.
+    # ARGV[3] is '1' when congested, '0' when not and '' to leave the limit alone.
+    RELEASE_SCRIPT = """
+        local now, congested = tonumber(ARGV[2]), ARGV[3] == '1'
+        local minimum, maximum = tonumber(ARGV[4]), tonumber(ARGV[5])
+        redis.call('ZREM', KEYS[1], ARGV[1])
+        local limit = tonumber(redis.call('HGET', KEYS[2], 'limit') or ARGV[9])
+        if ARGV[3] == '' then
+            return tostring(limit)
+        end
+        if congested then
+            local decreased_at = tonumber(redis.call('HGET', KEYS[2], 'decreased_at') or 0)
+            if now - decreased_at >= tonumber(ARGV[8]) then
+                limit = math.max(minimum, limit * tonumber(ARGV[7]))
+                redis.call('HSET', KEYS[2], 'decreased_at', now)
+            end
+        else
+            limit = math.min(maximum, limit + tonumber(ARGV[6]) / limit)
+        end
+        redis.call('HSET', KEYS[2], 'limit', limit)
+        return tostring(limit)
+    """
+
+    def __init__(self, model, rpm=None, tpm=None, min_concurrency=None, max_concurrency=None, initial_concurrency=None,
+                 target_latency=None, increase=1.0, decrease=0.5, cooldown=None, lease_ttl=None, client=None):
+        self.model = model
+        self.rpm = rpm or settings.LLM_RATE_LIMIT_RPM
+        self.tpm = tpm or settings.LLM_RATE_LIMIT_TPM
+        self.min_concurrency = min_concurrency or settings.LLM_CONCURRENCY_MIN
+        self.max_concurrency = max_concurrency or settings.LLM_CONCURRENCY_MAX
+        self.initial_concurrency = initial_concurrency or settings.LLM_CONCURRENCY_INITIAL
+        self.target_latency = target_latency or settings.LLM_CONCURRENCY_TARGET_LATENCY
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = settings.LLM_CONCURRENCY_COOLDOWN if cooldown is None else cooldown
+        self.lease_ttl = lease_ttl or settings.LLM_CONCURRENCY_LEASE_TTL
+        self._client = client
+        self._scripts = {}
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    def _run(self, name, keys, args):
+        if name not in self._scripts:
+            self._scripts[name] = self.client.register_script(getattr(self, f'{name}_SCRIPT'))
+        return self._scripts[name](keys=keys, args=args, client=self.client)
+
+    @property
+    def _bucket_key(self):
+        return f'llm:ratelimit:{self.model}'
+
+    @property
+    def _concurrency_keys(self):
+        return [f'llm:concurrency:{self.model}:leases', f'llm:concurrency:{self.model}']
+
+    def reserve(self, tokens):
+        """Take one request and ``tokens`` from the buckets, returns the seconds to wait if they are empty"""
+        try:
+            return float(self._run('RESERVE', [self._bucket_key], [time.time(), self.rpm, self.tpm, tokens]))
+        except redis.RedisError:
+            return 0.0
+
+    def settle(self, estimated, actual):
+        """Charge or refund the difference between the reserved and the actual tokens"""
+        try:
+            self.client.hincrbyfloat(self._bucket_key, 'tokens', estimated - actual)
+        except redis.RedisError:
+            pass
+
+    def try_acquire(self, lease):
+        """Take a concurrency slot for the lease, returns False when the limit is reached"""
+        try:
+            return bool(self._run('ACQUIRE', self._concurrency_keys, [
+                time.time(), lease, self.lease_ttl, self.initial_concurrency,
+            ]))
+        except redis.RedisError:
+            return True
+
+    def release(self, lease, latency=None, throttled=False, adjust=True):
+        """Free the lease's slot, backing off on a 429 or a call slower than target_latency.
+
+        With adjust=False the slot is freed and the limit left unchanged, for
+        calls whose outcome says nothing about upstream capacity.
+        """
+        congested = throttled or (latency is not None and latency > self.target_latency)
+        outcome = ('1' if congested else '0') if adjust else ''
+        try:
+            self._run('RELEASE', self._concurrency_keys, [
+                lease, time.time(), outcome, self.min_concurrency, self.max_concurrency,
+                self.increase, self.decrease, self.cooldown, self.initial_concurrency,
+            ])
+        except redis.RedisError:
+            pass
+
+    def concurrency_limit(self):
+        try:
+            limit = self.client.hget(self._concurrency_keys[1], 'limit')
+        except redis.RedisError:
+            limit = None
+        return self.initial_concurrency if limit is None else float(limit)
+
+    def acquire(self, tokens):
+        """Block until a rate reservation and a concurrency slot are held, returns the lease"""
+        deadline = time.monotonic() + settings.LLM_RATE_LIMIT_MAX_WAIT
+        while (wait := self.reserve(tokens)) > 0:
+            self._sleep_until(deadline, wait)
+        lease = uuid.uuid4().hex
+        while not self.try_acquire(lease):
+            self._sleep_until(deadline, poll_interval())
+        return lease
+
+    async def aacquire(self, tokens):
+        """Async counterpart of acquire, waiting without blocking the event loop"""
+        deadline = time.monotonic() + settings.LLM_RATE_LIMIT_MAX_WAIT
+        while (wait := await asyncio.to_thread(self.reserve, tokens)) > 0:
+            await asyncio.sleep(self._wait_until(deadline, wait))
+        lease = uuid.uuid4().hex
+        while not await asyncio.to_thread(self.try_acquire, lease):
+            await asyncio.sleep(self._wait_until(deadline, poll_interval()))
+        return lease
+
+    def _wait_until(self, deadline, wait):
+        if time.monotonic() + wait > deadline:
+            raise RateLimitTimeout(f"No upstream capacity for {self.model} within {settings.LLM_RATE_LIMIT_MAX_WAIT}s")
+        return wait
+
+    def _sleep_until(self, deadline, wait):
+        time.sleep(self._wait_until(deadline, wait))
+
+
+def poll_interval():
+    # Jittered so waiting workers do not retry in lockstep
+    return random.uniform(0.05, 0.15)
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait after a 429, honouring Retry-After when the API sends it"""
+    retry_after = error.response.headers.get('retry-after') if error.response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 30) * random.uniform(0.5, 1.5)
+
+
+def limited_call(model, tokens, call):
+    """Run call() under the model's limits, retrying 429s, and return its output text"""
+    if not settings.LLM_RATE_LIMIT_ENABLED:
+        return call()
+    limiter = get_limiter(model)
+    for attempt in range(settings.LLM_RATE_LIMIT_MAX_RETRIES + 1):
+        lease = limiter.acquire(tokens)
+        started = time.monotonic()
+        try:
+            output_text = call()
+        except openai.RateLimitError as e:
+            limiter.release(lease, throttled=True)
+            if attempt == settings.LLM_RATE_LIMIT_MAX_RETRIES:
+                raise
+            time.sleep(retry_delay(e, attempt))
+            continue
+        except CONGESTION_ERRORS:
+            limiter.release(lease, throttled=True)
+            raise
+        except Exception:
+            limiter.release(lease, adjust=False)
+            raise
+        limiter.release(lease, latency=time.monotonic() - started)
+        limiter.settle(tokens, tokens + estimate_tokens(output_text))
+        return output_text
+
+
+async def alimited_call(model, tokens, call):
+    """Async counterpart of limited_call for a coroutine function"""
+    if not settings.LLM_RATE_LIMIT_ENABLED:
+        return await call()
+    limiter = get_limiter(model)
+    for attempt in range(settings.LLM_RATE_LIMIT_MAX_RETRIES + 1):
+        lease = await limiter.aacquire(tokens)
+        started = time.monotonic()
+        try:
+            output_text = await call()
+        except openai.RateLimitError as e:
+            await asyncio.to_thread(limiter.release, lease, throttled=True)
+            if attempt == settings.LLM_RATE_LIMIT_MAX_RETRIES:
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
+            continue
+        except CONGESTION_ERRORS:
+            await asyncio.to_thread(limiter.release, lease, throttled=True)
+            raise
+        except Exception:
+            await asyncio.to_thread(limiter.release, lease, adjust=False)
+            raise
+        await asyncio.to_thread(limiter.release, lease, latency=time.monotonic() - started)
+        await asyncio.to_thread(limiter.settle, tokens, tokens + estimate_tokens(output_text))
+        return output_text
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model):
+    """Return this process's limiter for a model"""
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = UpstreamLimiter(model)
+        return _limiters[model]
+
+
+@receiver(setting_changed)
+def reset_limiters(setting, **kwargs):
+    if setting.startswith('LLM_RATE_LIMIT_') or setting.startswith('LLM_CONCURRENCY_'):
+        with _limiters_lock:
+            _limiters.clear()
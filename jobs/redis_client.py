@@ -0,0 +1,52 @@
+import threading
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_pool = None
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis_pool():
+    """Return the process-wide connection pool for settings.REDIS_URL.
+
+    Every Redis user in the process shares it, so connections are opened once
+    and reused instead of per request. The pool blocks for up to
+    REDIS_POOL_TIMEOUT seconds when all REDIS_MAX_CONNECTIONS are in use
+    rather than opening more. redis-py discards a pool's connections in a
+    forked child, so Celery worker processes each get their own.
+    """
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = redis.BlockingConnectionPool.from_url(
+                    settings.REDIS_URL,
+                    max_connections=settings.REDIS_MAX_CONNECTIONS,
+                    timeout=settings.REDIS_POOL_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+                    health_check_interval=30,
+                )
+    return _pool
+
+
+def get_redis():
+    """Return the process-wide Redis client for settings.REDIS_URL"""
+    global _client
+    if _client is None:
+        _client = redis.Redis(connection_pool=get_redis_pool())
+    return _client
+
+
+@receiver(setting_changed)
+def reset_redis(setting, **kwargs):
+    global _pool, _client
+    if setting.startswith('REDIS_'):
+        with _lock:
+            if _pool is not None:
+                _pool.disconnect()
+            _pool = None
+            _client = None
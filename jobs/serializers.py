@@ -1,14 +1,24 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Job
+from .models import RESULT_FIELDS, Job, JobPriority, JobStatus
 
 
 class JobCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Job
-        fields = ['event_id']
+        fields = ['event_id', 'priority', 'tenant']
         read_only_fields = ['event_id']
 
 
+class JobBatchCreateSerializer(serializers.Serializer):
+    jobs = JobCreateSerializer(many=True, allow_empty=False)
+
+    def validate_jobs(self, value):
+        if len(value) > settings.JOB_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(f"A batch may contain at most {settings.JOB_BATCH_MAX_SIZE} jobs.")
+        return value
+
+
 class JobDetailSerializer(serializers.ModelSerializer):
     result = serializers.SerializerMethodField()
 
@@ -19,3 +29,79 @@ class JobDetailSerializer(serializers.ModelSerializer):
 
     def get_result(self, obj):
         return obj.result
+
+
+class JobListSerializer(JobDetailSerializer):
+    """Job listing entry limited to the requested fields"""
+
+    class Meta(JobDetailSerializer.Meta):
+        fields = ['event_id', 'status', 'priority', 'tenant', 'created_at', 'updated_at', 'result']
+        read_only_fields = fields
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @staticmethod
+    def columns(fields):
+        """Columns to load for the requested fields, the wide result columns only when result is asked for"""
+        columns = {'event_id', 'created_at', 'status'} | (set(fields) - {'result'})
+        if 'result' in fields:
+            columns.update(RESULT_FIELDS)
+        return sorted(columns)
+
+
+class CommaSeparatedField(serializers.ListField):
+    """List given as one comma-separated query parameter"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) == 1:
+            data = data[0]
+        if isinstance(data, str):
+            data = [item.strip() for item in data.split(',') if item.strip()]
+        return super().to_internal_value(data)
+
+
+class JobListQuerySerializer(serializers.Serializer):
+    status = CommaSeparatedField(child=serializers.ChoiceField(choices=JobStatus.values()), required=False)
+    priority = serializers.ChoiceField(choices=JobPriority.values(), required=False)
+    tenant = serializers.CharField(required=False, allow_blank=True)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    fields = CommaSeparatedField(
+        child=serializers.ChoiceField(choices=JobListSerializer.Meta.fields), required=False, allow_empty=False,
+    )
+    limit = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_limit(self, value):
+        return min(value, settings.JOB_LIST_MAX_PAGE_SIZE)
+
+    def filter(self, queryset):
+        """Apply the validated filters to a Job queryset"""
+        data = self.validated_data
+        if 'status' in data:
+            queryset = queryset.filter(status__in=data['status'])
+        if 'priority' in data:
+            queryset = queryset.filter(priority=data['priority'])
+        if 'tenant' in data:
+            queryset = queryset.filter(tenant=data['tenant'])
+        if 'created_after' in data:
+            queryset = queryset.filter(created_at__gte=data['created_after'])
+        if 'created_before' in data:
+            queryset = queryset.filter(created_at__lt=data['created_before'])
+        return queryset
+
+
+class JobStatusLookupSerializer(serializers.Serializer):
+    event_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    fields = serializers.ListField(
+        child=serializers.ChoiceField(choices=JobDetailSerializer.Meta.fields), required=False, allow_empty=False,
+    )
+
+    def validate_event_ids(self, value):
+        if len(value) > settings.JOB_STATUS_LOOKUP_MAX_IDS:
+            raise serializers.ValidationError(f"A lookup may contain at most {settings.JOB_STATUS_LOOKUP_MAX_IDS} event_ids.")
+        # Repeated ids are answered once, in the order they were first given
+        return list(dict.fromkeys(str(event_id) for event_id in value))
@@ -0,0 +1,90 @@
+import time
+
+import redis
+from django.conf import settings
+
+from .redis_client import get_redis
+
+OUTPUT_PREFIX = 'jobs:output:'
+STAGES = ('summary', 'checklist', 'diagram')
+
+
+def stage_output_key(event_id, stage):
+    return f'{OUTPUT_PREFIX}{event_id}:{stage}'
+
+
+class StageOutput:
+    """Partial output of one GPT stage of a job, mirrored to Redis while it streams.
+
+    Deltas are buffered in memory and written with one APPEND at most every
+    ``flush_interval`` seconds, so readers see tokens early without a Redis
+    round trip per token. The first flush overwrites any output left by an
+    earlier attempt. Redis errors are ignored so streaming can never fail a job.
+    """
+
+    def __init__(self, event_id, stage, flush_interval=None, ttl=None, client=None):
+        self.key = stage_output_key(event_id, stage)
+        self.flush_interval = settings.LLM_STREAM_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.ttl = ttl or settings.LLM_STREAM_TTL
+        self._client = client
+        self._chunks = []
+        self._flushed = 0
+        self._flushed_at = time.monotonic()
+
+    @property
+    def client(self):
+        return self._client or get_redis()
+
+    @property
+    def text(self):
+        return ''.join(self._chunks)
+
+    def write(self, delta):
+        """Buffer a delta, returns True once a flush is due"""
+        self._chunks.append(delta)
+        return time.monotonic() - self._flushed_at >= self.flush_interval
+
+    def flush(self):
+        """Write the deltas buffered since the last flush"""
+        self._flushed_at = time.monotonic()
+        if self._flushed == len(self._chunks):
+            return
+        chunk = ''.join(self._chunks[self._flushed:])
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            if self._flushed:
+                pipe.append(self.key, chunk)
+                pipe.expire(self.key, self.ttl)
+            else:
+                pipe.set(self.key, chunk, ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError:
+            return
+        self._flushed = len(self._chunks)
+
+    def reset(self):
+        """Drop buffered deltas so a retried call overwrites the output of the failed one"""
+        self._chunks = []
+        self._flushed = 0
+
+    def replace(self, text):
+        """Store a complete output at once, used when the stage is served from the stage cache"""
+        self.reset()
+        self._chunks.append(text)
+        self.flush()
+
+
+def stage_output(event_id, stage):
+    """Return the StageOutput for a job stage, or None when streaming is disabled"""
+    if not settings.LLM_STREAM_OUTPUT:
+        return None
+    return StageOutput(event_id, stage)
+
+
+def read_job_output(event_id):
+    """Output streamed so far by each stage of a job, None for stages that have not started"""
+    try:
+        values = get_redis().mget([stage_output_key(event_id, stage) for stage in STAGES])
+    except redis.RedisError:
+        values = [None] * len(STAGES)
+    return {stage: None if value is None else value.decode() for stage, value in zip(STAGES, values)}
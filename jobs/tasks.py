@@ -1,129 +1,390 @@
-from openai import OpenAI
-from celery import shared_task
+import random
+
+import redis
+from celery import chain, group, shared_task
+from celery.exceptions import Ignore
 from django.conf import settings
+from .archive import archive_jobs, drop_expired_partitions
+from .cache import get_stage_cache, make_cache_key
+from .executor import get_executor
+from .lanes import get_scheduler, next_job
+from .llm import get_llm_client
+from .metrics import instrument_stage, record_usage
 from .models import Job, JobStatus
+from .ratelimit import estimate_tokens, limited_call
+from .prompts import (
+    CHECKLIST_INSTRUCTIONS,
+    DIAGRAM_INSTRUCTIONS,
+    GPT_MODEL,
+    SUMMARY_INPUT,
+    SUMMARY_INSTRUCTIONS,
+    checklist_input,
+    clean_mermaid_diagram,
+    diagram_input,
+)
+from .streaming import STAGES, stage_output
 
+# Stages whose output is written to the job before the last stage completes it
+CHECKPOINTED_STAGES = STAGES[:-1]
 
-@shared_task(bind=True)
-def process_guideline_ingest(self, event_id):
-    """Process job with three-step GPT chain: summary → checklist → diagram"""
-    try:
-        job = Job.objects.get(event_id=event_id)
-        job.set_status(JobStatus.PROCESSING.value)
-
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-        summary = generate_guideline_summary(client)
-        if summary.startswith("Error"):
-            job.set_status(JobStatus.FAILED.value)
-            job.error_message = summary
-            job.save()
-            return f"Job {event_id} failed: {summary}"
-
-        checklist = generate_checklist_from_summary(client, summary)
-        if checklist.startswith("Error"):
-            job.set_status(JobStatus.FAILED.value)
-            job.error_message = checklist
-            job.save()
-            return f"Job {event_id} failed: {checklist}"
-
-        diagram = generate_mermaid_diagram(client, summary, checklist)
-        if diagram.startswith("Error"):
-            job.set_status(JobStatus.FAILED.value)
-            job.error_message = diagram
-            job.save()
-            return f"Job {event_id} failed: {diagram}"
-
-        job.summary = summary
-        job.checklist = checklist
-        job.diagram = diagram
-        job.set_status(JobStatus.COMPLETED.value)
 
-        return f"Job {event_id} completed successfully"
+# Pipeline tasks are acknowledged once they finish, and requeued if their worker process dies,
+# so a crash redelivers the job instead of dropping it. Redelivered tasks take over the job
+# once its claim lease has run out, see Job.set_status and recover_stale_jobs.
+PIPELINE_TASK_OPTIONS = {'bind': True, 'acks_late': True, 'reject_on_worker_lost': True}
 
+
+@shared_task(**PIPELINE_TASK_OPTIONS)
+def process_guideline_ingest(self, event_id=None):
+    """Process job with three-step GPT chain: summary → checklist → diagram.
+
+    Each stage's output is checkpointed on the job as soon as it finishes. A
+    failed stage is retried by Celery with exponential backoff and full jitter,
+    up to PIPELINE_MAX_RETRIES times, and the retry resumes at the first stage
+    without a checkpoint. The job is only marked failed once retries run out.
+    Without an event_id the task takes the next job from the priority lanes.
+    """
+    if event_id is None:
+        event_id = next_job()
+        if event_id is None:
+            return "No job waiting"
+    try:
+        job = Job.objects.only('event_id', 'status', 'created_at', 'summary', 'checklist').get(event_id=event_id)
     except Job.DoesNotExist:
         return f"Job {event_id} not found"
-    except Exception as e:
-        try:
-            job = Job.objects.get(event_id=event_id)
-            job.set_status(JobStatus.FAILED.value)
-            job.error_message = str(e)
-            job.save()
-        except Job.DoesNotExist:
-            pass
-        return f"Job {event_id} failed: {str(e)}"
 
+    if not claim_job(self, job):
+        return f"Job {event_id} skipped: not pending"
 
-def generate_guideline_summary(client):
-    """Generate a summary of guidelines using GPT-4o"""
     try:
-        response = client.responses.create(
-            model="gpt-4o",
-            instructions="You are an expert at summarizing guidelines and best practices. Create a concise summary of key guidelines for web development and project management.",
-            input="Please provide a comprehensive summary of web development guidelines, include accessibility, security, performance, and deployment practices.",
-        )
-        return response.output_text
+        error = run_pipeline_stages(job, get_llm_client())
     except Exception as e:
-        return f"Error generating summary: {str(e)}"
+        error = str(e)
+    if error is None:
+        return f"Job {event_id} completed successfully"
 
+    retry_or_fail(self, job, error)
+    return f"Job {event_id} failed: {error}"
 
-def generate_checklist_from_summary(client, summary):
-    """Generate a checklist based on the summary using GPT-4o"""
+
+@shared_task(**PIPELINE_TASK_OPTIONS)
+def run_summary_stage(self, event_id=None, continue_chain=False):
+    """First task of the chained pipeline, claims the job.
+
+    Without an event_id the task takes the next job from the priority lanes
+    and sends the rest of the chain itself once the summary is done.
+    """
+    if event_id is None:
+        event_id = next_job()
+        if event_id is None:
+            return "No job waiting"
+        continue_chain = True
+    return run_stage_task(self, event_id, 'summary', continue_chain=continue_chain)
+
+
+@shared_task(**PIPELINE_TASK_OPTIONS)
+def run_checklist_stage(self, event_id):
+    return run_stage_task(self, event_id, 'checklist')
+
+
+@shared_task(**PIPELINE_TASK_OPTIONS)
+def run_diagram_stage(self, event_id):
+    """Last task of the chained pipeline, completes the job"""
+    return run_stage_task(self, event_id, 'diagram')
+
+
+STAGE_TASKS = {
+    'summary': run_summary_stage,
+    'checklist': run_checklist_stage,
+    'diagram': run_diagram_stage,
+}
+
+
+def pipeline_chain(event_id, stages=STAGES):
+    """The pipeline as a chain of per-stage tasks, each routed to its stage queue"""
+    event_id = str(event_id)
+    return chain(*(STAGE_TASKS[stage].si(event_id) for stage in stages))
+
+
+def pipeline_task():
+    """Task that starts the pipeline with the configured PIPELINE_EXECUTOR"""
+    if settings.PIPELINE_EXECUTOR == 'chain':
+        return run_summary_stage
+    return process_guideline_ingest_async if settings.PIPELINE_EXECUTOR == 'async' else process_guideline_ingest
+
+
+def pipeline_signature(event_id):
+    """Signature that processes a job with the configured PIPELINE_EXECUTOR"""
+    if settings.PIPELINE_EXECUTOR == 'chain':
+        return pipeline_chain(event_id)
+    return pipeline_task().s(str(event_id))
+
+
+def run_stage_task(task, event_id, stage, continue_chain=False):
+    """Run one stage of the chained pipeline for a job.
+
+    A stage whose output is already checkpointed is skipped. When the job
+    cannot run this stage, because a duplicate delivery already claimed it or
+    an earlier stage failed, the task is ignored so the rest of the chain is
+    not sent. With continue_chain the following stages are sent by this task.
+    """
     try:
-        response = client.responses.create(
-            model="gpt-4o",
-            instructions="You are an expert at creating actionable checklists. Convert guidelines and summaries into clear, actionable checklist items.",
-            input=f"Based on this summary of guidelines:\n\n{summary}\n\nPlease create a comprehensive checklist of actionable items that teams should follow. Format as a numbered list with clear, specific tasks.",
-        )
-        return response.output_text
+        job = Job.objects.only('event_id', 'status', 'created_at', 'summary', 'checklist').get(event_id=event_id)
+    except Job.DoesNotExist:
+        raise Ignore()
+
+    claimed = claim_job(task, job) if stage == STAGES[0] else job.is_processing()
+    if not claimed:
+        raise Ignore()
+    if stage in CHECKPOINTED_STAGES and getattr(job, stage):
+        continue_pipeline(event_id, stage, continue_chain)
+        return f"Job {event_id} {stage} already checkpointed"
+
+    try:
+        error = run_stage(job, get_llm_client(), stage)
     except Exception as e:
-        return f"Error generating checklist: {str(e)}"
+        error = str(e)
+    if error is None:
+        continue_pipeline(event_id, stage, continue_chain)
+        return f"Job {event_id} {stage} completed"
 
+    retry_or_fail(task, job, error, **({'continue_chain': True} if continue_chain else {}))
+    return f"Job {event_id} failed: {error}"
 
-def generate_mermaid_diagram(client, summary, checklist):
-    """Generate a Mermaid diagram based on the summary and checklist"""
+
+def continue_pipeline(event_id, stage, continue_chain):
+    """Send the chain of stages after stage, when this task is responsible for it"""
+    remaining = STAGES[STAGES.index(stage) + 1:]
+    if continue_chain and remaining:
+        pipeline_chain(event_id, remaining).apply_async()
+
+
+def claim_job(task, job):
+    """Move a pending job to processing, returns False if another delivery already owns it"""
+    # Only one delivery of a task can claim a pending job, retries resume the job they claimed
+    return job.set_status(JobStatus.PROCESSING.value) or bool(task.request.retries and job.is_processing())
+
+
+def retry_or_fail(task, job, error, **kwargs):
+    """Schedule a retry of the task while retries remain, otherwise mark the job failed"""
+    retries = task.request.retries
+    if not task.request.called_directly and retries < settings.PIPELINE_MAX_RETRIES:
+        # The job is passed explicitly so a task that took it from a lane retries the same job
+        raise task.retry(
+            args=[str(job.event_id)],
+            kwargs=kwargs,
+            countdown=retry_countdown(retries),
+            max_retries=settings.PIPELINE_MAX_RETRIES,
+        )
+    job.set_status(JobStatus.FAILED.value, error_message=error)
+
+
+def run_pipeline_stages(job, client):
+    """Run the stages the job has no checkpoint for, returns the error of a failed stage or None"""
+    for stage in STAGES:
+        if stage in CHECKPOINTED_STAGES and getattr(job, stage):
+            continue
+        error = run_stage(job, client, stage)
+        if error is not None:
+            return error
+    return None
+
+
+def run_stage(job, client, stage):
+    """Run one stage and checkpoint its output, the last stage completes the job.
+
+    Returns the stage's error message, or None on success.
+    """
+    output = stage_output(job.event_id, stage)
+    if stage == 'summary':
+        text = generate_guideline_summary(client, output=output)
+    elif stage == 'checklist':
+        text = generate_checklist_from_summary(client, job.summary, output=output)
+    else:
+        text = generate_mermaid_diagram(client, job.summary, job.checklist, output=output)
+    if text.startswith("Error"):
+        return text
+
+    if stage in CHECKPOINTED_STAGES:
+        job.save_checkpoint(**{stage: text})
+    else:
+        job.set_status(JobStatus.COMPLETED.value, **{stage: text})
+    return None
+
+
+def retry_countdown(retries):
+    """Seconds before the next attempt: exponential backoff with full jitter"""
+    ceiling = min(settings.PIPELINE_RETRY_BACKOFF * 2 ** retries, settings.PIPELINE_RETRY_BACKOFF_MAX)
+    return random.uniform(0, ceiling)
+
+
+@shared_task(**PIPELINE_TASK_OPTIONS)
+def process_guideline_ingest_async(self, event_id=None):
+    """Claim the job and hand it to this worker's asyncio pipeline executor.
+
+    Returns as soon as the job is scheduled, blocking only while the executor
+    is at ASYNC_PIPELINE_MAX_JOBS, so one worker process runs many jobs at once.
+    The message is acknowledged then, so the job is claimed first: if the
+    worker dies mid-job, its expired lease lets recover_stale_jobs republish it.
+    Without an event_id the task takes the next job from the priority lanes.
+    """
+    if event_id is None:
+        event_id = next_job()
+        if event_id is None:
+            return "No job waiting"
     try:
-        response = client.responses.create(
-            model="gpt-4o",
-            instructions="""You are an expert at creating Mermaid diagrams. Generate a flowchart that visualizes the workflow or process described in the summary and checklist.
+        job = Job.objects.only('event_id', 'status', 'created_at').get(event_id=event_id)
+    except Job.DoesNotExist:
+        return f"Job {event_id} not found"
+
+    if not claim_job(self, job):
+        return f"Job {event_id} skipped: not pending"
+    get_executor().submit(event_id, claimed=True)
+    return f"Job {event_id} submitted to async executor"
+
+
+@shared_task
+def recover_stale_jobs():
+    """Periodic (Celery beat) republish of processing jobs whose worker stopped writing to them.
+
+    The new task claims the job through the expired lease and resumes after
+    its last checkpoint. Until one does, the job stays stale and is
+    republished again on the next run, extra copies find it claimed and skip.
+    """
+    stale = list(Job.objects.stale().values_list('event_id', flat=True)[:settings.JOB_RECOVERY_BATCH_SIZE])
+    if stale:
+        group(pipeline_signature(event_id) for event_id in stale).apply_async()
+    return f"Republished {len(stale)} stale jobs"
+
 
-            IMPORTANT: Return ONLY the raw Mermaid syntax, no markdown formatting, no ```mermaid or ``` blocks.
+@shared_task
+def archive_old_jobs():
+    """Periodic (Celery beat) move of finished jobs older than JOB_RETENTION_DAYS to the archive"""
+    if not settings.JOB_RETENTION_DAYS:
+        return "Archiving disabled"
+    archived = archive_jobs()
+    dropped = drop_expired_partitions()
+    return f"Archived {archived} jobs, dropped {len(dropped)} archive partitions"
 
-            Use Mermaid syntax and create a clear, professional diagram that shows:
-            - Main process steps
-            - Decision points
-            - Key activities from the checklist
 
-            Example format:
-            flowchart TD
-                A[Start] --> B[Process]
-                B --> C[End]
+def enqueue_jobs(jobs):
+    """Publish pipeline tasks for many jobs as one group over a single broker connection.
+
+    With the fair JOB_SCHEDULER the jobs wait in their Redis priority lanes
+    and every published task carries no job: the worker that runs it takes
+    whichever job is due next, so the lanes, not the broker, decide the order.
+    If the lanes cannot be written the jobs are published in arrival order.
+    If the tasks cannot be published the jobs are taken back out of the lanes
+    before the error is raised, leaving them pending as a failed FIFO publish
+    would, instead of waiting in a lane no task will ever pop.
+    """
+    if settings.JOB_SCHEDULER == 'fair':
+        scheduler = get_scheduler()
+        try:
+            entries = scheduler.push_many(jobs)
+        except redis.RedisError:
+            pass
+        else:
+            try:
+                group(pipeline_task().si() for _ in jobs).apply_async()
+            except Exception:
+                try:
+                    scheduler.remove_many(entries)
+                except redis.RedisError:
+                    pass
+                raise
+            return
+    group(pipeline_signature(job.event_id) for job in jobs).apply_async()
 
-            Return ONLY the Mermaid code, no explanations or markdown formatting.""",
 
-            input=f"""Based on this summary and checklist, create a Mermaid flowchart:
+def create_response_text(client, model, instructions, input, output=None):
+    """Return the model output for a prompt, served from the stage cache when possible.
+
+    With a StageOutput the response is streamed and its partial text flushed to
+    Redis as it arrives.
+    """
+    cache = get_stage_cache()
+    key = make_cache_key(model, instructions, input)
+    output_text = cache.get(key)
+    if output_text is None:
+        output_text = limited_call(
+            model, estimate_tokens(instructions, input),
+            lambda: fetch_response_text(client, output, model=model, instructions=instructions, input=input),
+        )
+        cache.set(key, output_text)
+    elif output is not None:
+        output.replace(output_text)
+    return output_text
 
-                    SUMMARY:
-                    {summary}
 
-                    CHECKLIST:
-                    {checklist}
+def fetch_response_text(client, output, **params):
+    """Call the model once, streaming into output when one is given"""
+    if output is None:
+        response = client.responses.create(**params)
+        record_usage(params['model'], getattr(response, 'usage', None))
+        return response.output_text
+    return stream_response_text(client, output, **params)
 
-                Generate a Mermaid flowchart that visualizes this workflow. Return ONLY the raw Mermaid syntax without any markdown formatting or code blocks.
-                IMPORTANT: Return ONLY the raw Mermaid syntax, no markdown formatting, no ```mermaid or ``` blocks.""",
+
+def stream_response_text(client, output, **params):
+    """Consume a streamed response into output and return the full text"""
+    output.reset()
+    for event in client.responses.create(stream=True, **params):
+        if event.type == 'response.output_text.delta':
+            if output.write(event.delta):
+                output.flush()
+        elif event.type == 'response.completed':
+            record_usage(params['model'], getattr(event.response, 'usage', None))
+        elif event.type == 'response.failed':
+            raise RuntimeError(event.response.error.message)
+        elif event.type == 'error':
+            raise RuntimeError(event.message)
+    output.flush()
+    return output.text
+
+
+@instrument_stage('summary')
+def generate_guideline_summary(client, output=None):
+    """Generate a summary of guidelines using GPT-4o"""
+    try:
+        return create_response_text(
+            client,
+            model=GPT_MODEL,
+            instructions=SUMMARY_INSTRUCTIONS,
+            input=SUMMARY_INPUT,
+            output=output,
         )
+    except Exception as e:
+        return f"Error generating summary: {str(e)}"
 
-        diagram_code = response.output_text.strip()
 
-        if diagram_code.startswith('```mermaid'):
-            diagram_code = diagram_code[10:]
-        elif diagram_code.startswith('```'):
-            diagram_code = diagram_code[3:]
+@instrument_stage('checklist')
+def generate_checklist_from_summary(client, summary, output=None):
+    """Generate a checklist based on the summary using GPT-4o"""
+    try:
+        return create_response_text(
+            client,
+            model=GPT_MODEL,
+            instructions=CHECKLIST_INSTRUCTIONS,
+            input=checklist_input(summary),
+            output=output,
+        )
+    except Exception as e:
+        return f"Error generating checklist: {str(e)}"
 
-        if diagram_code.endswith('```'):
-            diagram_code = diagram_code[:-3]
 
-        return diagram_code.strip()
+@instrument_stage('diagram')
+def generate_mermaid_diagram(client, summary, checklist, output=None):
+    """Generate a Mermaid diagram based on the summary and checklist"""
+    try:
+        diagram_code = create_response_text(
+            client,
+            model=GPT_MODEL,
+            instructions=DIAGRAM_INSTRUCTIONS,
+            input=diagram_input(summary, checklist),
+            output=output,
+        )
+        return clean_mermaid_diagram(diagram_code)
 
     except Exception as e:
         return f"Error generating diagram: {str(e)}"
@@ -1,11 +1,52 @@
+import asyncio
+import json
+import queue
+import threading
 import uuid
-from unittest.mock import patch, MagicMock
-from django.test import TestCase, override_settings
+from contextlib import nullcontext
+from datetime import timedelta
+from io import StringIO
+import httpx
+import openai
+import redis
+from unittest.mock import patch, MagicMock, AsyncMock
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from celery.exceptions import Retry
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import Job, JobStatus
-from .tasks import process_guideline_ingest, generate_guideline_summary, generate_checklist_from_summary, generate_mermaid_diagram
+from jobapi.celery import configure_worker_connections
+from .archive import archive_jobs, archive_partitions, drop_expired_partitions
+from .benchmark import LatencyRecorder, PipelineBenchmark, parse_mix
+from .cache import LocalLRUCache, RedisCache, get_status_cache, make_cache_key
+from .compression import (
+    MissingDictionary, check_output_dictionary, compress_text, decompress_text, load_dictionary, train_dictionary,
+)
+from .dedup import claim_inputs, find_by_idempotency_key, idempotency_key, save_unless_duplicate
+from .events import AsyncWaiter, JobEventListener
+from .executor import AsyncPipelineExecutor
+from .lanes import FairScheduler, parse_lane_weights
+from .llm import AsyncStubClient, StubClient, StubLLM, get_llm_client
+from .metrics import METRICS_KEY, MetricsMiddleware, MetricsRegistry, log_flush_error
+from .monitoring import BrokerHealthCache, WorkerStatusCache
+from .models import Job, JobArchive, JobStatus, OutputDictionary
+from .prompts import CHECKLIST_INSTRUCTIONS
+from .ratelimit import RateLimitTimeout, UpstreamLimiter, limited_call
+from .redis_client import get_redis, get_redis_pool
+from .serializers import JobCreateSerializer
+from .streaming import StageOutput
+from .tasks import (
+    process_guideline_ingest, generate_guideline_summary, generate_checklist_from_summary, generate_mermaid_diagram,
+    enqueue_jobs, pipeline_chain, pipeline_signature, process_guideline_ingest_async, recover_stale_jobs, run_checklist_stage, run_summary_stage,
+    stream_response_text,
+)
+from . import views
 
 
 class JobModelTest(TestCase):
@@ -54,6 +95,20 @@ class JobModelTest(TestCase):
         expected = {'error': 'Test error'}
         self.assertEqual(job.result, expected)
 
+    def test_status_counts_single_query(self):
+        """Test that per-status counts come from one aggregate query."""
+        Job.objects.create()
+        Job.objects.create()
+        Job.objects.create(status=JobStatus.FAILED.value)
+
+        with self.assertNumQueries(1):
+            counts = Job.objects.status_counts()
+
+        self.assertEqual(counts['total'], 3)
+        self.assertEqual(counts[JobStatus.PENDING.value], 2)
+        self.assertEqual(counts[JobStatus.FAILED.value], 1)
+        self.assertEqual(counts[JobStatus.COMPLETED.value], 0)
+
 
 class JobAPITest(APITestCase):
     """Test cases for the Job API endpoints."""
@@ -84,6 +139,49 @@ class JobAPITest(APITestCase):
             job = Job.objects.get(event_id=response.data['event_id'])
             mock_delay.assert_called_with(str(job.event_id))
 
+    def test_create_job_with_priority_and_tenant(self):
+        """Test that a job can be created in a priority lane for a tenant."""
+        url = reverse('create_job')
+        response = self.client.post(url, {'priority': 'interactive', 'tenant': 'acme'})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = Job.objects.get(event_id=response.data['event_id'])
+        self.assertEqual((job.priority, job.tenant), ('interactive', 'acme'))
+
+        response = self.client.post(url, {'priority': 'urgent'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_jobs_batch(self):
+        """Test creating several jobs in one request."""
+        url = reverse('create_jobs_batch')
+        response = self.client.post(url, {'jobs': [{}, {}, {}]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['event_ids']), 3)
+        self.assertEqual(Job.objects.filter(event_id__in=response.data['event_ids']).count(), 3)
+
+    @patch('jobs.tasks.group')
+    def test_create_jobs_batch_enqueues_one_group(self, mock_group):
+        """Test that a batch publishes its tasks as a single group."""
+        with override_settings(TESTING=False, CELERY_ALWAYS_EAGER=False):
+            url = reverse('create_jobs_batch')
+            response = self.client.post(url, {'jobs': [{}, {}]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_group.assert_called_once()
+        signatures = list(mock_group.call_args[0][0])
+        self.assertEqual([sig.args[0] for sig in signatures], [str(e) for e in response.data['event_ids']])
+        mock_group.return_value.apply_async.assert_called_once()
+
+    @override_settings(JOB_BATCH_MAX_SIZE=2)
+    def test_create_jobs_batch_rejects_invalid_batches(self):
+        """Test that empty and oversized batches are rejected."""
+        url = reverse('create_jobs_batch')
+
+        self.assertEqual(self.client.post(url, {'jobs': []}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(url, {'jobs': [{}, {}, {}]}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Job.objects.count(), 0)
+
     def test_get_job_status_pending(self):
         """Test getting status of a pending job."""
         job = Job.objects.create()
@@ -127,6 +225,28 @@ class JobAPITest(APITestCase):
         self.assertIsNotNone(response.data['result'])
         self.assertEqual(response.data['result']['error'], 'Test error')
 
+    def test_get_job_status_pending_reads_narrow_row(self):
+        """Test that polling an unfinished job does not load the result columns."""
+        job = Job.objects.create()
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('summary', queries[0]['sql'])
+
+    def test_get_job_status_completed_loads_result_once(self):
+        """Test that a finished job loads its result columns in one extra query."""
+        job = Job.objects.create(status=JobStatus.COMPLETED.value, summary='Test summary')
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertEqual(response.data['result']['summary'], 'Test summary')
+
     def test_get_nonexistent_job(self):
         """Test getting status of a job that doesn't exist."""
         fake_event_id = uuid.uuid4()
@@ -140,15 +260,15 @@ class JobAPITest(APITestCase):
 class JobTasksTest(TestCase):
     """Test cases for the Celery tasks."""
 
-    @patch('openai.OpenAI')
-    def test_process_guideline_ingest_success(self, mock_openai):
+    @patch('jobs.tasks.get_llm_client')
+    def test_process_guideline_ingest_success(self, mock_get_client):
         """Test successful processing of a guideline-ingest job."""
         # Mock OpenAI responses
         mock_client = MagicMock()
         mock_response = MagicMock()
         mock_response.output_text = "Test summary"
         mock_client.responses.create.return_value = mock_response
-        mock_openai.return_value = mock_client
+        mock_get_client.return_value = mock_client
 
         # Create a job
         job = Job.objects.create()
@@ -248,6 +368,93 @@ class JobTasksTest(TestCase):
         job.set_status(JobStatus.COMPLETED.value)
         self.assertTrue(job.is_completed())
 
+    def test_set_status_is_compare_and_set(self):
+        """Test that a stale copy cannot win a transition another worker already made."""
+        job = Job.objects.create()
+        stale = Job.objects.get(event_id=job.event_id)
+
+        self.assertTrue(job.set_status(JobStatus.PROCESSING.value))
+        self.assertFalse(stale.set_status(JobStatus.PROCESSING.value))
+        self.assertEqual(stale.status, JobStatus.PENDING.value)
+
+    @override_settings(JOB_CLAIM_LEASE=60)
+    def test_set_status_reclaims_processing_job_after_lease(self):
+        """Test that a processing job can be claimed again only once its lease has run out."""
+        job = Job.objects.create(status=JobStatus.PROCESSING.value)
+        self.assertFalse(job.set_status(JobStatus.PROCESSING.value))
+
+        Job.objects.filter(event_id=job.event_id).update(updated_at=timezone.now() - timedelta(seconds=120))
+        self.assertTrue(job.set_status(JobStatus.PROCESSING.value))
+        job.refresh_from_db()
+        self.assertGreater(job.updated_at, timezone.now() - timedelta(seconds=60))
+
+    @override_settings(JOB_CLAIM_LEASE=60)
+    @patch('jobs.tasks.group')
+    def test_recover_stale_jobs_republishes_abandoned_jobs(self, mock_group):
+        """Test that the recovery sweep republishes stale processing jobs only."""
+        stale = Job.objects.create(status=JobStatus.PROCESSING.value)
+        Job.objects.filter(event_id=stale.event_id).update(updated_at=timezone.now() - timedelta(seconds=120))
+        Job.objects.create(status=JobStatus.PROCESSING.value)
+        Job.objects.create()
+
+        self.assertEqual(recover_stale_jobs(), "Republished 1 stale jobs")
+        signatures = list(mock_group.call_args[0][0])
+        self.assertEqual([sig.args for sig in signatures], [(str(stale.event_id),)])
+        mock_group.return_value.apply_async.assert_called_once()
+
+    def test_set_status_writes_only_given_fields(self):
+        """Test that a transition updates status, updated_at and the given result fields only."""
+        job = Job.objects.create(status=JobStatus.PROCESSING.value)
+        Job.objects.filter(event_id=job.event_id).update(summary='Written elsewhere')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(job.set_status(JobStatus.FAILED.value, error_message='Test error'))
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"summary"', queries[0]['sql'])
+        job.refresh_from_db()
+        self.assertEqual(job.error_message, 'Test error')
+        self.assertEqual(job.summary, 'Written elsewhere')
+
+    def test_process_guideline_ingest_duplicate_delivery(self):
+        """Test that a second delivery of the task does not reprocess a claimed job."""
+        job = Job.objects.create(status=JobStatus.PROCESSING.value)
+        result = process_guideline_ingest(str(job.event_id))
+        self.assertIn("skipped", result)
+
+    @patch('jobs.tasks.get_llm_client')
+    @patch('jobs.tasks.generate_mermaid_diagram', return_value="Error generating diagram: Test error")
+    def test_failed_stage_is_retried_after_checkpoint(self, mock_diagram, mock_get_client):
+        """Test that a failed stage schedules a retry and keeps the finished stages."""
+        mock_get_client.return_value.responses.create.return_value.output_text = "Test output"
+        job = Job.objects.create()
+
+        with patch.object(process_guideline_ingest, 'retry', side_effect=Retry) as mock_retry:
+            process_guideline_ingest.apply(args=[str(job.event_id)])
+
+        mock_retry.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.PROCESSING.value)
+        self.assertEqual(job.summary, "Test output")
+        self.assertEqual(job.checklist, "Test output")
+
+    @patch('jobs.tasks.get_llm_client')
+    @patch('jobs.tasks.generate_checklist_from_summary')
+    @patch('jobs.tasks.generate_guideline_summary')
+    def test_retry_resumes_at_first_incomplete_stage(self, mock_summary, mock_checklist, mock_get_client):
+        """Test that a retry of a claimed job skips the checkpointed stages."""
+        mock_get_client.return_value.responses.create.return_value.output_text = "Test diagram"
+        job = Job.objects.create(status=JobStatus.PROCESSING.value, summary="Test summary", checklist="Test checklist")
+
+        result = process_guideline_ingest.apply(args=[str(job.event_id)], retries=1).get()
+
+        self.assertIn("completed", result)
+        mock_summary.assert_not_called()
+        mock_checklist.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.COMPLETED.value)
+        self.assertEqual((job.summary, job.diagram), ("Test summary", "Test diagram"))
+
     def test_job_status_transitions(self):
         """Test job status transition validation."""
         job = Job.objects.create()
@@ -267,3 +474,1375 @@ class JobTasksTest(TestCase):
         job = Job.objects.create()
         self.assertFalse(job.set_status(JobStatus.COMPLETED.value))
         self.assertEqual(job.status, JobStatus.PENDING.value)
+
+
+class StageCacheTest(TestCase):
+    """Test cases for the GPT stage result cache."""
+
+    def test_cache_key_is_content_addressed(self):
+        """Test that keys depend only on model, instructions and input."""
+        self.assertEqual(make_cache_key('gpt-4o', 'a', 'b'), make_cache_key('gpt-4o', 'a', 'b'))
+        self.assertNotEqual(make_cache_key('gpt-4o', 'a', 'b'), make_cache_key('gpt-4o', 'ab', ''))
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        """Test size-based eviction and hit/miss counters."""
+        cache = LocalLRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 2)
+
+    def test_lru_cache_expires_entries(self):
+        """Test TTL expiry of cached entries."""
+        cache = LocalLRUCache(ttl=60)
+        with patch('jobs.cache.time.monotonic', return_value=0):
+            cache.set('a', 1)
+        with patch('jobs.cache.time.monotonic', return_value=61):
+            self.assertIsNone(cache.get('a'))
+
+    @override_settings(LLM_CACHE_BACKEND='memory')
+    def test_repeated_prompts_are_served_from_cache(self):
+        """Test that a repeated stage prompt does not call the model again."""
+        mock_client = MagicMock()
+        mock_client.responses.create.return_value.output_text = "Cached summary"
+
+        self.assertEqual(generate_guideline_summary(mock_client), "Cached summary")
+        self.assertEqual(generate_guideline_summary(mock_client), "Cached summary")
+        mock_client.responses.create.assert_called_once()
+
+    @override_settings(LLM_CACHE_BACKEND='memory')
+    def test_errors_are_not_cached(self):
+        """Test that failed stage calls are retried rather than cached."""
+        mock_client = MagicMock()
+        mock_client.responses.create.side_effect = [Exception("boom"), MagicMock(output_text="Summary")]
+
+        self.assertTrue(generate_guideline_summary(mock_client).startswith("Error"))
+        self.assertEqual(generate_guideline_summary(mock_client), "Summary")
+
+
+class AsyncPipelineExecutorTest(TestCase):
+    """Test cases for the asyncio pipeline executor."""
+
+    async def test_runs_jobs_concurrently_within_bound(self):
+        """Test that a batch completes with at most max_concurrency upstream calls in flight."""
+        in_flight = 0
+        peak = 0
+
+        async def create(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return MagicMock(output_text="Output")
+
+        client = MagicMock()
+        client.responses.create = AsyncMock(side_effect=create)
+        jobs = [await Job.objects.acreate() for _ in range(5)]
+
+        executor = AsyncPipelineExecutor(client=client, max_concurrency=2)
+        results = await executor.run([job.event_id for job in jobs])
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(peak, 2)
+        self.assertEqual(client.responses.create.await_count, 15)
+        for job in jobs:
+            await job.arefresh_from_db()
+            self.assertEqual(job.status, JobStatus.COMPLETED.value)
+            self.assertEqual(job.summary, "Output")
+
+    async def test_resumes_after_checkpoint(self):
+        """Test that a republished job does not repeat the stages it has checkpoints for."""
+        client = MagicMock()
+        client.responses.create = AsyncMock(return_value=MagicMock(output_text="Output"))
+        job = await Job.objects.acreate(status=JobStatus.PROCESSING.value, summary="Checkpointed summary")
+
+        await AsyncPipelineExecutor(client=client).submit(job.event_id, claimed=True)
+
+        self.assertEqual(client.responses.create.await_count, 2)
+        await job.arefresh_from_db()
+        self.assertEqual(job.status, JobStatus.COMPLETED.value)
+        self.assertEqual(job.summary, "Checkpointed summary")
+
+    @override_settings(PIPELINE_MAX_RETRIES=2)
+    @patch('jobs.tasks.retry_countdown', return_value=0)
+    async def test_failed_stage_is_retried_then_fails(self, mock_countdown):
+        """Test that a failing stage is retried with backoff and earlier stages stay checkpointed."""
+        async def create(**kwargs):
+            if kwargs['instructions'] == CHECKLIST_INSTRUCTIONS:
+                raise openai.APIConnectionError(request=httpx.Request('POST', 'https://stub.invalid/v1/responses'))
+            return MagicMock(output_text="Output")
+
+        client = MagicMock()
+        client.responses.create = AsyncMock(side_effect=create)
+        job = await Job.objects.acreate()
+
+        result = await AsyncPipelineExecutor(client=client).submit(job.event_id)
+
+        self.assertIn("failed", result)
+        self.assertEqual(client.responses.create.await_count, 4)
+        self.assertEqual([call.args[0] for call in mock_countdown.call_args_list], [0, 1])
+        await job.arefresh_from_db()
+        self.assertEqual(job.status, JobStatus.FAILED.value)
+        self.assertEqual(job.summary, "Output")
+
+    async def test_cancel_job(self):
+        """Test that a cancelled job is marked as failed."""
+        async def create(**kwargs):
+            await asyncio.sleep(60)
+
+        client = MagicMock()
+        client.responses.create = AsyncMock(side_effect=create)
+        job = await Job.objects.acreate()
+
+        executor = AsyncPipelineExecutor(client=client)
+        task = executor.submit(job.event_id)
+        await asyncio.sleep(0.05)
+        self.assertTrue(executor.cancel(job.event_id))
+        result = await task
+
+        self.assertIn("cancelled", result)
+        await job.arefresh_from_db()
+        self.assertEqual(job.status, JobStatus.FAILED.value)
+        self.assertEqual(job.error_message, "Job cancelled")
+        self.assertFalse(executor.cancel(job.event_id))
+
+
+    @patch('jobs.tasks.get_executor')
+    def test_async_task_claims_job_before_handoff(self, mock_get_executor):
+        """Test that the async task claims the job before its message is acknowledged."""
+        job = Job.objects.create()
+
+        process_guideline_ingest_async(str(job.event_id))
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.PROCESSING.value)
+        mock_get_executor.return_value.submit.assert_called_once_with(str(job.event_id), claimed=True)
+
+        mock_get_executor.reset_mock()
+        self.assertIn("skipped", process_guideline_ingest_async(str(job.event_id)))
+        mock_get_executor.return_value.submit.assert_not_called()
+
+
+class QueueStatusTest(TestCase):
+    """Test cases for the queue status dashboard."""
+
+    @patch('jobs.views.worker_status')
+    @patch('jobs.views.broker_health')
+    def test_queue_status_counts(self, mock_broker_health, mock_worker_status):
+        """Test that the dashboard renders counts with two queries."""
+        lanes = {'interactive': {'depth': 2, 'tenants': 1, 'oldest_wait': 1.5}}
+        mock_broker_health.get.return_value = {
+            'redis_connected': True,
+            'queue_length': 4,
+            'stage_queue_lengths': {'summary': 1, 'checklist': 2, 'diagram': 3},
+            'lanes': lanes,
+        }
+        mock_worker_status.get.return_value = {'worker_count': 2, 'celery_connected': True}
+        Job.objects.create()
+        Job.objects.create(status=JobStatus.COMPLETED.value, summary='Test summary')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('queue_status'))
+
+        stats = response.context['queue_stats']
+        self.assertEqual(stats['queue_length'], 4)
+        self.assertEqual(stats['stage_queue_lengths'], {'summary': 1, 'checklist': 2, 'diagram': 3})
+        self.assertEqual(stats['lanes'], lanes)
+        self.assertEqual(stats['worker_count'], 2)
+        self.assertEqual(stats['total_jobs'], 2)
+        self.assertEqual(stats['pending_jobs'], 1)
+        self.assertEqual(stats['completed_jobs'], 1)
+
+    @patch('jobs.views.broker_health')
+    def test_queue_status_redis_down(self, mock_broker_health):
+        """Test that the dashboard still shows job counts when Redis is down."""
+        mock_broker_health.get.side_effect = redis.ConnectionError('Redis unavailable')
+        Job.objects.create()
+
+        response = self.client.get(reverse('queue_status'))
+
+        self.assertEqual(response.context['error'], 'Redis unavailable')
+        self.assertEqual(response.context['queue_stats']['pending_jobs'], 1)
+
+    @patch('jobs.monitoring.get_scheduler')
+    @patch('jobs.monitoring.get_redis')
+    def test_broker_health_is_cached(self, mock_get_redis, mock_get_scheduler):
+        """Test that broker health is fetched in one pipeline and reused within the TTL."""
+        mock_get_redis.return_value.pipeline.return_value.execute.return_value = [True, 4, 1, 2, 3]
+        mock_get_scheduler.return_value.lane_stats.return_value = {}
+        cache = BrokerHealthCache(ttl=60)
+
+        first = cache.get()
+        second = cache.get()
+
+        self.assertIs(first, second)
+        self.assertEqual(first['queue_length'], 4)
+        self.assertEqual(first['stage_queue_lengths'], {'summary': 1, 'checklist': 2, 'diagram': 3})
+        mock_get_redis.return_value.pipeline.return_value.execute.assert_called_once()
+
+    @patch('jobs.monitoring.get_redis')
+    def test_broker_health_caches_errors(self, mock_get_redis):
+        """Test that an unreachable Redis is not retried by every request within the TTL."""
+        mock_get_redis.return_value.pipeline.return_value.execute.side_effect = redis.ConnectionError
+        cache = BrokerHealthCache(ttl=60)
+
+        for _ in range(3):
+            with self.assertRaises(redis.ConnectionError):
+                cache.get()
+
+        mock_get_redis.return_value.pipeline.return_value.execute.assert_called_once()
+
+    @override_settings(REDIS_MAX_CONNECTIONS=7)
+    def test_redis_clients_share_one_pool(self):
+        """Test that every Redis client in the process uses the one configured pool."""
+        self.assertIs(get_redis().connection_pool, get_redis_pool())
+        self.assertIs(get_redis_pool(), get_redis_pool())
+        self.assertEqual(get_redis_pool().max_connections, 7)
+
+    @patch('jobs.monitoring.inspect_workers')
+    def test_worker_status_refreshes_in_background(self, mock_inspect):
+        """Test that a stale worker snapshot is served while it refreshes."""
+        mock_inspect.return_value = {'worker_count': 1, 'celery_connected': True}
+        cache = WorkerStatusCache(ttl=0)
+        self.assertEqual(cache.get()['worker_count'], 1)
+
+        mock_inspect.return_value = {'worker_count': 3, 'celery_connected': True}
+        with patch('jobs.monitoring.threading.Thread') as mock_thread:
+            self.assertEqual(cache.get()['worker_count'], 1)
+            mock_thread.assert_called_once()
+            mock_thread.return_value.start.assert_called_once()
+
+        cache.refresh()
+        self.assertEqual(cache.get()['worker_count'], 3)
+
+
+class JobEventsTest(APITestCase):
+    """Test cases for long-polling and Server-Sent Events on job status."""
+
+    def complete_job(self, job):
+        def transition(waiter, timeout):
+            job.set_status(JobStatus.PROCESSING.value)
+            job.set_status(JobStatus.COMPLETED.value, summary='Test summary')
+            return {'event_id': str(job.event_id), 'status': job.status}
+        return transition
+
+    def test_set_status_publishes_after_commit(self):
+        """Test that every transition is published once the transaction commits."""
+        job = Job.objects.create()
+        with patch('jobs.models.publish_job_event') as mock_publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                job.set_status(JobStatus.PROCESSING.value)
+                mock_publish.assert_not_called()
+        mock_publish.assert_called_once_with(job.event_id, JobStatus.PROCESSING.value)
+
+    def test_listener_dispatches_to_subscribers(self):
+        """Test that a notification reaches only the waiters of that job."""
+        listener = JobEventListener()
+        with patch('jobs.events.threading.Thread'):
+            waiter = listener.subscribe('a', timeout=0)
+            other = listener.subscribe('b', timeout=0)
+        listener.dispatch({'event_id': 'a', 'status': 'processing'})
+
+        self.assertEqual(waiter.get_nowait()['status'], 'processing')
+        self.assertTrue(other.empty())
+        listener.unsubscribe('a', waiter)
+        self.assertNotIn('a', listener._waiters)
+
+    def test_listener_drops_malformed_messages(self):
+        """Test that a malformed payload is dropped without stopping the listener."""
+        listener = JobEventListener()
+        with patch('jobs.events.threading.Thread'):
+            waiter = listener.subscribe('a', timeout=0)
+
+        for data in ['not json', json.dumps({'status': 'processing'}), json.dumps(['a'])]:
+            listener.handle({'type': 'pmessage', 'channel': b'jobs:events:a', 'data': data})
+        listener.handle({'type': 'pmessage', 'channel': b'jobs:events:a', 'data': json.dumps({'event_id': 'a'})})
+
+        self.assertEqual(waiter.get_nowait(), {'event_id': 'a'})
+        self.assertTrue(waiter.empty())
+
+    @patch('jobs.events.get_redis', side_effect=RuntimeError)
+    def test_listener_thread_can_restart_after_crash(self, mock_get_redis):
+        """Test that a listener thread that dies clears itself so the next subscriber starts another."""
+        listener = JobEventListener()
+        listener._thread = MagicMock()
+
+        with self.assertRaises(RuntimeError):
+            listener._run()
+        self.assertIsNone(listener._thread)
+
+    @patch('jobs.views.job_event_subscription', return_value=nullcontext(queue.Queue()))
+    def test_long_poll_returns_on_status_change(self, mock_subscription):
+        """Test that ?wait= returns the job once it changes state."""
+        job = Job.objects.create()
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+
+        with patch('jobs.views.wait_for_job_event', side_effect=self.complete_job(job)) as mock_wait:
+            response = self.client.get(url, {'wait': 10})
+
+        mock_wait.assert_called_once()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], JobStatus.COMPLETED.value)
+        self.assertEqual(response.data['result']['summary'], 'Test summary')
+
+    @patch('jobs.views.job_event_subscription', return_value=nullcontext(queue.Queue()))
+    def test_long_poll_finished_job_returns_immediately(self, mock_subscription):
+        """Test that ?wait= does not block for a job that has already finished."""
+        job = Job.objects.create(status=JobStatus.FAILED.value, error_message='Test error')
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+
+        with patch('jobs.views.wait_for_job_event') as mock_wait:
+            response = self.client.get(url, {'wait': 10})
+
+        mock_wait.assert_not_called()
+        self.assertEqual(response.data['result']['error'], 'Test error')
+
+    def test_long_poll_rejects_invalid_wait(self):
+        """Test that a non-numeric wait is a bad request."""
+        job = Job.objects.create()
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+        response = self.client.get(url, {'wait': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch('jobs.views.job_event_subscription', return_value=nullcontext(queue.Queue()))
+    def test_event_stream(self, mock_subscription):
+        """Test that the SSE stream sends the current state and each change until finished."""
+        job = Job.objects.create()
+        url = reverse('job_events', kwargs={'event_id': job.event_id})
+
+        with patch('jobs.views.wait_for_job_event', side_effect=self.complete_job(job)):
+            response = self.client.get(url)
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+        self.assertEqual([event['status'] for event in events], ['pending', 'completed'])
+        self.assertEqual(events[-1]['result']['summary'], 'Test summary')
+
+    def test_event_stream_nonexistent_job(self):
+        """Test that streaming an unknown job returns 404."""
+        url = reverse('job_events', kwargs={'event_id': uuid.uuid4()})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class JobListTest(APITestCase):
+    """Test cases for the cursor-paginated job listing."""
+
+    def setUp(self):
+        self.url = reverse('create_job')
+        now = timezone.now()
+        # Two jobs share a created_at so paging has to break the tie on event_id
+        self.jobs = [
+            Job.objects.create(created_at=now - timedelta(minutes=minutes), status=job_status, summary='Test summary')
+            for minutes, job_status in [(0, 'completed'), (1, 'failed'), (1, 'pending'), (2, 'completed'), (3, 'processing')]
+        ]
+        self.newest_first = sorted(self.jobs, key=lambda job: (job.created_at, job.event_id), reverse=True)
+
+    def test_pages_through_every_job_once(self):
+        """Test that following next links returns every job once, newest first."""
+        seen = []
+        response = self.client.get(self.url, {'limit': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(job['event_id'] for job in response.data['results'])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(seen, [str(job.event_id) for job in self.newest_first])
+
+    def test_filters(self):
+        """Test filtering on status and on a created_at range."""
+        response = self.client.get(self.url, {'status': 'completed,failed'})
+        self.assertEqual({job['status'] for job in response.data['results']}, {'completed', 'failed'})
+        self.assertEqual(len(response.data['results']), 3)
+
+        response = self.client.get(self.url, {
+            'created_after': (self.jobs[3].created_at).isoformat(),
+            'created_before': (self.jobs[0].created_at).isoformat(),
+        })
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_sparse_fields_skip_result_columns(self):
+        """Test that fields= limits the response and the columns read."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'event_id,status'})
+
+        self.assertEqual(set(response.data['results'][0]), {'event_id', 'status'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"summary"', queries[0]['sql'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'status': 'completed'})
+        self.assertEqual(response.data['results'][0]['result']['summary'], 'Test summary')
+
+    def test_invalid_parameters(self):
+        """Test that unknown statuses, fields and malformed cursors are bad requests."""
+        for params in ({'status': 'done'}, {'fields': 'summary'}, {'cursor': 'not-a-cursor'}, {'limit': 0}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class JobStatusLookupTest(APITestCase):
+    """Test cases for the bulk status lookup."""
+
+    def setUp(self):
+        get_status_cache().clear()
+        self.url = reverse('get_jobs_status')
+        self.pending = Job.objects.create()
+        self.completed = Job.objects.create(status=JobStatus.COMPLETED.value, summary='Test summary')
+
+    def lookup(self, *event_ids, **body):
+        return self.client.post(self.url, {'event_ids': [str(e) for e in event_ids], **body}, format='json')
+
+    def test_lookup_in_one_query(self):
+        """Test that known jobs come back in request order with status fields only, unknown ones listed apart."""
+        unknown = uuid.uuid4()
+        # The jobs table, then the archive for the id it does not have
+        with self.assertNumQueries(2):
+            response = self.lookup(self.completed.event_id, unknown, self.pending.event_id, self.completed.event_id)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        jobs = response.data['jobs']
+        self.assertEqual([job['event_id'] for job in jobs], [str(self.completed.event_id), str(self.pending.event_id)])
+        self.assertEqual(set(jobs[0]), {'event_id', 'status', 'created_at', 'updated_at'})
+        self.assertEqual(response.data['not_found'], [str(unknown)])
+
+    def test_lookup_with_result(self):
+        """Test that asking for result loads it in the same query."""
+        with self.assertNumQueries(1):
+            response = self.lookup(self.completed.event_id, fields=['event_id', 'result'])
+
+        self.assertEqual(response.data['jobs'], [{
+            'event_id': str(self.completed.event_id), 'result': {'summary': 'Test summary', 'checklist': None, 'diagram': None},
+        }])
+
+    @override_settings(JOB_STATUS_CACHE_BACKEND='memory')
+    def test_lookup_uses_status_cache(self):
+        """Test that complete cache entries are reused and only those are written back."""
+        self.lookup(self.pending.event_id, self.completed.event_id)
+        with self.assertNumQueries(1):
+            self.lookup(self.pending.event_id, self.completed.event_id)
+
+        self.lookup(self.completed.event_id, fields=['result'])
+        with self.assertNumQueries(0):
+            response = self.lookup(self.pending.event_id, self.completed.event_id)
+        self.assertEqual(len(response.data['jobs']), 2)
+
+        # Entries written by the lookup are the ones GET /jobs/{event_id}/ serves
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('get_job_status', kwargs={'event_id': self.completed.event_id}))
+        self.assertEqual(response.data['result']['summary'], 'Test summary')
+
+    @override_settings(JOB_STATUS_LOOKUP_MAX_IDS=2)
+    def test_invalid_lookups(self):
+        """Test that too many ids, malformed ids and unknown fields are bad requests."""
+        self.assertEqual(self.lookup(uuid.uuid4(), uuid.uuid4(), uuid.uuid4()).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.lookup('not-a-uuid').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.lookup(uuid.uuid4(), fields=['tenant']).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_redis_cache_get_many(self):
+        """Test that a multi-key read decodes hits, and a Redis error reads as all misses."""
+        client = MagicMock()
+        client.register_script.return_value.return_value = [b'{"status": "pending"}', None]
+        cache = RedisCache('test', client=client)
+
+        self.assertEqual(cache.get_many(['a', 'b']), [{'status': 'pending'}, None])
+        client.register_script.return_value.side_effect = redis.ConnectionError
+        self.assertEqual(cache.get_many(['a', 'b']), [None, None])
+
+
+class AsyncViewsTest(TestCase):
+    """Test cases for the async views served under ASGI."""
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+
+    async def test_create_job(self):
+        """Test that a job is created from a JSON body and invalid input is rejected."""
+        request = self.factory.post('/jobs/', {'priority': 'interactive', 'tenant': 'acme'}, content_type='application/json')
+        response = await views.acreate_job(request)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = await Job.objects.aget(event_id=json.loads(response.content)['event_id'])
+        self.assertEqual((job.priority, job.tenant, job.status), ('interactive', 'acme', JobStatus.PENDING.value))
+
+        request = self.factory.post('/jobs/', {'priority': 'urgent'}, content_type='application/json')
+        self.assertEqual((await views.acreate_job(request)).status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_create_job_replays_idempotency_key(self):
+        """Test that a repeated Idempotency-Key returns the first job."""
+        def post():
+            return views.acreate_job(self.factory.post('/jobs/', {}, content_type='application/json', headers={'Idempotency-Key': 'k1'}))
+
+        first = await post()
+        second = await post()
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(json.loads(first.content)['event_id'], json.loads(second.content)['event_id'])
+        self.assertEqual(await Job.objects.acount(), 1)
+
+    async def test_job_status(self):
+        """Test that a finished job is served with its result and an unknown one is a 404."""
+        job = await Job.objects.acreate(status=JobStatus.COMPLETED.value, summary='Test summary')
+
+        response = await views.aget_job_status(self.factory.get('/'), job.event_id)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['result']['summary'], 'Test summary')
+        response = await views.aget_job_status(self.factory.get('/'), uuid.uuid4())
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_long_poll_returns_on_status_change(self):
+        """Test that ?wait= returns the job once it changes state."""
+        job = await Job.objects.acreate()
+
+        async def transition(waiter, timeout):
+            await sync_to_async(job.set_status)(JobStatus.PROCESSING.value)
+            await sync_to_async(job.set_status)(JobStatus.COMPLETED.value, summary='Test summary')
+            return {'event_id': str(job.event_id), 'status': job.status}
+
+        with patch('jobs.views.ajob_event_subscription', return_value=nullcontext(None)), \
+                patch('jobs.views.await_job_event', side_effect=transition) as mock_wait:
+            response = await views.aget_job_status(self.factory.get('/', {'wait': 10}), job.event_id)
+
+        mock_wait.assert_awaited_once()
+        data = json.loads(response.content)
+        self.assertEqual(data['status'], JobStatus.COMPLETED.value)
+        self.assertEqual(data['result']['summary'], 'Test summary')
+
+    async def test_async_waiter_receives_dispatch(self):
+        """Test that a notification dispatched by the listener thread reaches a waiting coroutine."""
+        listener = JobEventListener()
+        waiter = AsyncWaiter()
+        with patch('jobs.events.threading.Thread'):
+            listener.subscribe('a', timeout=0, waiter=waiter)
+
+        await asyncio.to_thread(listener.dispatch, {'event_id': 'a', 'status': 'completed'})
+
+        self.assertEqual((await waiter.get(1))['status'], 'completed')
+        with self.assertRaises(asyncio.TimeoutError):
+            await waiter.get(0.01)
+
+
+def count_backends():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()')
+        return cursor.fetchone()[0]
+
+
+class AsyncConnectionTest(TransactionTestCase):
+    """Test cases for Postgres connections held by waiting ASGI requests."""
+
+    async def test_waiting_long_polls_hold_no_connections(self):
+        """Test that concurrent long-polls close their connections before they wait."""
+        job = await Job.objects.acreate()
+        waiting = asyncio.Event()
+
+        async def wait_for_event(events, timeout):
+            await waiting.wait()
+            return None
+
+        async def poll():
+            # Gives each poll its own ORM thread, as the ASGI handler does per request
+            async with ThreadSensitiveContext():
+                return await views.await_job_change(job.event_id, 10)
+
+        baseline = await sync_to_async(count_backends)()
+        with patch('jobs.views.ajob_event_subscription', return_value=nullcontext(None)), \
+                patch('jobs.views.await_job_event', side_effect=wait_for_event):
+            polls = asyncio.gather(*[poll() for _ in range(20)])
+            await asyncio.sleep(0.5)
+            during = await sync_to_async(count_backends)()
+            waiting.set()
+            await polls
+
+        self.assertLessEqual(during, baseline)
+
+
+@override_settings(JOB_STATUS_CACHE_BACKEND='memory')
+class JobStatusCacheTest(APITestCase):
+    """Test cases for the job status read-through cache."""
+
+    def setUp(self):
+        get_status_cache().clear()
+
+    def test_finished_job_served_from_cache(self):
+        """Test that a finished job is read from the database only once."""
+        job = Job.objects.create(status=JobStatus.COMPLETED.value, summary='Test summary')
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.data['result']['summary'], 'Test summary')
+        self.assertEqual(get_status_cache().stats()['hits'], 1)
+
+    def test_transition_invalidates_cache(self):
+        """Test that set_status drops the cached response once committed."""
+        job = Job.objects.create()
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            job.set_status(JobStatus.PROCESSING.value)
+        response = self.client.get(url)
+
+        self.assertEqual(response.data['status'], JobStatus.PROCESSING.value)
+
+    def test_unfinished_job_cached_with_ttl(self):
+        """Test that pending jobs expire from the cache after JOB_STATUS_CACHE_TTL."""
+        job = Job.objects.create()
+        with patch.object(get_status_cache(), 'set', wraps=get_status_cache().set) as mock_set:
+            self.client.get(reverse('get_job_status', kwargs={'event_id': job.event_id}))
+        self.assertIsNone(mock_set.call_args.kwargs['ttl'])
+
+        job = Job.objects.create(status=JobStatus.FAILED.value)
+        with patch.object(get_status_cache(), 'set', wraps=get_status_cache().set) as mock_set:
+            self.client.get(reverse('get_job_status', kwargs={'event_id': job.event_id}))
+        self.assertEqual(mock_set.call_args.kwargs['ttl'], 0)
+
+
+def delta_events(*deltas):
+    return [MagicMock(type='response.output_text.delta', delta=delta) for delta in deltas] + [
+        MagicMock(type='response.completed'),
+    ]
+
+
+class StreamingOutputTest(APITestCase):
+    """Test cases for streamed GPT stage output."""
+
+    def test_stream_flushes_buffered_deltas(self):
+        """Test that deltas are written to Redis in chunks and overwrite an earlier attempt."""
+        redis_client = MagicMock()
+        pipe = redis_client.pipeline.return_value
+        client = MagicMock()
+        client.responses.create.return_value = iter(delta_events('Test ', 'sum', 'mary'))
+        output = StageOutput('job', 'summary', flush_interval=60, ttl=60, client=redis_client)
+
+        self.assertEqual(stream_response_text(client, output, model='gpt-4o'), 'Test summary')
+
+        client.responses.create.assert_called_once_with(stream=True, model='gpt-4o')
+        pipe.set.assert_called_once_with('jobs:output:job:summary', 'Test summary', ex=60)
+        pipe.append.assert_not_called()
+
+        output.write(' more')
+        output.flush()
+        pipe.append.assert_called_once_with('jobs:output:job:summary', ' more')
+
+    def test_stream_failure_fails_stage(self):
+        """Test that a failed streamed response becomes a stage error."""
+        client = MagicMock()
+        failed = MagicMock(type='response.failed')
+        failed.response.error.message = 'Test error'
+        client.responses.create.return_value = iter([failed])
+
+        summary = generate_guideline_summary(client, output=StageOutput('job', 'summary', client=MagicMock()))
+        self.assertEqual(summary, 'Error generating summary: Test error')
+
+    @override_settings(LLM_STREAM_OUTPUT=True)
+    @patch('jobs.streaming.get_redis')
+    @patch('jobs.tasks.get_llm_client')
+    def test_process_guideline_ingest_streams_stages(self, mock_get_client, mock_redis):
+        """Test that streamed chunks go to Redis and the job row is only written per stage."""
+        mock_get_client.return_value.responses.create.side_effect = lambda **kwargs: iter(delta_events('Test ', 'output'))
+        job = Job.objects.create()
+
+        with CaptureQueriesContext(connection) as queries:
+            process_guideline_ingest(str(job.event_id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.COMPLETED.value)
+        self.assertEqual(job.summary, 'Test output')
+        # Claim, summary and checklist checkpoints, completion
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 4)
+        keys = [call.args[0] for call in mock_redis.return_value.pipeline.return_value.set.call_args_list]
+        self.assertEqual(keys, [f'jobs:output:{job.event_id}:{stage}' for stage in ('summary', 'checklist', 'diagram')])
+
+    @patch('jobs.views.read_job_output', return_value={'summary': 'Partial', 'checklist': None, 'diagram': None})
+    def test_get_job_output_processing(self, mock_read):
+        """Test that an unfinished job returns the partial output from Redis."""
+        job = Job.objects.create(status=JobStatus.PROCESSING.value)
+        response = self.client.get(reverse('get_job_output', kwargs={'event_id': job.event_id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], JobStatus.PROCESSING.value)
+        self.assertEqual(response.data['output']['summary'], 'Partial')
+        mock_read.assert_called_once_with(job.event_id)
+
+    @patch('jobs.views.read_job_output')
+    def test_get_job_output_completed(self, mock_read):
+        """Test that a completed job returns the stored result without reading Redis."""
+        job = Job.objects.create(
+            status=JobStatus.COMPLETED.value, summary='Test summary', checklist='Test checklist', diagram='Test diagram',
+        )
+        response = self.client.get(reverse('get_job_output', kwargs={'event_id': job.event_id}))
+
+        self.assertEqual(response.data['output']['checklist'], 'Test checklist')
+        mock_read.assert_not_called()
+
+    def test_get_job_output_nonexistent_job(self):
+        """Test that an unknown job returns 404."""
+        response = self.client.get(reverse('get_job_output', kwargs={'event_id': uuid.uuid4()}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(LLM_PROVIDER='stub', LLM_STUB_LATENCY=0, LLM_STUB_OUTPUT_CHARS=200)
+class StubProviderTest(TestCase):
+    """Test cases for the pluggable LLM provider and the load-testing stub."""
+
+    def test_client_is_reused_per_process(self):
+        """Test that every call returns the same configured client."""
+        client = get_llm_client()
+        self.assertIsInstance(client, StubClient)
+        self.assertIs(get_llm_client(), client)
+
+    def test_stub_output_is_deterministic(self):
+        """Test that the same prompt returns the same text of the configured size."""
+        client = StubClient()
+        first = generate_guideline_summary(client)
+        self.assertEqual(generate_guideline_summary(client), first)
+        self.assertEqual(len(first), 200)
+        self.assertNotEqual(generate_checklist_from_summary(client, first), first)
+        self.assertTrue(generate_mermaid_diagram(client, first, 'Test checklist').startswith('flowchart TD'))
+
+    def test_stub_rate_limit_errors(self):
+        """Test that the stub fails stages with rate-limit errors at the configured rate."""
+        client = StubClient(StubLLM(error_rate=1))
+        self.assertIn('Rate limit', generate_guideline_summary(client))
+
+    def test_stub_streams_output(self):
+        """Test that the stub streams the same text it would return whole."""
+        stub = StubLLM()
+        output = StageOutput('job', 'summary', client=MagicMock())
+        text = stream_response_text(StubClient(stub), output, model='gpt-4o', instructions='a', input='b')
+        self.assertEqual(text, stub.output_text('gpt-4o', 'a', 'b'))
+
+    async def test_async_stub_runs_pipeline(self):
+        """Test that the async executor completes jobs against the async stub."""
+        job = await Job.objects.acreate()
+        await AsyncPipelineExecutor(client=AsyncStubClient()).run([job.event_id])
+
+        await job.arefresh_from_db()
+        self.assertEqual(job.status, JobStatus.COMPLETED.value)
+        self.assertEqual(len(job.summary), 200)
+
+
+class PipelineBenchmarkTest(TestCase):
+    """Test cases for the end-to-end pipeline benchmark."""
+
+    def test_latency_summary(self):
+        """Test nearest-rank percentiles and histogram buckets."""
+        latency = LatencyRecorder()
+        for value in range(1, 101):
+            latency.add(value)
+        summary = latency.summary()
+
+        self.assertEqual((summary['p50'], summary['p99'], summary['max']), (50, 99, 100))
+        self.assertEqual(sum(bucket['count'] for bucket in summary['histogram']), 100)
+        self.assertEqual(summary['histogram'][-1], {'le_ms': 100, 'count': 50})
+
+    def test_parse_mix(self):
+        """Test parsing and validation of request mixes."""
+        self.assertEqual(parse_mix('create=1, status=4'), {'create': 1.0, 'status': 4.0})
+        with self.assertRaises(ValueError):
+            parse_mix('delete=1')
+
+    @override_settings(LLM_PROVIDER='stub', LLM_STUB_LATENCY=0)
+    def test_eager_run_reports_requests_and_throughput(self):
+        """Test that an eager run reports every operation and processes every created job."""
+        benchmark = PipelineBenchmark(requests=12, concurrency=1, workers=1, mix=parse_mix('create=1,batch=1,status=1'), batch_size=2)
+        report = benchmark.run()
+
+        operations = report['api']['operations']
+        self.assertEqual(sum(operation['latency_ms']['count'] for operation in operations.values()), 12)
+        self.assertGreater(operations['create']['queries']['mean'], 0)
+        self.assertGreater(operations['create']['db_ms']['mean'], 0)
+        self.assertEqual(report['pipeline']['completed'], report['pipeline']['jobs'])
+        self.assertEqual(report['pipeline']['unfinished'], 0)
+        self.assertGreater(report['pipeline']['db_ms_per_job']['mean'], 0)
+        self.assertEqual(Job.objects.count(), 0)
+
+    def test_conn_max_age_override_is_restored(self):
+        """Test that a run with its own CONN_MAX_AGE reports it and restores the configured age."""
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        benchmark = PipelineBenchmark(requests=1, concurrency=1, mix=parse_mix('status=1'), conn_max_age=0)
+
+        report = benchmark.run()
+
+        self.assertEqual(report['config']['db_conn_max_age'], 0)
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], configured)
+
+    @override_settings(DB_WORKER_CONN_MAX_AGE=900)
+    def test_worker_connection_age(self):
+        """Test that worker processes keep their connections for DB_WORKER_CONN_MAX_AGE."""
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            configure_worker_connections()
+            self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 900)
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+
+
+def rate_limit_error():
+    try:
+        StubLLM(error_rate=1).check_rate_limit()
+    except openai.RateLimitError as e:
+        return e
+
+
+@override_settings(LLM_RATE_LIMIT_ENABLED=True, LLM_RATE_LIMIT_MAX_RETRIES=2)
+class UpstreamLimiterTest(TestCase):
+    """Test cases for the shared upstream rate limiter and adaptive concurrency."""
+
+    @patch('jobs.ratelimit.time.sleep')
+    @patch('jobs.ratelimit.get_limiter')
+    def test_rate_limited_call_is_retried(self, mock_get_limiter, mock_sleep):
+        """Test that a 429 backs off the limiter and retries instead of failing."""
+        limiter = mock_get_limiter.return_value
+        call = MagicMock(side_effect=[rate_limit_error(), 'Output'])
+
+        self.assertEqual(limited_call('gpt-4o', 100, call), 'Output')
+
+        self.assertEqual(call.call_count, 2)
+        self.assertEqual(limiter.acquire.call_count, 2)
+        self.assertTrue(limiter.release.call_args_list[0].kwargs['throttled'])
+        self.assertIn('latency', limiter.release.call_args_list[1].kwargs)
+        limiter.settle.assert_called_once()
+        mock_sleep.assert_called_once()
+
+    @patch('jobs.ratelimit.time.sleep')
+    @patch('jobs.ratelimit.get_limiter')
+    def test_rate_limited_stage_fails_after_retries(self, mock_get_limiter, mock_sleep):
+        """Test that a stage still fails once the retries are used up."""
+        client = StubClient(StubLLM(latency=0, error_rate=1))
+        self.assertIn('Rate limit', generate_guideline_summary(client))
+        self.assertEqual(mock_get_limiter.return_value.release.call_count, 3)
+
+    @patch('jobs.ratelimit.get_limiter')
+    def test_upstream_outage_counts_as_congestion(self, mock_get_limiter):
+        """Test that timeouts back the limit off while unrelated errors leave it alone."""
+        limiter = mock_get_limiter.return_value
+        timeout = openai.APITimeoutError(request=httpx.Request('POST', 'https://stub.invalid/v1/responses'))
+
+        for error in [timeout, ValueError('Bad input')]:
+            with self.assertRaises(type(error)):
+                limited_call('gpt-4o', 100, MagicMock(side_effect=error))
+        self.assertEqual(limiter.release.call_args_list[0].kwargs, {'throttled': True})
+        self.assertEqual(limiter.release.call_args_list[1].kwargs, {'adjust': False})
+
+    def test_release_without_adjusting_keeps_the_limit(self):
+        """Test that a release with adjust=False asks the script to leave the limit unchanged."""
+        limiter = UpstreamLimiter('gpt-4o', target_latency=10, client=MagicMock())
+        with patch.object(limiter, '_run') as mock_run:
+            limiter.release('lease', adjust=False)
+        self.assertEqual(mock_run.call_args.args[2][2], '')
+
+    def test_release_backs_off_on_slow_calls(self):
+        """Test that calls slower than the target latency count as congestion."""
+        limiter = UpstreamLimiter('gpt-4o', target_latency=10, client=MagicMock())
+        with patch.object(limiter, '_run') as mock_run:
+            limiter.release('lease', latency=1)
+            limiter.release('lease', latency=20)
+        self.assertEqual([call.args[2][2] for call in mock_run.call_args_list], ['0', '1'])
+
+    @override_settings(LLM_RATE_LIMIT_MAX_WAIT=5)
+    def test_acquire_times_out(self):
+        """Test that waiting past LLM_RATE_LIMIT_MAX_WAIT fails the call."""
+        limiter = UpstreamLimiter('gpt-4o', client=MagicMock())
+        with patch.object(limiter, 'reserve', return_value=60):
+            with self.assertRaises(RateLimitTimeout):
+                limiter.acquire(100)
+
+    def test_redis_errors_let_calls_through(self):
+        """Test that the limiter fails open when Redis is unavailable."""
+        client = MagicMock()
+        client.register_script.side_effect = redis.ConnectionError
+        limiter = UpstreamLimiter('gpt-4o', client=client)
+
+        self.assertEqual(limiter.reserve(100), 0.0)
+        self.assertTrue(limiter.try_acquire('lease'))
+
+
+class PipelineChainTest(TestCase):
+    """Test cases for the pipeline as a chain of per-stage tasks."""
+
+    @override_settings(PIPELINE_EXECUTOR='chain')
+    def test_stage_tasks_are_routed_to_their_queues(self):
+        """Test that each stage of the chain goes to its own queue."""
+        from jobapi.celery import app
+
+        signature = pipeline_signature(uuid.uuid4())
+        queues = [app.amqp.router.route({}, task.task)['queue'].name for task in signature.tasks]
+        self.assertEqual(queues, ['pipeline.summary', 'pipeline.checklist', 'pipeline.diagram'])
+
+    @patch('jobs.tasks.get_llm_client')
+    def test_chain_completes_job(self, mock_get_client):
+        """Test that the chained stages checkpoint and complete the job."""
+        mock_get_client.return_value.responses.create.return_value.output_text = "Test output"
+        job = Job.objects.create()
+
+        pipeline_chain(job.event_id).apply()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.COMPLETED.value)
+        self.assertEqual((job.summary, job.checklist, job.diagram), ("Test output",) * 3)
+
+    @patch('jobs.tasks.generate_guideline_summary')
+    def test_duplicate_chain_is_ignored(self, mock_summary):
+        """Test that a chain for a job another delivery already claimed stops at the first stage."""
+        job = Job.objects.create(status=JobStatus.PROCESSING.value)
+        result = run_summary_stage.apply(args=[str(job.event_id)])
+
+        self.assertEqual(result.state, 'IGNORED')
+        mock_summary.assert_not_called()
+
+    @patch('jobs.tasks.generate_checklist_from_summary')
+    def test_checkpointed_stage_is_skipped(self, mock_checklist):
+        """Test that a redelivered stage with a checkpoint does not call the model again."""
+        job = Job.objects.create(status=JobStatus.PROCESSING.value, summary="Test summary", checklist="Test checklist")
+        result = run_checklist_stage.apply(args=[str(job.event_id)]).get()
+
+        self.assertIn("already checkpointed", result)
+        mock_checklist.assert_not_called()
+
+
+class FairSchedulerTest(TestCase):
+    """Test cases for priority lanes and fair scheduling across tenants."""
+
+    def test_parse_lane_weights(self):
+        """Test that lane weights must cover every priority."""
+        self.assertEqual(parse_lane_weights('interactive=8, normal=3, bulk=1'), {'interactive': 8, 'normal': 3, 'bulk': 1})
+        with self.assertRaises(ValueError):
+            parse_lane_weights('interactive=8,normal=3')
+
+    def test_pop_passes_lane_weights(self):
+        """Test that a pop runs the scheduling script with every lane's weight."""
+        client = MagicMock()
+        script = client.register_script.return_value
+        script.return_value = json.dumps({'event_id': 'abc', 'enqueued_at': 0})
+        scheduler = FairScheduler({'interactive': 8, 'normal': 3, 'bulk': 1}, client=client)
+
+        self.assertEqual(scheduler.pop(), 'abc')
+        self.assertEqual(script.call_args.kwargs['args'], ['jobs:lanes', 'interactive', 8, 'normal', 3, 'bulk', 1])
+        self.assertEqual(script.call_args.kwargs['keys'], [
+            'jobs:lanes:credits', 'jobs:lanes:interactive:tenants', 'jobs:lanes:normal:tenants', 'jobs:lanes:bulk:tenants',
+        ])
+
+        script.return_value = None
+        self.assertIsNone(scheduler.pop())
+
+    @patch('jobs.lanes.time.time', return_value=100.0)
+    def test_lane_stats(self, mock_time):
+        """Test that lane stats report depth and the wait of the oldest job."""
+        client = MagicMock()
+        client.pipeline.return_value.execute.side_effect = [
+            [b'2', [b'acme', b'globex'], None, []],
+            [json.dumps({'event_id': 'a', 'enqueued_at': 90.0}), json.dumps({'event_id': 'b', 'enqueued_at': 95.0})],
+        ]
+        scheduler = FairScheduler({'interactive': 8, 'bulk': 1}, client=client)
+
+        self.assertEqual(scheduler.lane_stats(), {
+            'interactive': {'depth': 2, 'tenants': 2, 'oldest_wait': 10.0},
+            'bulk': {'depth': 0, 'tenants': 0, 'oldest_wait': 0.0},
+        })
+
+    @override_settings(JOB_SCHEDULER='fair')
+    @patch('jobs.tasks.group')
+    @patch('jobs.tasks.get_scheduler')
+    def test_fair_enqueue_publishes_jobless_tasks(self, mock_get_scheduler, mock_group):
+        """Test that fair dispatch queues jobs in their lanes and publishes tasks without a job."""
+        jobs = [Job.objects.create(priority='bulk', tenant='acme'), Job.objects.create()]
+
+        enqueue_jobs(jobs)
+
+        mock_get_scheduler.return_value.push_many.assert_called_once_with(jobs)
+        self.assertEqual([sig.args for sig in mock_group.call_args[0][0]], [(), ()])
+
+        mock_get_scheduler.return_value.push_many.side_effect = redis.ConnectionError
+        enqueue_jobs(jobs)
+        self.assertEqual([sig.args[0] for sig in mock_group.call_args[0][0]], [str(job.event_id) for job in jobs])
+
+    @override_settings(JOB_SCHEDULER='fair')
+    @patch('jobs.tasks.group')
+    @patch('jobs.tasks.get_scheduler')
+    def test_fair_enqueue_unqueues_jobs_when_publish_fails(self, mock_get_scheduler, mock_group):
+        """Test that jobs are taken back out of the lanes when their tasks cannot be published."""
+        scheduler = mock_get_scheduler.return_value
+        mock_group.return_value.apply_async.side_effect = ConnectionError
+        jobs = [Job.objects.create()]
+
+        with self.assertRaises(ConnectionError):
+            enqueue_jobs(jobs)
+        scheduler.remove_many.assert_called_once_with(scheduler.push_many.return_value)
+
+    @patch('jobs.tasks.get_llm_client')
+    @patch('jobs.tasks.next_job')
+    def test_jobless_task_runs_next_job(self, mock_next_job, mock_get_client):
+        """Test that a task without a job processes the job the lanes hand out."""
+        mock_get_client.return_value.responses.create.return_value.output_text = "Test output"
+        job = Job.objects.create(priority='interactive')
+        mock_next_job.return_value = str(job.event_id)
+
+        process_guideline_ingest.apply()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, JobStatus.COMPLETED.value)
+
+        mock_next_job.return_value = None
+        self.assertEqual(process_guideline_ingest.apply().get(), "No job waiting")
+
+
+class JobDeduplicationTest(APITestCase):
+    """Test cases for idempotency keys and deduplication on job creation."""
+
+    @patch('jobs.views.process_guideline_ingest.delay')
+    def test_idempotency_key_returns_existing_job(self, mock_delay):
+        """Test that a retried request returns the first job without enqueueing again."""
+        url = reverse('create_job')
+        with override_settings(TESTING=False, CELERY_ALWAYS_EAGER=False):
+            first = self.client.post(url, {}, HTTP_IDEMPOTENCY_KEY='abc')
+            second = self.client.post(url, {}, HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(str(second.data['event_id']), str(first.data['event_id']))
+        self.assertEqual(Job.objects.count(), 1)
+        mock_delay.assert_called_once()
+
+    def test_idempotency_key_is_scoped_to_tenant(self):
+        """Test that two tenants can use the same key."""
+        url = reverse('create_job')
+        first = self.client.post(url, {'tenant': 'acme'}, HTTP_IDEMPOTENCY_KEY='abc')
+        second = self.client.post(url, {'tenant': 'globex'}, HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(first.data['event_id'], second.data['event_id'])
+
+    @override_settings(JOB_DEDUP_INPUTS=True)
+    def test_identical_inputs_coalesce_while_in_flight(self):
+        """Test that identical submissions share a job until it finishes."""
+        url = reverse('create_job')
+        first = self.client.post(url, {'tenant': 'acme'})
+        second = self.client.post(url, {'tenant': 'acme'})
+        other = self.client.post(url, {'tenant': 'globex'})
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(str(second.data['event_id']), str(first.data['event_id']))
+        self.assertEqual(other.status_code, status.HTTP_201_CREATED)
+
+        Job.objects.filter(event_id=first.data['event_id']).update(status=JobStatus.COMPLETED.value)
+        third = self.client.post(url, {'tenant': 'acme'})
+        self.assertEqual(third.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(JOB_DEDUP_FAST_PATH=True)
+    @patch('jobs.dedup.get_redis')
+    def test_idempotency_key_fast_path(self, mock_get_redis):
+        """Test that a key remembered in Redis is answered without a query."""
+        mock_get_redis.return_value.get.return_value = b'0b4e7a0e-5d2c-4d5a-9d7e-1b2c3d4e5f60'
+        key = idempotency_key('', 'abc')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(find_by_idempotency_key(key), '0b4e7a0e-5d2c-4d5a-9d7e-1b2c3d4e5f60')
+
+        mock_get_redis.return_value.get.side_effect = redis.ConnectionError
+        job = Job.objects.create()
+        Job.objects.filter(event_id=job.event_id).update(idempotency_key=key)
+        self.assertEqual(find_by_idempotency_key(key), str(job.event_id))
+
+    @override_settings(JOB_DEDUP_FAST_PATH=True)
+    @patch('jobs.dedup.get_redis')
+    def test_finished_claim_is_taken_over_once(self, mock_get_redis):
+        """Test that of two submissions taking over a finished job's claim only one wins."""
+        client = mock_get_redis.return_value
+        swap = client.register_script.return_value
+        finished = Job.objects.create(status=JobStatus.COMPLETED.value)
+        winner = uuid.uuid4()
+        client.set.return_value = False
+
+        client.get.side_effect = [str(finished.event_id).encode()]
+        swap.return_value = 1
+        self.assertIsNone(claim_inputs('digest', uuid.uuid4()))
+
+        # The other submission's compare-and-set fails, and it coalesces onto the winner's job
+        client.get.side_effect = [str(finished.event_id).encode(), str(winner).encode()]
+        swap.return_value = 0
+        self.assertEqual(claim_inputs('digest', uuid.uuid4()), str(winner))
+        self.assertEqual(swap.call_args.kwargs['args'][0], str(finished.event_id))
+
+    def save_with_error(self, error, key=None):
+        serializer = JobCreateSerializer(data={'tenant': 'acme'})
+        self.assertTrue(serializer.is_valid())
+        with patch.object(serializer, 'save', side_effect=error):
+            return save_unless_duplicate(serializer, key)
+
+    @override_settings(JOB_DEDUP_INPUTS=True, JOB_DEDUP_FAST_PATH=True)
+    @patch('jobs.dedup.get_redis')
+    def test_failed_save_releases_input_claim(self, mock_get_redis):
+        """Test that a job that could not be created does not keep answering identical submissions."""
+        client = mock_get_redis.return_value
+        client.set.return_value = True
+
+        with self.assertRaises(DatabaseError):
+            self.save_with_error(DatabaseError)
+
+        claimed = client.set.call_args.args[1]
+        swap = client.register_script.return_value
+        self.assertEqual(swap.call_args.kwargs['args'][:2], [claimed, ''])
+
+    @override_settings(JOB_DEDUP_INPUTS=True, JOB_DEDUP_FAST_PATH=True)
+    @patch('jobs.dedup.find_by_idempotency_key', side_effect=[None, 'winner'])
+    @patch('jobs.dedup.get_redis')
+    def test_idempotency_conflict_points_claim_at_winner(self, mock_get_redis, mock_find):
+        """Test that losing an Idempotency-Key race hands the input claim to the job that won."""
+        client = mock_get_redis.return_value
+        client.set.return_value = True
+
+        self.assertEqual(self.save_with_error(IntegrityError, key='abc'), ('winner', None))
+
+        claimed = client.set.call_args.args[1]
+        swap = client.register_script.return_value
+        self.assertEqual(swap.call_args.kwargs['args'][:2], [claimed, 'winner'])
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTest(TestCase):
+    """Test cases for the Prometheus metrics registry and endpoint."""
+
+    def test_observations_are_flushed_as_cumulative_buckets(self):
+        """Test that a flush sends one increment per series and buckets are cumulative."""
+        client = MagicMock()
+        registry = MetricsRegistry(flush_interval=3600, client=client)
+        registry.observe('jobs_stage_duration_seconds', 0.3, stage='summary', outcome='ok')
+        registry.inc('jobs_status_transitions_total', status='completed')
+        client.pipeline.assert_not_called()
+
+        registry.flush()
+
+        pipe = client.pipeline.return_value
+        increments = {call.args[1]: call.args[2] for call in pipe.hincrbyfloat.call_args_list}
+        self.assertEqual(increments['jobs_status_transitions_total{status="completed"}'], 1)
+        self.assertEqual(increments['jobs_stage_duration_seconds_sum{stage="summary",outcome="ok"}'], 0.3)
+        self.assertIn('jobs_stage_duration_seconds_bucket{stage="summary",outcome="ok",le="0.5"}', increments)
+        self.assertIn('jobs_stage_duration_seconds_bucket{stage="summary",outcome="ok",le="+Inf"}', increments)
+        self.assertNotIn('jobs_stage_duration_seconds_bucket{stage="summary",outcome="ok",le="0.25"}', increments)
+        pipe.execute.assert_called_once()
+
+    async def test_flush_on_event_loop_runs_in_thread(self):
+        """Test that a flush due inside a coroutine does not block the event loop."""
+        client = MagicMock()
+        flush_threads = []
+        release = threading.Event()
+
+        def execute():
+            release.wait(5)
+            flush_threads.append(threading.get_ident())
+
+        client.pipeline.return_value.execute.side_effect = execute
+        registry = MetricsRegistry(flush_interval=0, client=client)
+
+        # Returns while the flush is still blocked in Redis
+        registry.inc('jobs_status_transitions_total', status='completed')
+        self.assertEqual(flush_threads, [])
+        release.set()
+        for _ in range(100):
+            if flush_threads:
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(len(flush_threads), 1)
+        self.assertNotEqual(flush_threads[0], threading.get_ident())
+
+    def test_failed_background_flush_is_logged(self):
+        """Test that an error raised by a flush in the executor is logged."""
+        future = asyncio.Future(loop=asyncio.new_event_loop())
+        future.set_exception(ValueError('Bad series'))
+
+        with self.assertLogs('jobs.metrics', level='ERROR'):
+            log_flush_error(future)
+        future.get_loop().close()
+
+    def test_render_exposition_format(self):
+        """Test that the aggregated series render with HELP, TYPE and ordered buckets."""
+        client = MagicMock()
+        client.hgetall.return_value = {
+            b'jobs_queue_wait_seconds_bucket{le="10"}': b'2',
+            b'jobs_queue_wait_seconds_bucket{le="+Inf"}': b'3',
+            b'jobs_queue_wait_seconds_bucket{le="5"}': b'1',
+            b'llm_tokens_total{model="gpt-4o",kind="input"}': b'120',
+        }
+        body = MetricsRegistry(client=client).render()
+
+        self.assertIn('# TYPE jobs_queue_wait_seconds histogram', body)
+        self.assertIn('llm_tokens_total{model="gpt-4o",kind="input"} 120', body)
+        buckets = [line for line in body.splitlines() if line.startswith('jobs_queue_wait_seconds_bucket')]
+        self.assertEqual([line.split()[-1] for line in buckets], ['1', '2', '3'])
+        client.hgetall.assert_called_once_with(METRICS_KEY)
+
+    @patch('jobs.models.inc')
+    def test_status_transitions_are_counted(self, mock_inc):
+        """Test that only transitions that happen are counted."""
+        job = Job.objects.create()
+        job.set_status(JobStatus.PROCESSING.value)
+        job.set_status(JobStatus.PROCESSING.value)
+
+        mock_inc.assert_called_once_with('jobs_status_transitions_total', status=JobStatus.PROCESSING.value)
+
+    @patch('jobs.views.get_metrics')
+    def test_metrics_endpoint(self, mock_get_metrics):
+        """Test that /metrics serves the text format and reports Redis outages."""
+        mock_get_metrics.return_value.render.return_value = '# HELP x y\n'
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        mock_get_metrics.return_value.render.side_effect = redis.ConnectionError('down')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 503)
+
+    @patch('jobs.metrics.observe')
+    async def test_middleware_stays_async(self, mock_observe):
+        """Test that the middleware awaits an async handler instead of needing a thread."""
+        async def handler(request):
+            return HttpResponse(status=201)
+
+        middleware = MetricsMiddleware(handler)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(AsyncRequestFactory().post('/'))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mock_observe.call_args.kwargs, {'view': 'unmatched', 'method': 'POST', 'status': 201})
+
+
+class JobArchiveTest(APITestCase):
+    """Test cases for moving old finished jobs to the partitioned archive table."""
+
+    def create_job(self, days_old, **fields):
+        return Job.objects.create(created_at=timezone.now() - timedelta(days=days_old), **fields)
+
+    def test_archive_moves_old_finished_jobs(self):
+        """Test that only finished jobs past the retention period leave the jobs table."""
+        old_completed = self.create_job(40, status=JobStatus.COMPLETED.value, summary='Test summary', diagram='graph TD')
+        old_failed = self.create_job(90, status=JobStatus.FAILED.value, error_message='Test error')
+        old_pending = self.create_job(40)
+        recent = self.create_job(1, status=JobStatus.COMPLETED.value)
+
+        self.assertEqual(archive_jobs(older_than_days=30, batch_size=1), 2)
+
+        self.assertEqual(set(Job.objects.values_list('event_id', flat=True)), {old_pending.event_id, recent.event_id})
+        archived = JobArchive.objects.get(event_id=old_completed.event_id)
+        self.assertEqual(archived.results()['summary'], 'Test summary')
+        self.assertTrue(JobArchive.objects.filter(event_id=old_failed.event_id).exists())
+        self.assertGreaterEqual(len(archive_partitions()), 1)
+
+    def test_archived_job_status_is_served(self):
+        """Test that the status endpoint falls back to the archive."""
+        job = self.create_job(40, status=JobStatus.COMPLETED.value, summary='Test summary', checklist='- item')
+        archive_jobs(older_than_days=30)
+
+        response = self.client.get(reverse('get_job_status', kwargs={'event_id': job.event_id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], JobStatus.COMPLETED.value)
+        self.assertEqual(response.data['result']['checklist'], '- item')
+
+    def test_expired_partitions_are_dropped(self):
+        """Test that archive months past the retention are dropped whole."""
+        self.create_job(400, status=JobStatus.COMPLETED.value)
+        self.create_job(40, status=JobStatus.COMPLETED.value)
+        archive_jobs(older_than_days=30)
+
+        dropped = drop_expired_partitions(retention_months=6)
+
+        self.assertEqual(len(dropped), 1)
+        self.assertEqual(JobArchive.objects.count(), 1)
+        self.assertEqual(drop_expired_partitions(retention_months=0), [])
+
+
+    @override_settings(JOB_RETENTION_DAYS=0)
+    def test_archive_command_is_disabled_by_zero_retention(self):
+        """Test that JOB_RETENTION_DAYS=0 disables the command unless a cutoff is passed explicitly."""
+        job = self.create_job(0, status=JobStatus.COMPLETED.value)
+        out = StringIO()
+
+        call_command('archive_jobs', stdout=out)
+        self.assertIn("Archiving disabled", out.getvalue())
+        self.assertTrue(Job.objects.filter(event_id=job.event_id).exists())
+
+        call_command('archive_jobs', older_than_days=0, stdout=StringIO())
+        self.assertFalse(Job.objects.filter(event_id=job.event_id).exists())
+
+
+class OutputCompressionTest(APITestCase):
+    """Test cases for compressed storage of GPT outputs and compressed responses."""
+
+    output = '\n'.join(f'- [ ] Review deployment step {i} for accessibility and performance' for i in range(50))
+
+    def test_outputs_are_stored_compressed(self):
+        """Test that result columns are compressed in the database and decoded on read."""
+        job = Job.objects.create(status=JobStatus.COMPLETED.value, checklist=self.output, summary='Short')
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT checklist FROM jobs WHERE event_id = %s', [job.event_id])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertLess(len(stored) * 4, len(self.output))
+
+        job = Job.objects.get(event_id=job.event_id)
+        self.assertEqual(job.result['checklist'], self.output)
+        self.assertEqual(job.result['summary'], 'Short')
+
+    def test_uncompressed_rows_are_still_readable(self):
+        """Test that text written before compression decodes unchanged."""
+        self.assertEqual(decompress_text('Plain text'.encode('utf-8')), 'Plain text')
+
+    def test_trained_dictionary_round_trip(self):
+        """Test that a trained dictionary shrinks short outputs further and decodes them."""
+        template = '## Release {}\n- Validate accessibility of every release\n- Monitor performance after each deploy\n'
+        dictionary = train_dictionary([template.format(i) for i in range(10)])
+        text = template.format(99)
+        with patch('jobs.compression.load_dictionary', return_value=dictionary):
+            trained = compress_text(text, dictionary_id=1)
+            self.assertEqual(decompress_text(trained), text)
+        self.assertLess(len(trained) * 2, len(compress_text(text, dictionary_id=0)))
+
+    def test_trained_dictionary_is_stored_in_database(self):
+        """Test that train_output_dictionary stores a dictionary any host can decode with."""
+        self.addCleanup(load_dictionary.cache_clear)
+        for i in range(3):
+            Job.objects.create(status=JobStatus.COMPLETED.value, summary=f'Summary {i}', checklist=self.output)
+
+        call_command('train_output_dictionary', stdout=StringIO())
+
+        dictionary = OutputDictionary.objects.get()
+        self.assertEqual(dictionary.id, 1)
+        self.assertEqual(decompress_text(compress_text(self.output, dictionary_id=1)), self.output)
+
+    @override_settings(LLM_OUTPUT_DICTIONARY=7)
+    def test_missing_dictionary_fails_loudly(self):
+        """Test that a configured dictionary that does not exist fails the system check and writes."""
+        self.addCleanup(load_dictionary.cache_clear)
+
+        errors = check_output_dictionary(None, databases=['default'])
+        self.assertEqual([error.id for error in errors], ['jobs.E001'])
+        with self.assertRaises(MissingDictionary):
+            compress_text(self.output)
+
+    def test_status_response_is_gzipped(self):
+        """Test that GET /jobs/{id}/ is compressed when the client accepts gzip."""
+        job = Job.objects.create(status=JobStatus.COMPLETED.value, summary='Test summary', checklist=self.output)
+        url = reverse('get_job_status', kwargs={'event_id': job.event_id})
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertNotIn('Content-Encoding', self.client.get(url))
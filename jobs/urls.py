@@ -1,8 +1,20 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Under an ASGI server the hot endpoints are served by their async versions
+if settings.JOB_API_ASYNC_VIEWS:
+    create_job, get_job_status, job_events = views.acreate_job, views.aget_job_status, views.ajob_events
+else:
+    create_job, get_job_status, job_events = views.create_job, views.get_job_status, views.job_events
+
 urlpatterns = [
-    path('jobs/', views.create_job, name='create_job'),
-    path('jobs/<uuid:event_id>/', views.get_job_status, name='get_job_status'),
+    path('jobs/', create_job, name='create_job'),
+    path('jobs/batch/', views.create_jobs_batch, name='create_jobs_batch'),
+    path('jobs/status/', views.get_jobs_status, name='get_jobs_status'),
+    path('jobs/<uuid:event_id>/', get_job_status, name='get_job_status'),
+    path('jobs/<uuid:event_id>/events/', job_events, name='job_events'),
+    path('jobs/<uuid:event_id>/output/', views.get_job_output, name='get_job_output'),
     path('queue/', views.queue_status, name='queue_status'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -3,25 +3,51 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404, render
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.middleware.gzip import GZipMiddleware
 from django.test import override_settings
-from .models import Job, JobStatus
-from .serializers import JobCreateSerializer, JobDetailSerializer
-from .tasks import process_guideline_ingest
+from django.views.decorators.gzip import gzip_page
+from asgiref.sync import sync_to_async
+from .cache import get_stage_cache, get_status_cache
+from .dedup import save_unless_duplicate
+from .events import ajob_event_subscription, await_job_event, job_event_subscription, wait_for_job_event
+from .lanes import empty_lane_stats
+from .metrics import CONTENT_TYPE, get_metrics
+from .models import Job, JobArchive, JobStatus
+from .monitoring import broker_health, worker_status
+from .pagination import JobCursorPagination
+from .serializers import (
+    JobBatchCreateSerializer, JobCreateSerializer, JobDetailSerializer, JobListQuerySerializer, JobListSerializer,
+    JobStatusLookupSerializer,
+)
+from .streaming import STAGES, read_job_output
+from .tasks import enqueue_jobs, pipeline_chain, process_guideline_ingest, process_guideline_ingest_async
 import redis
+import asyncio
 import json
+import time
 
 
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 def create_job(request):
 
-    serializer = JobCreateSerializer(data={})
+    if request.method == 'GET':
+        return list_jobs(request)
+
+    serializer = JobCreateSerializer(data=request.data)
     if serializer.is_valid():
-        job = serializer.save()
+        event_id, job = save_unless_duplicate(serializer, request.headers.get('Idempotency-Key'))
+        if job is None:
+            # Repeated submission: answer with the existing job and leave the broker alone
+            return Response({
+                'event_id': event_id
+            }, status=status.HTTP_200_OK, headers={'Idempotent-Replayed': 'true'})
 
         # Start the async processing
         try:
-            if not getattr(settings, 'TESTING', False) and not getattr(settings, 'CELERY_ALWAYS_EAGER', False):
-                process_guideline_ingest.delay(str(job.event_id))
+            enqueue_job(job)
         except Exception as e:
             pass
 
@@ -32,53 +58,417 @@ def create_job(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def list_jobs(request):
+    """Jobs newest first, one keyset page at a time.
+
+    Filters on status, priority, tenant and a created_at range. ``fields``
+    picks the returned fields, and the result columns are only read when
+    ``result`` is among them.
+    """
+    query = JobListQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    fields = query.validated_data.get('fields', JobListSerializer.Meta.fields)
+    jobs = query.filter(Job.objects.only(*JobListSerializer.columns(fields)))
+    paginator = JobCursorPagination(query.validated_data.get('limit', settings.JOB_LIST_PAGE_SIZE))
+    page = paginator.paginate_queryset(jobs, request)
+    return paginator.get_paginated_response(JobListSerializer(page, many=True, fields=fields).data)
+
+
+def enqueue_job(job):
+    """Publish a new job to the configured scheduler and pipeline executor"""
+    if getattr(settings, 'TESTING', False) or getattr(settings, 'CELERY_ALWAYS_EAGER', False):
+        return
+    if settings.JOB_SCHEDULER == 'fair':
+        enqueue_jobs([job])
+    elif settings.PIPELINE_EXECUTOR == 'async':
+        process_guideline_ingest_async.delay(str(job.event_id))
+    elif settings.PIPELINE_EXECUTOR == 'chain':
+        pipeline_chain(job.event_id).apply_async()
+    else:
+        process_guideline_ingest.delay(str(job.event_id))
+
+
+def request_data(request):
+    """Body of a plain Django request parsed like DRF does for JSON and form posts"""
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+
+async def acreate_job(request):
+    """create_job for ASGI servers, the insert runs on Django's async ORM.
+
+    Served instead of create_job when JOB_API_ASYNC_VIEWS is set, see
+    jobapi/asgi.py. Deduplication needs a transaction, which the async ORM
+    does not support, so submissions with an Idempotency-Key or
+    JOB_DEDUP_INPUTS go through save_unless_duplicate in a thread.
+    """
+    if request.method == 'GET':
+        # Listing is rare next to creation and status reads, it stays on the DRF view
+        return await sync_to_async(create_job)(request)
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['GET', 'POST'])
+    try:
+        data = request_data(request)
+    except ValueError as e:
+        return JsonResponse({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = JobCreateSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    key = request.headers.get('Idempotency-Key')
+    if key or settings.JOB_DEDUP_INPUTS:
+        event_id, job = await sync_to_async(save_unless_duplicate)(serializer, key)
+        if job is None:
+            return JsonResponse({
+                'event_id': event_id
+            }, status=status.HTTP_200_OK, headers={'Idempotent-Replayed': 'true'})
+    else:
+        job = await Job.objects.acreate(**serializer.validated_data)
+
+    # Publishing is blocking broker I/O, keep it off the event loop and the ORM's thread
+    try:
+        await sync_to_async(enqueue_job, thread_sensitive=False)(job)
+    except Exception as e:
+        pass
+
+    return JsonResponse({
+        'event_id': job.event_id
+    }, status=status.HTTP_201_CREATED)
+
+
+# Django 4.2's view decorators only wrap sync views, so mark the async ones directly
+acreate_job.csrf_exempt = True
+
+
+@api_view(['POST'])
+def create_jobs_batch(request):
+
+    serializer = JobBatchCreateSerializer(data=request.data)
+    if serializer.is_valid():
+        jobs = Job.objects.bulk_create([Job(**spec) for spec in serializer.validated_data['jobs']])
+
+        # Publish every task in one group instead of one delay() per job
+        try:
+            if not getattr(settings, 'TESTING', False) and not getattr(settings, 'CELERY_ALWAYS_EAGER', False):
+                enqueue_jobs(jobs)
+        except Exception as e:
+            pass
+
+        return Response({
+            'event_ids': [job.event_id for job in jobs]
+        }, status=status.HTTP_201_CREATED)
+
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@gzip_page
 @api_view(['GET'])
 def get_job_status(request, event_id):
 
     try:
-        job = get_object_or_404(Job, event_id=event_id)
-        serializer = JobDetailSerializer(job)
-        return Response(serializer.data)
+        wait = min(float(request.query_params.get('wait', 0)), settings.JOB_LONG_POLL_MAX_WAIT)
+    except ValueError:
+        return Response({
+            'error': 'wait must be a number of seconds'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        if wait > 0:
+            return Response(JobDetailSerializer(wait_for_job_change(event_id, wait)).data)
+        return Response(get_job_status_data(event_id))
     except Exception as e:
         return Response({
             'error': 'Job not found'
         }, status=status.HTTP_404_NOT_FOUND)
 
 
-def queue_status(request):
+# Fields returned by the bulk status lookup unless others are asked for
+STATUS_FIELDS = ['event_id', 'status', 'created_at', 'updated_at']
+
+
+@api_view(['POST'])
+def get_jobs_status(request):
+    """Status of many jobs in one request, with one query for those not in the status cache"""
+    serializer = JobStatusLookupSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    event_ids = serializer.validated_data['event_ids']
+    fields = serializer.validated_data.get('fields', STATUS_FIELDS)
+    found = get_jobs_status_data(event_ids, with_result='result' in fields)
+    return Response({
+        'jobs': [{name: found[event_id][name] for name in fields} for event_id in event_ids if event_id in found],
+        'not_found': [event_id for event_id in event_ids if event_id not in found],
+    })
+
+
+def get_jobs_status_data(event_ids, with_result=False):
+    """Serialized status of many jobs keyed by event_id, leaving out unknown ones.
+
+    Entries come from the status cache in one round trip, and the misses from
+    one ``event_id IN (...)`` query, then the archive. Without ``with_result``
+    the query skips the result columns, so only unfinished jobs, whose result
+    is empty, can be written back to the cache as complete entries.
+    """
+    cache = get_status_cache()
+    found = {event_id: data for event_id, data in zip(event_ids, cache.get_many(event_ids)) if data is not None}
+    missing = [event_id for event_id in event_ids if event_id not in found]
+    if not missing:
+        return found
+
+    fields = JobDetailSerializer.Meta.fields if with_result else STATUS_FIELDS
+    jobs = list(Job.objects.only(*JobListSerializer.columns(fields)).filter(event_id__in=missing))
+    loaded = {str(job.event_id) for job in jobs}
+    archived = [event_id for event_id in missing if event_id not in loaded]
+    if archived:
+        jobs += [job.to_job() for job in JobArchive.objects.filter(event_id__in=archived)]
+
+    finished, unfinished = {}, {}
+    for job, data in zip(jobs, JobListSerializer(jobs, many=True, fields=fields).data):
+        event_id = str(job.event_id)
+        found[event_id] = data
+        if not job.is_finished():
+            unfinished[event_id] = {**data, 'result': None}
+        elif with_result:
+            finished[event_id] = data
+    cache.set_many(finished, ttl=0)
+    cache.set_many(unfinished)
+    return found
 
+
+def get_job_for_status(event_id):
+    # Result columns are only loaded by the serializer once the job has finished
     try:
-        r = redis.Redis.from_url('redis://redis:6379/0')
+        return Job.objects.without_results().get(event_id=event_id)
+    except Job.DoesNotExist:
+        pass
+    archived = JobArchive.objects.filter(event_id=event_id).first()
+    if archived is None:
+        raise Http404("Job not found")
+    return archived.to_job()
+
 
-        queue_length = r.llen('celery')
+async def aget_job_for_status(event_id):
+    """Async counterpart of get_job_for_status, with the result columns already loaded"""
+    try:
+        job = await Job.objects.without_results().aget(event_id=event_id)
+    except Job.DoesNotExist:
+        archived = await JobArchive.objects.filter(event_id=event_id).afirst()
+        if archived is None:
+            raise Http404("Job not found")
+        return archived.to_job()
+    await job.aload_result()
+    return job
 
-        recent_jobs = Job.objects.all().order_by('-created_at')[:20]
 
-        # Test Redis connection
-        redis_connected = r.ping()
+def get_job_status_data(event_id):
+    """Serialized job status, read through the status cache.
+
+    Finished jobs never change again and stay cached until evicted, while
+    pending and processing jobs are cached for JOB_STATUS_CACHE_TTL seconds.
+    Job.set_status invalidates the entry on every transition.
+    """
+    cache = get_status_cache()
+    data = cache.get(str(event_id))
+    if data is None:
+        job = get_job_for_status(event_id)
+        data = JobDetailSerializer(job).data
+        cache.set(str(event_id), data, ttl=0 if job.is_finished() else None)
+    return data
+
+
+def wait_for_job_change(event_id, timeout):
+    """Long-poll: return the job once its status changes, or after timeout seconds"""
+    # Subscribe before reading so a transition between the read and the wait is not missed
+    with job_event_subscription(event_id) as events:
+        job = get_job_for_status(event_id)
+        if not job.is_finished() and wait_for_job_event(events, timeout) is not None:
+            job = get_job_for_status(event_id)
+    return job
+
+
+gzip_middleware = GZipMiddleware(lambda request: None)
+
+
+async def aget_job_status(request, event_id):
+    """get_job_status for ASGI servers.
+
+    Reads use the async ORM, and a long-poll waits on an asyncio queue fed by
+    the job event listener, so a waiting client holds no thread.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        wait = min(float(request.GET.get('wait', 0)), settings.JOB_LONG_POLL_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({
+            'error': 'wait must be a number of seconds'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        if wait > 0:
+            data = JobDetailSerializer(await await_job_change(event_id, wait)).data
+        else:
+            data = await aget_job_status_data(event_id)
+    except Http404:
+        return JsonResponse({
+            'error': 'Job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return gzip_middleware.process_response(request, JsonResponse(data))
+
+
+async def aget_job_status_data(event_id):
+    """Async counterpart of get_job_status_data, sharing the same status cache"""
+    cache = get_status_cache()
+    data = await asyncio.to_thread(cache.get, str(event_id))
+    if data is None:
+        job = await aget_job_for_status(event_id)
+        data = JobDetailSerializer(job).data
+        await asyncio.to_thread(cache.set, str(event_id), data, ttl=0 if job.is_finished() else None)
+    return data
+
+
+async def await_job_change(event_id, timeout):
+    """Async counterpart of wait_for_job_change"""
+    async with ajob_event_subscription(event_id) as events:
+        job = await aget_job_for_status(event_id)
+        if job.is_finished():
+            return job
+        await arelease_connection()
+        if await await_job_event(events, timeout) is not None:
+            job = await aget_job_for_status(event_id)
+    return job
+
+
+def release_connection():
+    """Close this thread's database connection unless a transaction is open on it"""
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+async def arelease_connection():
+    """Give back the request's Postgres connection before a long wait.
+
+    Under ASGI each request's async ORM calls run on a thread of their own,
+    whose connection is otherwise only closed when the request finishes, so
+    every waiting client would hold a backend. The next read reconnects.
+    """
+    await sync_to_async(release_connection)()
 
-        # Test Celery worker status by checking if any workers are registered
-        try:
-            from jobapi.celery import app
-            inspect = app.control.inspect()
-            active_workers = inspect.active()
-            registered_workers = inspect.registered()
-            worker_count = len(registered_workers) if registered_workers else 0
-            celery_connected = worker_count > 0
-        except Exception as celery_error:
-            celery_connected = False
-            worker_count = 0
+
+@gzip_page
+@api_view(['GET'])
+def get_job_output(request, event_id):
+    """Output of each GPT stage as it streams, read from Redis until the result is stored"""
+    job = get_object_or_404(Job.objects.only('event_id', 'status', *STAGES), event_id=event_id)
+    if job.is_completed():
+        output = {stage: getattr(job, stage) for stage in STAGES}
+    else:
+        output = read_job_output(event_id)
+    return Response({
+        'event_id': job.event_id,
+        'status': job.status,
+        'output': output,
+    })
+
+
+def job_events(request, event_id):
+    """Server-Sent Events stream with one event per status change until the job finishes"""
+    if not Job.objects.filter(event_id=event_id).exists():
+        return JsonResponse({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(stream_job_events(event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def stream_job_events(event_id):
+    deadline = time.monotonic() + settings.JOB_EVENTS_STREAM_TIMEOUT
+    with job_event_subscription(event_id) as events:
+        job = get_job_for_status(event_id)
+        yield format_job_event(job)
+        while not job.is_finished():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            message = wait_for_job_event(events, min(settings.JOB_EVENTS_KEEPALIVE, remaining))
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+            job = get_job_for_status(event_id)
+            yield format_job_event(job)
+
+
+async def ajob_events(request, event_id):
+    """job_events for ASGI servers, streamed from an async generator so no thread is held per stream"""
+    if not await Job.objects.filter(event_id=event_id).aexists():
+        return JsonResponse({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(astream_job_events(event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def astream_job_events(event_id):
+    deadline = time.monotonic() + settings.JOB_EVENTS_STREAM_TIMEOUT
+    async with ajob_event_subscription(event_id) as events:
+        job = await aget_job_for_status(event_id)
+        yield format_job_event(job)
+        while not job.is_finished():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await arelease_connection()
+            message = await await_job_event(events, min(settings.JOB_EVENTS_KEEPALIVE, remaining))
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+            job = await aget_job_for_status(event_id)
+            yield format_job_event(job)
+
+
+def format_job_event(job):
+    data = json.dumps(JobDetailSerializer(job).data, cls=DjangoJSONEncoder)
+    return f'event: status\ndata: {data}\n\n'
+
+
+def queue_status(request):
+
+    job_counts = Job.objects.status_counts()
+    recent_jobs = Job.objects.all().order_by('-created_at')[:20]
+    count_stats = {
+        'total_jobs': job_counts['total'],
+        'pending_jobs': job_counts[JobStatus.PENDING.value],
+        'processing_jobs': job_counts[JobStatus.PROCESSING.value],
+        'completed_jobs': job_counts[JobStatus.COMPLETED.value],
+        'failed_jobs': job_counts[JobStatus.FAILED.value],
+        'status_cache_hit_ratio': round(get_status_cache().stats()['hit_ratio'] * 100, 1),
+        'stage_cache_hit_ratio': round(get_stage_cache().stats()['hit_ratio'] * 100, 1),
+    }
+
+    try:
+        # Broker health is cached for REDIS_HEALTH_CACHE_TTL seconds on the shared connection pool
+        health = broker_health.get()
+        redis_connected = health['redis_connected']
+
+        # Worker inspection is cached and refreshed in the background
+        workers = worker_status.get()
+        celery_connected = workers['celery_connected']
 
         queue_stats = {
-            'queue_length': queue_length,
+            'queue_length': health['queue_length'],
+            'stage_queue_lengths': health['stage_queue_lengths'],
+            'lanes': health['lanes'],
             'redis_connected': redis_connected,
             'celery_connected': celery_connected,
-            'worker_count': worker_count,
-            'total_jobs': Job.objects.count(),
-            'pending_jobs': Job.objects.filter(status=JobStatus.PENDING.value).count(),
-            'processing_jobs': Job.objects.filter(status=JobStatus.PROCESSING.value).count(),
-            'completed_jobs': Job.objects.filter(status=JobStatus.COMPLETED.value).count(),
-            'failed_jobs': Job.objects.filter(status=JobStatus.FAILED.value).count(),
+            'worker_count': workers['worker_count'],
+            **count_stats,
         }
 
         context = {
@@ -95,17 +485,23 @@ def queue_status(request):
             'error': str(e),
             'queue_stats': {
                 'queue_length': 0,
+                'lanes': empty_lane_stats(),
                 'redis_connected': False,
                 'celery_connected': False,
                 'worker_count': 0,
-                'total_jobs': Job.objects.count(),
-                'pending_jobs': Job.objects.filter(status=JobStatus.PENDING.value).count(),
-                'processing_jobs': Job.objects.filter(status=JobStatus.PROCESSING.value).count(),
-                'completed_jobs': Job.objects.filter(status=JobStatus.COMPLETED.value).count(),
-                'failed_jobs': Job.objects.filter(status=JobStatus.FAILED.value).count(),
+                **count_stats,
             },
-            'recent_jobs': Job.objects.all().order_by('-created_at')[:20],
+            'recent_jobs': recent_jobs,
             'redis_connected': False,
             'celery_connected': False,
         }
         return render(request, 'jobs/queue_status.html', context)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint with the metrics of every web and worker process"""
+    try:
+        body = get_metrics().render()
+    except redis.RedisError as e:
+        return HttpResponse(f'# metrics unavailable: {e}\n', content_type=CONTENT_TYPE, status=503)
+    return HttpResponse(body, content_type=CONTENT_TYPE)